@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from gemini_client import client_stats
+from json_repair import repair_stats
+from llm_cache import get_default_cache
+from rate_limiter import RateLimitExceeded
+from usage import process_usage
+
+load_dotenv()
+
+MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", str(1024 * 1024)))
+LATENCY_WINDOW = 1000
+NDJSON = "application/x-ndjson"
+
+# path -> (task, required body fields)
+ROUTES = {
+    "/ner": ("ner", ("transcript",)),
+    "/sentiment-intent/statement": ("sentiment_statement", ("statement",)),
+    "/sentiment-intent/conversation": ("sentiment_conversation", ("transcript",)),
+    "/soap": ("soap", ("transcript",)),
+    "/visit": ("visit", ("transcript",))
+}
+
+# Tasks with a partial-result stream; the other tasks answer in one piece
+STREAMS = {
+    "ner": lambda pipeline, body: pipeline.summarizer.create_assignment_format_stream(body["transcript"]),
+    "soap": lambda pipeline, body: _soap_stream(pipeline, body)
+}
+
+
+def _soap_stream(pipeline, body):
+    # A generator, so the entity extraction also runs on the stream's worker thread
+    if body.get("from_entities"):
+        entities = pipeline.summarizer.extractor.extract_entities(body["transcript"])
+        yield from pipeline.soap_generator.generate_soap_note_from_entities_stream(entities, body["transcript"])
+    else:
+        yield from pipeline.soap_generator.generate_soap_note_stream(body["transcript"])
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SingleFlight:
+    # Identical requests that arrive while one is already running wait for
+    # that run instead of starting their own
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._calls.pop(key) if self._calls.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        # A caller that disconnects must not cancel the run others are waiting on
+        return await asyncio.shield(task)
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.in_flight = 0
+        self._routes = {}
+
+    def observe(self, route, status, seconds):
+        entry = self._routes.setdefault(route, {"statuses": {}, "latencies": deque(maxlen=LATENCY_WINDOW)})
+        entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+        entry["latencies"].append(seconds)
+
+    def summary(self):
+        routes = {}
+        for route, entry in self._routes.items():
+            latencies = sorted(entry["latencies"])
+            routes[route] = {
+                "requests": sum(entry["statuses"].values()),
+                "statuses": {str(status): n for status, n in sorted(entry["statuses"].items())},
+                "latency_seconds": {
+                    "mean": round(sum(latencies) / len(latencies), 4),
+                    "p50": round(latencies[len(latencies) // 2], 4),
+                    "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4),
+                    "max": round(latencies[-1], 4)
+                } if latencies else {}
+            }
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "in_flight": self.in_flight,
+            "routes": routes
+        }
+
+
+def request_key(task, body):
+    # The task plus a hash of the request fields that affect its result
+    fields = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return task, hashlib.sha256(fields.encode("utf-8")).hexdigest()
+
+
+class MediScribeService:
+    # A plain ASGI application; serve it with any ASGI server, e.g.
+    # uvicorn api_server:app
+    def __init__(self, pipeline=None):
+        self._pipeline = pipeline
+        self.single_flight = SingleFlight()
+        self.metrics = Metrics()
+
+    @property
+    def pipeline(self):
+        # Built on first use (or at startup), so importing the module is cheap
+        if self._pipeline is None:
+            from visit_pipeline import VisitPipeline
+            self._pipeline = VisitPipeline()
+        return self._pipeline
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._handle(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self.pipeline
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle(self, scope, receive, send):
+        path = scope["path"].rstrip("/") or "/"
+        started = time.perf_counter()
+        status = 500
+        self.metrics.in_flight += 1
+        try:
+            if path == "/health":
+                status = await _send_json(send, 200, self.health())
+            elif path == "/metrics":
+                status = await _send_json(send, 200, self.metrics_summary())
+            elif path not in ROUTES:
+                raise HTTPError(404, f"Unknown path {path}")
+            elif scope["method"] != "POST":
+                raise HTTPError(405, "Use POST")
+            else:
+                task, required = ROUTES[path]
+                body = _validate(await _read_body(receive), required)
+                if task in STREAMS and _wants_stream(scope):
+                    status = await self._stream(send, task, body)
+                else:
+                    result = await self.single_flight.do(request_key(task, body), lambda: self.run(task, body))
+                    if result is None:
+                        raise HTTPError(502, "The model response could not be used")
+                    status = await _send_json(send, 200, result)
+        except HTTPError as e:
+            status = await _send_json(send, e.status, {"error": str(e)})
+        except RateLimitExceeded as e:
+            status = await _send_json(send, 429, {"error": str(e)})
+        except Exception as e:
+            print(f"Error handling {path}: {str(e)}")
+            status = await _send_json(send, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            self.metrics.in_flight -= 1
+            self.metrics.observe(path, status, time.perf_counter() - started)
+
+    async def run(self, task, body):
+        pipeline = self.pipeline
+        if task == "ner":
+            return await pipeline.summarizer.create_assignment_format_async(body["transcript"])
+        if task == "sentiment_statement":
+            return await pipeline.analyzer.create_assignment_format_async("", sample_statement=body["statement"])
+        if task == "sentiment_conversation":
+            return await pipeline.analyzer.create_assignment_format_async(body["transcript"])
+        if task == "soap":
+            if body.get("from_entities"):
+                entities = await pipeline.summarizer.extractor.extract_entities_async(body["transcript"])
+                return await pipeline.soap_generator.generate_soap_note_from_entities_async(entities, body["transcript"])
+            return await pipeline.soap_generator.generate_soap_note_async(body["transcript"])
+        return await pipeline.process_async(body["transcript"])
+
+    async def _stream(self, send, task, body):
+        # The streaming generators block on the network between chunks, so
+        # each chunk is pulled on a worker thread
+        chunks = STREAMS[task](self.pipeline, body)
+        done = object()
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", NDJSON.encode())]
+        })
+        try:
+            while True:
+                snapshot = await asyncio.to_thread(next, chunks, done)
+                if snapshot is done:
+                    break
+                if snapshot is not None:
+                    line = json.dumps(snapshot, ensure_ascii=False, default=str) + "\n"
+                    await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        except Exception as e:
+            # Headers are already out; report the failure as the last line
+            print(f"Error streaming {task}: {str(e)}")
+            line = json.dumps({"error": f"{type(e).__name__}: {e}"}) + "\n"
+            await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+        return 200
+
+    def health(self):
+        return {
+            "status": "ok",
+            "ready": self._pipeline is not None,
+            "backends": sorted({client["backend"] for client in client_stats()}),
+            "uptime_seconds": round(time.time() - self.metrics.started, 1)
+        }
+
+    def metrics_summary(self):
+        return {
+            **self.metrics.summary(),
+            "single_flight": {
+                "coalesced": self.single_flight.coalesced,
+                "in_flight": self.single_flight.in_flight()
+            },
+            "usage": process_usage()["totals"],
+            "cache": get_default_cache().stats(),
+            "json_repair": repair_stats(),
+            "clients": client_stats()
+        }
+
+
+async def _read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+
+    try:
+        return json.loads(b"".join(chunks) or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON")
+
+
+def _validate(body, required):
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    for field in required:
+        if not isinstance(body.get(field), str) or not body[field].strip():
+            raise HTTPError(400, f"'{field}' must be a non-empty string")
+    return body
+
+
+def _wants_stream(scope):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("stream", [""])[0].lower() in ("1", "true", "yes"):
+        return True
+    accept = dict(scope.get("headers") or []).get(b"accept", b"")
+    return NDJSON.encode() in accept
+
+
+async def _send_json(send, status, data):
+    body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+
+app = MediScribeService()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the MediScribe modules over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("Install uvicorn to serve the API (pip install uvicorn), or run api_server:app with any ASGI server")
+        return
+
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from rate_limiter import RateLimitExceeded
+from visit_pipeline import VisitPipeline
+
+TRANSCRIPT_SUFFIXES = (".txt", ".md")
+
+TASKS = {
+    "visit": lambda pipeline, transcript: pipeline.process_async(transcript),
+    "ner": lambda pipeline, transcript: pipeline.summarizer.create_assignment_format_async(transcript),
+    "sentiment_intent": lambda pipeline, transcript: pipeline.analyzer.create_assignment_format_async(transcript),
+    "soap": lambda pipeline, transcript: pipeline.soap_generator.generate_soap_note_async(transcript)
+}
+
+# Statuses that are not retried on resume; rate-limited records are never
+# checkpointed, so they always run again
+FINAL_STATUSES = ("ok",)
+RETRYABLE_STATUSES = ("partial", "error")
+
+
+def iter_transcripts(source, id_field="id", text_field="transcript"):
+    # Yields (id, transcript) lazily from a JSONL file, a directory of
+    # transcript files or a glob pattern
+    if source.endswith(".jsonl"):
+        with open(source) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    print(f"Skipping line {line_number} of {source}: {str(e)}")
+                    continue
+                record_id = record.get(id_field)
+                if record_id is None:
+                    record_id = f"line-{line_number}"
+                yield str(record_id), record.get(text_field) or ""
+        return
+
+    if os.path.isdir(source):
+        paths = (
+            path for path in glob.iglob(os.path.join(source, "**", "*"), recursive=True)
+            if path.endswith(TRANSCRIPT_SUFFIXES)
+        )
+        root = source
+    else:
+        paths = glob.iglob(source, recursive=True)
+        root = None
+
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            yield os.path.relpath(path, root) if root else path, f.read()
+
+
+class Checkpoint:
+    # Append-only "status<TAB>id" lines; the last status recorded for an id wins
+    def __init__(self, path):
+        self.path = path
+        self.statuses = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    status, tab, record_id = line.rstrip("\n").partition("\t")
+                    if tab:
+                        self.statuses[record_id] = status
+        self._file = open(path, "a")
+
+    def is_done(self, record_id, retry_failed=False):
+        status = self.statuses.get(record_id)
+        if status is None:
+            return False
+        return status in FINAL_STATUSES or not retry_failed
+
+    def mark(self, record_id, status):
+        self.statuses[record_id] = status
+        self._file.write(f"{status}\t{record_id}\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts = {"ok": 0, "partial": 0, "error": 0, "rate_limited": 0, "skipped": 0}
+        self.tokens = 0
+        self.busy_seconds = 0.0
+
+    def add(self, status, seconds=0.0, result=None):
+        self.counts[status] += 1
+        self.busy_seconds += seconds
+        usage = ((result or {}).get("metadata") or {}).get("usage") if isinstance(result, dict) else None
+        if usage:
+            self.tokens += usage["totals"]["total_tokens"]
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        processed = sum(v for k, v in self.counts.items() if k != "skipped")
+        failed = self.counts["error"] + self.counts["rate_limited"]
+        return {
+            **self.counts,
+            "processed": processed,
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(processed / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(failed / processed, 4) if processed else 0.0,
+            "mean_record_seconds": round(self.busy_seconds / processed, 3) if processed else 0.0,
+            "total_tokens": self.tokens
+        }
+
+    def format(self):
+        s = self.summary()
+        return (
+            f"[{s['elapsed_seconds']:8.1f}s] {s['processed']} processed ({s['records_per_second']:.2f}/s) | "
+            f"ok {s['ok']}, partial {s['partial']}, errors {s['error']}, rate limited {s['rate_limited']} "
+            f"({s['error_rate']:.1%}) | skipped {s['skipped']} | {s['total_tokens']:,} tokens"
+        )
+
+
+def _status(task, result):
+    if result is None:
+        return "error"
+    if task == "visit" and result["metadata"]["errors"]:
+        return "partial"
+    return "ok"
+
+
+async def run_batch_async(source, output, task="visit", workers=4, checkpoint_path=None, retry_failed=False,
+                          report_every=10.0, limit=None, api_key=None, pipeline=None, id_field="id",
+                          text_field="transcript"):
+    if task not in TASKS:
+        raise ValueError(f"task must be one of {tuple(TASKS)}")
+
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    pipeline = pipeline or VisitPipeline(api_key=api_key)
+    checkpoint = Checkpoint(checkpoint_path or output + ".checkpoint")
+    stats = BatchStats()
+    # A bounded queue keeps only a few transcripts in memory however large the input
+    queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker(out):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record_id, transcript = item
+            started = time.perf_counter()
+            result = error = None
+            try:
+                result = await TASKS[task](pipeline, transcript)
+                status = _status(task, result)
+            except RateLimitExceeded as e:
+                status, error = "rate_limited", str(e)
+            except Exception as e:
+                status, error = "error", f"{type(e).__name__}: {e}"
+            seconds = time.perf_counter() - started
+
+            record = {"id": record_id, "task": task, "status": status, "seconds": round(seconds, 3)}
+            if error is not None:
+                record["error"] = error
+            else:
+                record["result"] = result
+            # The result line lands before the checkpoint, so a crash in between
+            # repeats that record rather than losing it
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            if status != "rate_limited":
+                checkpoint.mark(record_id, status)
+            stats.add(status, seconds, result)
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(report_every)
+            print(stats.format())
+
+    with open(output, "a") as out:
+        pool = [asyncio.ensure_future(worker(out)) for _ in range(workers)]
+        progress = asyncio.ensure_future(reporter()) if report_every else None
+        try:
+            queued = 0
+            # The checkpoint only learns of a record once it finishes, so an
+            # id repeated in the input is caught here instead
+            seen = set()
+            for record_id, transcript in iter_transcripts(source, id_field, text_field):
+                if limit is not None and queued >= limit:
+                    break
+                if record_id in seen or checkpoint.is_done(record_id, retry_failed):
+                    stats.add("skipped")
+                    continue
+                seen.add(record_id)
+                await queue.put((record_id, transcript))
+                queued += 1
+            for _ in pool:
+                await queue.put(None)
+            await asyncio.gather(*pool)
+        finally:
+            for future in pool:
+                future.cancel()
+            if progress is not None:
+                progress.cancel()
+            checkpoint.close()
+
+    print(stats.format())
+    return stats.summary()
+
+
+def run_batch(source, output, **kwargs):
+    return asyncio.run(run_batch_async(source, output, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process many transcripts with the MediScribe pipelines")
+    parser.add_argument("source",
+                        help="Directory of .txt/.md transcripts, a glob pattern, or a .jsonl file")
+    parser.add_argument("--output", default="outputs/batch_results.jsonl")
+    parser.add_argument("--task", choices=list(TASKS), default="visit")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Transcripts processed at once; model calls are still bounded by the client limits")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Completed ids (default: <output>.checkpoint)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Reprocess records that previously failed or came back partial")
+    parser.add_argument("--report-every", type=float, default=10.0,
+                        help="Seconds between progress lines (0 to disable)")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="transcript")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"MEDISCRIBE BATCH ({args.task}, {args.workers} workers)")
+    print("=" * 70)
+
+    summary = run_batch(
+        args.source,
+        args.output,
+        task=args.task,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        retry_failed=args.retry_failed,
+        report_every=args.report_every,
+        limit=args.limit,
+        id_field=args.id_field,
+        text_field=args.text_field
+    )
+
+    print(json.dumps(summary, indent=2))
+    print(f"\nSaved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from emotion_lexicon import LEXICONS, EmotionMatcher
+from gemini_backends import MockBackend
+from gemini_client import GeminiClient
+from json_repair import repair_stats
+from llm_cache import LLMResponseCache
+from medical_summarizer_gemini import GeminiMedicalSummarizer
+from sentiment_intent_analyzer import CompleteSentimentIntentAnalyzer
+from soap_note_generator import SOAPNoteGenerator
+from transcript_parser import is_patient
+
+PHYSICIAN_LINES = [
+    "Good morning. How are you feeling today?",
+    "Can you walk me through what happened?",
+    "Are you still experiencing pain now?",
+    "How has this impacted your daily life? Work, hobbies, anything like that?",
+    "Did you seek medical attention at that time?",
+    "Let's go ahead and do a physical examination to check your mobility.",
+    "Everything looks good. Your neck and back have a full range of movement.",
+    "I'd expect you to make a full recovery within six months.",
+    "Have you noticed any other effects, like anxiety while driving?",
+    "How did things progress after that?",
+]
+
+PATIENT_LINES = [
+    "I'm doing better, but I still have some discomfort now and then.",
+    "Yes, I always do.",
+    "The first four weeks were rough. My neck and back pain were really bad.",
+    "I had to take painkillers regularly and go through ten sessions of physiotherapy.",
+    "It's not constant, but I do get occasional backaches.",
+    "I'm a bit worried about my back pain, but I hope it gets better soon.",
+    "That's a relief!",
+    "Thank you, doctor. I appreciate it.",
+    "So, I don't need to worry about this affecting me in the future?",
+    "I had to take a week off work, but after that, I was back to my usual routine.",
+    "No, nothing like that. I don't feel nervous driving.",
+    "At first, I was just shocked. Then I could feel pain in my neck almost right away.",
+]
+
+STAGE_DIRECTIONS = [
+    "[Physical Examination Conducted]",
+    "[Patient shifts in chair]",
+]
+
+DEFAULT_TURNS = [10, 100, 1000, 5000]
+
+
+def generate_transcript(turns, style="markdown", seed=0):
+    rng = random.Random(seed)
+    lines = []
+
+    for i in range(turns):
+        speaker = "Physician" if i % 2 == 0 else "Patient"
+        text = rng.choice(PHYSICIAN_LINES if speaker == "Physician" else PATIENT_LINES)
+
+        if style == "markdown":
+            lines.append(f"> **{speaker}:** *{text}*")
+            lines.append(">")
+        else:
+            lines.append(f"{speaker}: {text}")
+            lines.append("")
+
+        if rng.random() < 0.02:
+            lines.append(rng.choice(STAGE_DIRECTIONS))
+
+    return "\n".join(lines)
+
+
+def substring_indicators(text, lexicon):
+    # The previous per-keyword substring scan, kept as a baseline for the matcher
+    text_lower = text.lower()
+    return [
+        {"keyword": keyword, "category": category}
+        for category, keywords in lexicon.items()
+        for keyword in keywords
+        if keyword in text_lower
+    ]
+
+
+def measure(name, fn, backend=None):
+    calls_before = backend.stats() if backend else None
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    record = {
+        "stage": name,
+        "wall_seconds": round(elapsed, 6),
+        "peak_memory_bytes": peak
+    }
+
+    if backend:
+        calls_after = backend.stats()
+        record["model_calls"] = calls_after["calls"] - calls_before["calls"]
+        record["prompt_bytes"] = calls_after["prompt_bytes"] - calls_before["prompt_bytes"]
+        record["response_bytes"] = calls_after["response_bytes"] - calls_before["response_bytes"]
+
+    return record, result
+
+
+def run_benchmark(turns, latency=0.0, seed=0, include_pipelines=True):
+    backend = MockBackend("benchmark-mock", latency=latency, seed=seed)
+    client = GeminiClient(
+        "benchmark-mock",
+        api_key="benchmark",
+        backend=backend,
+        cache=LLMResponseCache(enabled=False)
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer = CompleteSentimentIntentAnalyzer(api_key="benchmark", client=client)
+        concurrent_analyzer = CompleteSentimentIntentAnalyzer(
+            api_key="benchmark", client=client, fused=False, execution_mode="concurrent"
+        )
+        summarizer = GeminiMedicalSummarizer(api_key="benchmark", client=client)
+        soap_generator = SOAPNoteGenerator(api_key="benchmark", client=client)
+
+    transcript = generate_transcript(turns, seed=seed)
+    results = []
+
+    record, conversation = measure("parse_conversation", lambda: analyzer.parse_conversation(transcript))
+    record["turns_parsed"] = len(conversation)
+    results.append(record)
+
+    patient_texts = [t["text"] for t in conversation if is_patient(t)]
+    record, _ = measure(
+        "extract_emotional_indicators",
+        lambda: [analyzer.sentiment_analyzer.extract_emotional_indicators(text) for text in patient_texts]
+    )
+    results.append(record)
+
+    # Whole transcript as one corpus, matcher against the substring baseline
+    for lexicon_name, lexicon in LEXICONS.items():
+        matcher = EmotionMatcher(lexicon)
+        record, hits = measure(f"emotion_matcher_{lexicon_name}", lambda: matcher.find(transcript))
+        record["lexicon_terms"] = len(matcher.categories)
+        record["hits"] = len(hits)
+        results.append(record)
+
+        record, hits = measure(f"emotion_substring_{lexicon_name}", lambda: substring_indicators(transcript, lexicon))
+        record["lexicon_terms"] = len(matcher.categories)
+        record["hits"] = len(hits)
+        results.append(record)
+
+    sentiments, intents = analyzer.classifier.analyze_conversation(conversation)
+    record, _ = measure(
+        "aggregation",
+        lambda: (
+            analyzer.sentiment_analyzer.get_overall_sentiment(sentiments),
+            analyzer.intent_detector.get_intent_summary(intents)
+        )
+    )
+    results.append(record)
+
+    if include_pipelines:
+        record, _ = measure(
+            "sentiment_intent_pipeline",
+            lambda: analyzer.create_assignment_format(transcript),
+            backend
+        )
+        results.append(record)
+
+        record, _ = measure(
+            "sentiment_intent_concurrent",
+            lambda: concurrent_analyzer.create_assignment_format(transcript),
+            backend
+        )
+        results.append(record)
+
+        record, _ = measure(
+            "ner_comprehensive_summary",
+            lambda: summarizer.create_comprehensive_summary(transcript),
+            backend
+        )
+        results.append(record)
+
+        record, _ = measure(
+            "soap_note",
+            lambda: soap_generator.generate_soap_note(transcript),
+            backend
+        )
+        results.append(record)
+
+    return {
+        "turns": turns,
+        "transcript_bytes": len(transcript.encode("utf-8")),
+        "patient_statements": len(patient_texts),
+        "stages": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MediScribe pipelines against the mock Gemini backend")
+    parser.add_argument("--turns", type=int, nargs="+", default=DEFAULT_TURNS,
+                        help="Transcript lengths (in turns) to benchmark")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Simulated model latency per call, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-pipelines", action="store_true",
+                        help="Only benchmark the local (non-model) stages")
+    parser.add_argument("--output", default="outputs/benchmark_results.json")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("MEDISCRIBE BENCHMARK (mock backend)")
+    print("=" * 70)
+
+    runs = []
+    for turns in args.turns:
+        run = run_benchmark(turns, latency=args.latency, seed=args.seed,
+                            include_pipelines=not args.skip_pipelines)
+        runs.append(run)
+
+        print(f"\n{turns} turns ({run['patient_statements']} patient statements)")
+        for stage in run["stages"]:
+            line = f"  {stage['stage']:<30} {stage['wall_seconds']:>10.4f}s  peak {stage['peak_memory_bytes'] / 1024:>10.1f} KiB"
+            if "model_calls" in stage:
+                line += f"  calls {stage['model_calls']:>4}  prompt {stage['prompt_bytes']:>10} B"
+            print(line)
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "latency_seconds": args.latency,
+            "runs": runs,
+            "json_repair": repair_stats()
+        }, f, indent=2)
+    print(f"\nSaved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "120"))
+DEFAULT_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+DEFAULT_HEDGE = os.getenv("GEMINI_HEDGE", "").lower() in ("1", "true", "yes")
+# Hedge losers cannot be interrupted; past this many still running, calls stop hedging
+DEFAULT_MAX_ABANDONED = 8
+
+TRANSIENT_ERROR_NAMES = {
+    "DeadlineExceeded",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "GatewayTimeout",
+    "BadGateway",
+    "ServerError",
+    "Aborted",
+}
+
+# Only hedged blocking calls use these threads; everything else runs on the caller's thread
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="gemini-call")
+
+
+class CallDeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_transient_error(error):
+    # The policy's own deadline is final; retrying it would only overrun it
+    if isinstance(error, CallDeadlineExceeded):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERROR_NAMES:
+        return True
+    return getattr(error, "code", None) in (500, 502, 503, 504)
+
+
+class CallPolicy:
+    def __init__(self, deadline_seconds=DEFAULT_DEADLINE_SECONDS, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=0.5, max_delay=8.0, hedge=DEFAULT_HEDGE, hedge_percentile=0.95,
+                 hedge_min_samples=20, hedge_min_delay=0.5, max_abandoned=DEFAULT_MAX_ABANDONED):
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.max_abandoned = max_abandoned
+        self._abandoned = 0
+
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self.metrics = {
+            "calls": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "timeouts": 0,
+            "failures": 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def _abandon(self, future):
+        # A losing or timed-out attempt keeps its worker thread (and rate
+        # limiter slot) until the backend returns
+        with self._lock:
+            self._abandoned += 1
+        future.add_done_callback(self._abandoned_done)
+
+    def _abandoned_done(self, future):
+        with self._lock:
+            self._abandoned -= 1
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        if not self.hedge:
+            return None
+
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))
+        return max(self.hedge_min_delay, ordered[index])
+
+    def backoff(self, attempt):
+        # Full jitter keeps retries from many callers from lining up
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _remaining(self, deadline_at):
+        if deadline_at is None:
+            return None
+        return deadline_at - time.monotonic()
+
+    def run(self, attempt_fn):
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline_seconds if self.deadline_seconds else None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = self._remaining(deadline_at)
+            if remaining is not None and remaining <= 0:
+                self._count("timeouts")
+                raise CallDeadlineExceeded(f"Gemini call exceeded its {self.deadline_seconds}s deadline")
+
+            try:
+                return self._attempt(attempt_fn, remaining)
+            except Exception as e:
+                if not is_transient_error(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+
+                delay = self.backoff(attempt)
+                remaining = self._remaining(deadline_at)
+                time.sleep(delay if remaining is None else max(0.0, min(delay, remaining)))
+
+    def _attempt(self, attempt_fn, timeout):
+        hedge_delay = self.hedge_delay()
+        started = time.monotonic()
+
+        with self._lock:
+            saturated = self._abandoned >= self.max_abandoned
+        if hedge_delay is None or saturated:
+            # A blocking call cannot be interrupted, so without a hedge the
+            # attempt runs on the caller's thread and the deadline is
+            # enforced between attempts
+            result = attempt_fn()
+            self._record_latency(time.monotonic() - started)
+            return result
+
+        primary = _executor.submit(attempt_fn)
+        futures = {primary}
+
+        if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                self._count("hedges")
+                futures.add(_executor.submit(attempt_fn))
+
+        error = None
+        while futures:
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            if remaining is not None and remaining <= 0:
+                break
+
+            done, futures = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    self._record_latency(time.monotonic() - started)
+                    for loser in futures:
+                        self._abandon(loser)
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not futures:
+            raise error
+
+        for future in futures:
+            self._abandon(future)
+        self._count("timeouts")
+        raise CallDeadlineExceeded(f"Gemini call exceeded its {self.deadline_seconds}s deadline")
+
+    def run_stream(self, open_stream):
+        # Streams get the deadline and transient-error retries but no hedging.
+        # Only a failure before the first chunk is retried, and the deadline is
+        # checked as each chunk arrives, since a blocking read cannot be interrupted.
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline_seconds if self.deadline_seconds else None
+
+        for attempt in range(self.max_retries + 1):
+            stream = open_stream()
+            started = False
+            try:
+                for chunk in stream:
+                    remaining = self._remaining(deadline_at)
+                    if remaining is not None and remaining <= 0:
+                        self._count("timeouts")
+                        raise CallDeadlineExceeded(f"Gemini call exceeded its {self.deadline_seconds}s deadline")
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not is_transient_error(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+            finally:
+                stream.close()
+
+            delay = self.backoff(attempt)
+            remaining = self._remaining(deadline_at)
+            if remaining is not None and remaining <= delay:
+                self._count("timeouts")
+                raise CallDeadlineExceeded(f"Gemini call exceeded its {self.deadline_seconds}s deadline")
+            time.sleep(delay)
+
+    async def run_async(self, attempt_factory):
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline_seconds if self.deadline_seconds else None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = self._remaining(deadline_at)
+            if remaining is not None and remaining <= 0:
+                self._count("timeouts")
+                raise CallDeadlineExceeded(f"Gemini call exceeded its {self.deadline_seconds}s deadline")
+
+            try:
+                return await self._attempt_async(attempt_factory, remaining)
+            except Exception as e:
+                if not is_transient_error(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+
+                delay = self.backoff(attempt)
+                remaining = self._remaining(deadline_at)
+                await asyncio.sleep(delay if remaining is None else max(0.0, min(delay, remaining)))
+
+    async def _attempt_async(self, attempt_factory, timeout):
+        hedge_delay = self.hedge_delay()
+        started = time.monotonic()
+
+        primary = asyncio.ensure_future(attempt_factory())
+        tasks = {primary}
+
+        try:
+            if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self._count("hedges")
+                    tasks.add(asyncio.ensure_future(attempt_factory()))
+
+            error = None
+            while tasks:
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    break
+
+                done, tasks = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        self._record_latency(time.monotonic() - started)
+                        return task.result()
+                    error = task.exception()
+
+            if error is not None and not tasks:
+                raise error
+
+            self._count("timeouts")
+            raise CallDeadlineExceeded(f"Gemini call exceeded its {self.deadline_seconds}s deadline")
+
+        finally:
+            # Cancel the losing request (or every request on timeout) and let
+            # it unwind, so its rate limiter slot is back before we return
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["abandoned_running"] = self._abandoned
+            latencies = sorted(self._latencies)
+
+        if latencies:
+            stats["p50_seconds"] = round(latencies[len(latencies) // 2], 3)
+            stats["p95_seconds"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+        return stats
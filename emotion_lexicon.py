@@ -0,0 +1,143 @@
+import json
+import os
+import re
+
+DEFAULT_EMOTION_LEXICON = {
+    'anxious': ['worried', 'anxious', 'nervous', 'scared', 'afraid', 'concerned', 'stressed'],
+    'positive': ['better', 'good', 'great', 'relief', 'happy', 'glad', 'thankful', 'appreciate'],
+    'negative': ['bad', 'worse', 'terrible', 'awful', 'pain', 'hurt', 'difficult', 'struggle'],
+    'neutral': ['okay', 'fine', 'normal', 'alright', 'usual']
+}
+
+# Broader clinical vocabulary, including inflections and multi-word phrases
+EXTENDED_EMOTION_LEXICON = {
+    'anxious': [
+        'worried', 'worry', 'worries', 'worrying', 'anxious', 'anxiety', 'nervous', 'nervy',
+        'scared', 'afraid', 'fear', 'fearful', 'frightened', 'terrified', 'panic', 'panicky',
+        'panicking', 'concerned', 'concern', 'concerns', 'stressed', 'stress', 'stressful',
+        'uneasy', 'apprehensive', 'on edge', 'tense', 'jittery', 'restless', 'dread',
+        'dreading', 'overwhelmed', 'freaked out', 'keeps me up at night', 'what if',
+        'is it serious', 'is it normal', 'will it get worse', 'not sure what to do'
+    ],
+    'positive': [
+        'better', 'good', 'great', 'relief', 'relieved', 'happy', 'glad', 'thankful',
+        'grateful', 'appreciate', 'appreciated', 'improving', 'improved', 'improvement',
+        'encouraging', 'hopeful', 'optimistic', 'reassured', 'reassuring', 'comfortable',
+        'pleased', 'excellent', 'wonderful', 'fantastic', 'back to normal', 'feeling well',
+        'much better', 'getting better', 'on the mend', 'no complaints', 'manageable',
+        'confident', 'calm', 'positive', 'that helps', "that's a relief"
+    ],
+    'negative': [
+        'bad', 'worse', 'worst', 'terrible', 'awful', 'horrible', 'pain', 'painful', 'hurt',
+        'hurts', 'hurting', 'ache', 'aches', 'aching', 'sore', 'difficult', 'struggle',
+        'struggling', 'suffering', 'miserable', 'exhausted', 'tired', 'fatigued', 'drained',
+        'frustrated', 'frustrating', 'annoyed', 'upset', 'angry', 'sad', 'depressed', 'down',
+        'hopeless', 'helpless', 'unbearable', 'excruciating', 'agony', 'rough', 'debilitating',
+        "can't sleep", 'trouble sleeping', 'sleepless', 'getting worse', 'fed up', 'at my wits end',
+        'not coping', 'lonely', 'isolated', 'embarrassed', 'ashamed'
+    ],
+    'neutral': [
+        'okay', 'ok', 'fine', 'normal', 'alright', 'all right', 'usual', 'same', 'stable',
+        'unchanged', 'so-so', 'not bad', 'as usual', 'nothing new', 'about the same'
+    ]
+}
+
+LEXICONS = {
+    "default": DEFAULT_EMOTION_LEXICON,
+    "extended": EXTENDED_EMOTION_LEXICON
+}
+
+
+def _normalize(term):
+    return " ".join(term.lower().split())
+
+
+def _trie_pattern(terms):
+    # Factor shared prefixes so the regex engine walks a trie instead of
+    # retrying every alternative at each position
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        end = "" in node
+        branches = []
+        for char in sorted(k for k in node if k):
+            atom = r"\s+" if char == " " else re.escape(char)
+            branches.append(atom + build(node[char]))
+
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class EmotionMatcher:
+    # Finds every lexicon term in one pass. Terms match whole words only, so
+    # "pain" does not match "painkillers" and "good" does not match "goodbye".
+    # Where terms overlap, the longest wins ("much better" over "better").
+    def __init__(self, lexicon=None):
+        lexicon = lexicon or DEFAULT_EMOTION_LEXICON
+
+        self.categories = {}
+        for category, terms in lexicon.items():
+            for term in terms:
+                # A blank term would make the whole pattern match the empty string
+                if not _normalize(term):
+                    continue
+                categories = self.categories.setdefault(_normalize(term), [])
+                if category not in categories:
+                    categories.append(category)
+
+        # A lexicon without terms matches nothing
+        self.pattern = self._folded_pattern = None
+        if self.categories:
+            pattern = r"(?<!\w)" + _trie_pattern(self.categories) + r"(?!\w)"
+            self.pattern = re.compile(pattern)
+            self._folded_pattern = re.compile(pattern, re.IGNORECASE)
+
+    def find(self, text):
+        if self.pattern is None:
+            return []
+
+        # Matching pre-lowered text is much faster than IGNORECASE; the rare
+        # text whose length changes when lowered keeps its original offsets
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            matches = self.pattern.finditer(lowered)
+        else:
+            matches = self._folded_pattern.finditer(text)
+
+        hits = []
+        for match in matches:
+            keyword = _normalize(match.group(0))
+            for category in self.categories[keyword]:
+                hits.append({
+                    'keyword': keyword,
+                    'category': category,
+                    'start': match.start(),
+                    'end': match.end()
+                })
+        return hits
+
+
+def load_lexicon(source):
+    # A built-in lexicon name, or a JSON file of {"category": ["term", ...]}
+    if isinstance(source, dict):
+        return source
+    if source in LEXICONS:
+        return LEXICONS[source]
+
+    with open(source) as f:
+        return json.load(f)
+
+
+def default_lexicon():
+    return load_lexicon(os.getenv("EMOTION_LEXICON", "default"))
@@ -0,0 +1,489 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from dotenv import load_dotenv
+from llm_cache import make_cache_key
+
+load_dotenv()
+
+DEFAULT_BACKEND = os.getenv("GEMINI_BACKEND", "gemini")
+DEFAULT_RECORD_PATH = os.getenv("GEMINI_RECORD_PATH", "outputs/gemini_recordings.jsonl")
+
+STRUCTURED_OUTPUT_FIELDS = ("response_mime_type", "response_schema")
+
+_transport_lock = threading.Lock()
+_transports = {}
+# Key id passed to the process-global genai.configure() by the fallback path
+_global_key_id = None
+
+
+def api_key_id(api_key):
+    # Registry keys never hold the raw API key
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class UsageMetadata:
+    def __init__(self, prompt_token_count=0, candidates_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class BackendResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _sdk_supports_structured_output(genai):
+    # google-generativeai < 0.5 has no JSON mode; prompts still ask for JSON
+    config_class = getattr(getattr(genai, "types", None), "GenerationConfig", None)
+    config_fields = getattr(config_class, "__dataclass_fields__", None) or getattr(config_class, "__annotations__", {})
+    return all(field in config_fields for field in STRUCTURED_OUTPUT_FIELDS)
+
+
+class GeminiBackend:
+    name = "gemini"
+    rate_limited = True
+
+    def __init__(self, model_name, api_key=None):
+        import google.generativeai as genai
+
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+        self.supports_structured_output = _sdk_supports_structured_output(genai)
+
+        transport = self._get_transport(api_key)
+        if transport is not None:
+            self.model._client = transport
+            self._native_async = False
+        else:
+            self._configure_global(genai, api_key)
+            self._native_async = True
+
+    def _get_transport(self, api_key):
+        # One generative service client (and its channel) per API key, instead
+        # of the process-global genai.configure(). This uses SDK internals
+        # (client._ClientManager and GenerativeModel._client) as found in
+        # google-generativeai 0.8.x; other versions fall back to configure().
+        key_id = api_key_id(api_key)
+
+        with _transport_lock:
+            if key_id not in _transports:
+                try:
+                    from google.generativeai import client as genai_client
+
+                    manager = genai_client._ClientManager()
+                    manager.configure(api_key=api_key)
+                    _transports[key_id] = manager.make_client("generative")
+                except Exception as e:
+                    print(
+                        f"Warning: per-key Gemini transport unavailable ({type(e).__name__}: {e}); "
+                        f"falling back to the process-global genai.configure()"
+                    )
+                    _transports[key_id] = None
+            return _transports[key_id]
+
+    def _configure_global(self, genai, api_key):
+        # The global configuration serves every fallback model in the process,
+        # so a second key would silently redirect the first key's calls
+        global _global_key_id
+        key_id = api_key_id(api_key)
+
+        with _transport_lock:
+            if _global_key_id is not None and _global_key_id != key_id:
+                raise RuntimeError(
+                    "Multiple Gemini API keys need per-key transports, which this google-generativeai "
+                    "version does not support (tested with 0.8.x)"
+                )
+            genai.configure(api_key=api_key)
+            _global_key_id = key_id
+
+    def _sdk_config(self, generation_config):
+        if self.supports_structured_output or not isinstance(generation_config, dict):
+            return generation_config
+        return {k: v for k, v in generation_config.items() if k not in STRUCTURED_OUTPUT_FIELDS}
+
+    def generate(self, prompt, generation_config=None):
+        return self.model.generate_content(prompt, generation_config=self._sdk_config(generation_config))
+
+    async def generate_async(self, prompt, generation_config=None):
+        # A per-key transport is a blocking client, so run it in a worker thread
+        if self._native_async and hasattr(self.model, "generate_content_async"):
+            return await self.model.generate_content_async(
+                prompt,
+                generation_config=self._sdk_config(generation_config)
+            )
+        return await asyncio.to_thread(self.generate, prompt, generation_config)
+
+    def generate_stream(self, prompt, generation_config=None):
+        response = self.model.generate_content(
+            prompt,
+            generation_config=self._sdk_config(generation_config),
+            stream=True
+        )
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks that only carry a finish reason or usage have no parts
+                text = ""
+            yield BackendResponse(text, getattr(chunk, "usage_metadata", None))
+
+
+class MockServiceUnavailable(Exception):
+    code = 503
+
+
+class MockResourceExhausted(Exception):
+    code = 429
+
+
+SENTIMENT_KEYWORDS = [
+    ("Anxious", ["worried", "anxious", "nervous", "scared", "afraid", "worry"]),
+    ("Concerned", ["concern", "pain", "hurt", "discomfort", "still", "?"]),
+    ("Reassured", ["relief", "great", "better", "thank", "appreciate", "good"]),
+]
+
+INTENT_KEYWORDS = [
+    ("expressing gratitude", ["thank", "appreciate"]),
+    ("seeking reassurance", ["worry", "worried", "will i", "future"]),
+    ("asking questions", ["?"]),
+    ("reporting symptoms", ["pain", "ache", "stiff", "discomfort", "hurt"]),
+    ("describing timeline", ["weeks", "months", "september", "first", "after"]),
+    ("describing impact on life", ["work", "sleep", "routine", "daily"]),
+]
+
+
+class MockBackend:
+    name = "mock"
+    rate_limited = False
+
+    def __init__(self, model_name="mock", latency=0.0, latency_jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, responder=None, seed=0, stream_chunk_chars=64):
+        self.model_name = model_name
+        self.model = None
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.responder = responder or self.default_response
+        self.stream_chunk_chars = stream_chunk_chars
+
+        self.calls = 0
+        self.prompt_bytes = 0
+        self.response_bytes = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _plan(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.prompt_bytes += len(prompt.encode("utf-8"))
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            roll = self._random.random()
+
+        if roll < self.throttle_rate:
+            return delay, MockResourceExhausted("429 Resource has been exhausted (mock)")
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, MockServiceUnavailable("503 Service unavailable (mock)")
+        return delay, None
+
+    def _respond(self, prompt):
+        text = self.responder(prompt)
+        with self._lock:
+            self.response_bytes += len(text.encode("utf-8"))
+        return BackendResponse(
+            text,
+            UsageMetadata(len(prompt) // 4, len(text) // 4)
+        )
+
+    def generate(self, prompt, generation_config=None):
+        delay, error = self._plan(prompt)
+        if delay:
+            time.sleep(delay)
+        if error is not None:
+            raise error
+        return self._respond(prompt)
+
+    async def generate_async(self, prompt, generation_config=None):
+        delay, error = self._plan(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self._respond(prompt)
+
+    def generate_stream(self, prompt, generation_config=None):
+        delay, error = self._plan(prompt)
+        if error is not None:
+            if delay:
+                time.sleep(delay)
+            raise error
+
+        response = self._respond(prompt)
+        text = response.text
+        pieces = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)] or [""]
+
+        # Spread the latency over the chunks the way a streamed response arrives
+        for i, piece in enumerate(pieces):
+            if delay:
+                time.sleep(delay / len(pieces))
+            last = i == len(pieces) - 1
+            yield BackendResponse(piece, response.usage_metadata if last else None)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "prompt_bytes": self.prompt_bytes,
+            "response_bytes": self.response_bytes
+        }
+
+    def _classify_sentiment(self, text):
+        text = text.lower()
+        for label, keywords in SENTIMENT_KEYWORDS:
+            if any(k in text for k in keywords):
+                return label
+        return "Neutral"
+
+    def _classify_intent(self, text):
+        text = text.lower()
+        for label, keywords in INTENT_KEYWORDS:
+            if any(k in text for k in keywords):
+                return label
+        return "providing information"
+
+    def _fused_result(self, text):
+        intent = self._classify_intent(text)
+        return {
+            "sentiment": self._classify_sentiment(text),
+            "sentiment_confidence": 0.8,
+            "sentiment_reasoning": "mock",
+            "primary_intent": intent,
+            "intent_confidence": 0.75,
+            "intent_reasoning": "mock",
+            "all_scores": {intent: 0.75}
+        }
+
+    def _entities_result(self):
+        return {
+            "Patient_Name": "Janet Jones",
+            "Symptoms": [
+                {"symptom": "Neck pain", "severity": "moderate", "duration": "four weeks", "body_part": "neck", "status": "improving"},
+                {"symptom": "Back pain", "severity": "moderate", "duration": "four weeks", "body_part": "back", "status": "improving"}
+            ],
+            "Diagnosis": "Whiplash injury",
+            "Treatment": [
+                {"treatment_type": "physiotherapy", "details": "10 sessions", "provider": None},
+                {"treatment_type": "medication", "details": "painkillers", "provider": None}
+            ],
+            "Current_Status": "Occasional backache",
+            "Prognosis": "Full recovery expected within six months",
+            "Accident_Details": {"date": "September 1st", "location": "Cheadle Hulme to Manchester", "mechanism": "Rear-end collision", "immediate_impact": "Neck and back pain"},
+            "Physical_Examination": {"findings": ["Full range of movement"], "mobility": "Full", "tenderness": "None"},
+            "Timeline": [{"event": "Car accident", "timepoint": "September 1st", "significance": "Onset of injury"}]
+        }
+
+    def _confidence_result(self):
+        return {
+            "Patient_Name": {"value": "Janet Jones", "confidence": 0.95, "source": "explicitly stated"},
+            "Symptoms": [{"symptom": "Neck pain", "confidence": 0.9, "evidence": "pain in my neck"}]
+        }
+
+    def _keywords_result(self):
+        return {"keywords": [
+            {"term": "whiplash injury", "category": "diagnosis", "importance": "high", "context": "diagnosis"},
+            {"term": "physiotherapy", "category": "treatment", "importance": "high", "context": "ten sessions"}
+        ]}
+
+    def default_response(self, prompt):
+        statements = re.findall(r'^\d+\. "(.*)"$', prompt, re.MULTILINE)
+        single = re.search(r'^Patient statement: "(.*)"$', prompt, re.MULTILINE)
+        single = single.group(1) if single else ""
+
+        if "classify BOTH" in prompt:
+            if statements:
+                return json.dumps([
+                    dict(self._fused_result(s), index=n) for n, s in enumerate(statements, 1)
+                ])
+            return json.dumps(self._fused_result(single))
+
+        if "Analyze the sentiment of each" in prompt:
+            return json.dumps([
+                {"index": n, "sentiment": self._classify_sentiment(s), "confidence": 0.8, "reasoning": "mock"}
+                for n, s in enumerate(statements, 1)
+            ])
+
+        if "Analyze the sentiment of the following" in prompt:
+            return json.dumps({"sentiment": self._classify_sentiment(single), "confidence": 0.8, "reasoning": "mock"})
+
+        if "conversation intent" in prompt:
+            intent = self._classify_intent(single)
+            return json.dumps({
+                "primary_intent": intent,
+                "confidence": 0.75,
+                "reasoning": "mock",
+                "all_scores": {intent: 0.75}
+            })
+
+        if "SOAP note" in prompt:
+            return json.dumps({
+                "Subjective": {
+                    "Chief_Complaint": "Neck and back pain",
+                    "History_of_Present_Illness": "Whiplash injury after a car accident",
+                    "Past_Medical_History": "",
+                    "Patient_Concerns": "Long-term impact"
+                },
+                "Objective": {
+                    "Physical_Exam": "Full range of motion, no tenderness",
+                    "Observations": "Patient in good condition",
+                    "Vital_Signs": ""
+                },
+                "Assessment": {
+                    "Diagnosis": "Whiplash injury",
+                    "Severity": "Mild, improving",
+                    "Prognosis": "Full recovery expected within six months"
+                },
+                "Plan": {
+                    "Treatment": "Continue physiotherapy as needed",
+                    "Medications": "Analgesics as needed",
+                    "Follow-Up": "Return if symptoms worsen",
+                    "Patient_Education": "Reassurance provided"
+                }
+            })
+
+        if "entities, confidence and keywords sections" in prompt:
+            return json.dumps({
+                "entities": self._entities_result(),
+                "confidence": self._confidence_result(),
+                "keywords": self._keywords_result()["keywords"]
+            })
+
+        if "rate your confidence" in prompt:
+            return json.dumps(self._confidence_result())
+
+        if "medical keywords" in prompt:
+            return json.dumps(self._keywords_result())
+
+        if "Extract structured medical information" in prompt:
+            return json.dumps(self._entities_result())
+
+        return "{}"
+
+
+class RecordReplayBackend:
+    rate_limited = True
+
+    def __init__(self, inner=None, path=DEFAULT_RECORD_PATH, mode="replay", model_name=None):
+        if mode not in ("record", "replay"):
+            raise ValueError("mode must be 'record' or 'replay'")
+        if mode == "record" and inner is None:
+            raise ValueError("record mode needs a backend to record from")
+
+        self.inner = inner
+        self.path = path
+        self.mode = mode
+        self.name = mode
+        self.model_name = model_name or getattr(inner, "model_name", None)
+        self.model = getattr(inner, "model", None)
+        self.rate_limited = mode == "record"
+
+        self._lock = threading.Lock()
+        self._recordings = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    self._recordings[entry["key"]] = entry
+
+    def _replay(self, prompt, generation_config):
+        key = make_cache_key(self.model_name, generation_config, prompt)
+        entry = self._recordings.get(key)
+        if entry is None:
+            raise KeyError(f"No recorded response for prompt {key[:12]} in {self.path}")
+
+        usage = entry.get("usage") or {}
+        return BackendResponse(
+            entry["text"],
+            UsageMetadata(usage.get("prompt_token_count", 0), usage.get("candidates_token_count", 0))
+        )
+
+    def _record(self, prompt, generation_config, response):
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "key": make_cache_key(self.model_name, generation_config, prompt),
+            "model": self.model_name,
+            "text": response.text,
+            "usage": {
+                "prompt_token_count": getattr(usage, "prompt_token_count", 0),
+                "candidates_token_count": getattr(usage, "candidates_token_count", 0)
+            }
+        }
+
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._recordings[entry["key"]] = entry
+        return response
+
+    def generate(self, prompt, generation_config=None):
+        if self.mode == "replay":
+            return self._replay(prompt, generation_config)
+        return self._record(prompt, generation_config, self.inner.generate(prompt, generation_config))
+
+    async def generate_async(self, prompt, generation_config=None):
+        if self.mode == "replay":
+            return self._replay(prompt, generation_config)
+        response = await self.inner.generate_async(prompt, generation_config)
+        return self._record(prompt, generation_config, response)
+
+    def generate_stream(self, prompt, generation_config=None):
+        if self.mode == "replay":
+            yield self._replay(prompt, generation_config)
+            return
+
+        pieces = []
+        usage = None
+        for chunk in self.inner.generate_stream(prompt, generation_config):
+            pieces.append(chunk.text)
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            yield chunk
+        self._record(prompt, generation_config, BackendResponse("".join(pieces), usage))
+
+
+def make_backend(model_name, api_key=None, kind=None):
+    kind = kind or DEFAULT_BACKEND
+
+    if kind == "gemini":
+        return GeminiBackend(model_name, api_key=api_key)
+    if kind == "mock":
+        return MockBackend(
+            model_name,
+            latency=float(os.getenv("GEMINI_MOCK_LATENCY", "0")),
+            latency_jitter=float(os.getenv("GEMINI_MOCK_LATENCY_JITTER", "0")),
+            error_rate=float(os.getenv("GEMINI_MOCK_ERROR_RATE", "0")),
+            throttle_rate=float(os.getenv("GEMINI_MOCK_THROTTLE_RATE", "0"))
+        )
+    if kind == "record":
+        return RecordReplayBackend(GeminiBackend(model_name, api_key=api_key), mode="record")
+    if kind == "replay":
+        return RecordReplayBackend(mode="replay", model_name=model_name)
+
+    raise ValueError(f"Unknown GEMINI_BACKEND '{kind}' (expected gemini, mock, record or replay)")
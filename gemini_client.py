@@ -0,0 +1,391 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from dotenv import load_dotenv
+from llm_cache import config_to_dict, get_default_cache
+from call_policy import CallPolicy
+from gemini_backends import DEFAULT_BACKEND, api_key_id, make_backend
+from rate_limiter import RateLimiter, RateLimitExceeded, estimate_tokens, is_rate_limit_error
+from structured_output import validate_complete, with_response_schema
+from tracing import span, start_span
+from usage import record_usage
+
+load_dotenv()
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+SLOT_POLL_SECONDS = 0.01
+
+_cache_allowed = contextvars.ContextVar("mediscribe_use_cache", default=True)
+
+_registry_lock = threading.Lock()
+_limiters = {}
+_clients = {}
+
+
+def _get_rate_limiter(api_key):
+    # RPM/TPM quotas apply per key, so every client on a key shares one limiter
+    key_id = api_key_id(api_key)
+
+    with _registry_lock:
+        if key_id not in _limiters:
+            _limiters[key_id] = RateLimiter()
+        return _limiters[key_id]
+
+
+@contextmanager
+def response_cache(enabled=True):
+    # Turns the response cache off for model calls made inside the block (e.g.
+    # one Streamlit session) without touching the cache other callers share
+    token = _cache_allowed.set(enabled)
+    try:
+        yield
+    finally:
+        _cache_allowed.reset(token)
+
+
+class _Slots:
+    # One concurrency limit for blocking callers (threads) and coroutines on
+    # any event loop. Coroutines poll rather than block their loop, as
+    # RateLimiter.acquire_async does.
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def _try_take(self):
+        if self.in_use >= self.limit:
+            return False
+        self.in_use += 1
+        return True
+
+    @contextmanager
+    def hold(self):
+        with self._cond:
+            while not self._try_take():
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def hold_async(self):
+        while True:
+            with self._cond:
+                if self._try_take():
+                    break
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+
+
+class GeminiClient:
+    def __init__(self, model_name, api_key=None, generation_config=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, cache=None, rate_limiter=None, call_policy=None, backend=None):
+        if api_key is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+
+        self.model_name = model_name
+        self.backend = backend or make_backend(model_name, api_key=api_key)
+        self.model = self.backend.model
+
+        # Responses from stand-in backends must never be served to real runs
+        if self.backend.name in ("gemini", "record"):
+            self.cache_namespace = model_name
+        else:
+            self.cache_namespace = f"{self.backend.name}/{model_name}"
+
+        self.generation_config = generation_config
+        self.max_concurrency = max_concurrency
+        self.cache = cache if cache is not None else get_default_cache()
+        if rate_limiter is None:
+            if self.backend.rate_limited:
+                rate_limiter = _get_rate_limiter(api_key)
+            else:
+                rate_limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0, max_in_flight=max_concurrency)
+        self.rate_limiter = rate_limiter
+        self.call_policy = call_policy or CallPolicy()
+
+        # Blocking callers (threads) and coroutines share the same limit
+        self._slots = _Slots(max_concurrency)
+
+    def _resolve_config(self, generation_config, response_schema=None):
+        if generation_config is None:
+            generation_config = self.generation_config
+        if response_schema is not None:
+            # JSON mode constrained to the task's schema
+            generation_config = with_response_schema(generation_config, response_schema)
+        return generation_config
+
+    def _model_span(self, prompt, use_cache, operation):
+        return span(
+            "model_call",
+            model=self.model_name,
+            operation=operation,
+            backend=self.backend.name,
+            prompt_bytes=len(prompt.encode("utf-8")),
+            cache="miss" if use_cache else "bypass"
+        )
+
+    def _validator(self, validate, response_schema):
+        # Only responses that parse and validate are cached, so one garbled or
+        # truncated reply cannot be served again for the life of the entry
+        if validate is None and response_schema is not None:
+            return lambda text: validate_complete(text, response_schema)
+        return validate
+
+    def _is_cacheable(self, response_text, validate):
+        if validate is None:
+            return True
+        try:
+            validate(response_text)
+        except Exception:
+            return False
+        return True
+
+    def _cache_lookup(self, config, prompt, validate, call_span, operation):
+        cached = self.cache.get(self.cache_namespace, config, prompt)
+        if cached is None:
+            return None
+        if not self._is_cacheable(cached, validate):
+            # Stored before responses were validated; drop it and ask the model
+            self.cache.delete(self.cache_namespace, config, prompt)
+            call_span.set(cache="invalid")
+            return None
+
+        call_span.set(cache="hit", response_bytes=len(cached.encode("utf-8")))
+        record_usage(self.model_name, operation, cached=True)
+        return cached
+
+    def _cache_store(self, config, prompt, response_text, validate, call_span):
+        if self._is_cacheable(response_text, validate):
+            self.cache.set(self.cache_namespace, config, prompt, response_text)
+        else:
+            call_span.set(cache_stored=False)
+
+    def generate(self, prompt, generation_config=None, use_cache=True, operation=None, response_schema=None, validate=None):
+        config = self._resolve_config(generation_config, response_schema)
+        validate = self._validator(validate, response_schema)
+        use_cache = use_cache and _cache_allowed.get()
+
+        with self._model_span(prompt, use_cache, operation) as call_span:
+            if use_cache:
+                cached = self._cache_lookup(config, prompt, validate, call_span, operation)
+                if cached is not None:
+                    return cached
+
+            with self._slots.hold():
+                response = self._call_model(prompt, config)
+            response_text = response.text
+            input_tokens, output_tokens = record_usage(
+                self.model_name, operation, getattr(response, "usage_metadata", None)
+            )
+            call_span.set(
+                response_bytes=len(response_text.encode("utf-8")),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens
+            )
+
+            if use_cache:
+                self._cache_store(config, prompt, response_text, validate, call_span)
+            return response_text
+
+    async def generate_async(self, prompt, generation_config=None, use_cache=True, operation=None, response_schema=None, validate=None):
+        config = self._resolve_config(generation_config, response_schema)
+        validate = self._validator(validate, response_schema)
+        use_cache = use_cache and _cache_allowed.get()
+
+        with self._model_span(prompt, use_cache, operation) as call_span:
+            if use_cache:
+                cached = self._cache_lookup(config, prompt, validate, call_span, operation)
+                if cached is not None:
+                    return cached
+
+            async with self._slots.hold_async():
+                response = await self._call_model_async(prompt, config)
+            response_text = response.text
+            input_tokens, output_tokens = record_usage(
+                self.model_name, operation, getattr(response, "usage_metadata", None)
+            )
+            call_span.set(
+                response_bytes=len(response_text.encode("utf-8")),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens
+            )
+
+            if use_cache:
+                self._cache_store(config, prompt, response_text, validate, call_span)
+            return response_text
+
+    def generate_stream(self, prompt, generation_config=None, use_cache=True, operation=None, response_schema=None, validate=None):
+        # Yields the response text piece by piece. Cache hits arrive as one piece.
+        config = self._resolve_config(generation_config, response_schema)
+        validate = self._validator(validate, response_schema)
+        use_cache = use_cache and _cache_allowed.get()
+        call_span = start_span(
+            "model_call",
+            model=self.model_name,
+            operation=operation,
+            backend=self.backend.name,
+            prompt_bytes=len(prompt.encode("utf-8")),
+            cache="miss" if use_cache else "bypass",
+            stream=True
+        )
+
+        try:
+            if use_cache:
+                cached = self._cache_lookup(config, prompt, validate, call_span, operation)
+                if cached is not None:
+                    yield cached
+                    return
+
+            pieces = []
+            usage_metadata = None
+            chunks = self.call_policy.run_stream(lambda: self._stream_with_limiter(prompt, config))
+            try:
+                while True:
+                    # A slot is held while the backend produces a chunk, never
+                    # while the caller holds the generator between chunks
+                    with self._slots.hold():
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                    if chunk.text:
+                        if not pieces:
+                            call_span.set(first_chunk_seconds=round(call_span.duration, 4))
+                        pieces.append(chunk.text)
+                        yield chunk.text
+            finally:
+                chunks.close()
+
+            response_text = "".join(pieces)
+            input_tokens, output_tokens = record_usage(self.model_name, operation, usage_metadata)
+            call_span.set(
+                response_bytes=len(response_text.encode("utf-8")),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens
+            )
+
+            if use_cache:
+                self._cache_store(config, prompt, response_text, validate, call_span)
+        except Exception as e:
+            call_span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            call_span.finish()
+
+    def _call_model(self, prompt, config):
+        # Deadline, transient-error retries and hedging wrap each rate-limited attempt
+        return self.call_policy.run(lambda: self._call_with_limiter(prompt, config))
+
+    async def _call_model_async(self, prompt, config):
+        return await self.call_policy.run_async(lambda: self._call_with_limiter_async(prompt, config))
+
+    def _call_with_limiter(self, prompt, config):
+        tokens = estimate_tokens(prompt, config)
+
+        # 429s are queued behind the limiter's backoff instead of surfacing
+        for _ in range(self.rate_limiter.max_throttle_retries + 1):
+            self.rate_limiter.acquire(tokens)
+            throttled = False
+            try:
+                return self.backend.generate(prompt, config)
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                if not throttled:
+                    raise
+            finally:
+                self.rate_limiter.release(throttled=throttled)
+
+        raise RateLimitExceeded(f"Gemini rate limit persisted after {self.rate_limiter.max_throttle_retries} retries")
+
+    async def _call_with_limiter_async(self, prompt, config):
+        tokens = estimate_tokens(prompt, config)
+
+        for _ in range(self.rate_limiter.max_throttle_retries + 1):
+            await self.rate_limiter.acquire_async(tokens)
+            throttled = False
+            try:
+                return await self.backend.generate_async(prompt, config)
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                if not throttled:
+                    raise
+            finally:
+                # Also runs when the call policy cancels a hedge loser or a
+                # timed-out attempt (CancelledError is not an Exception)
+                self.rate_limiter.release(throttled=throttled)
+
+        raise RateLimitExceeded(f"Gemini rate limit persisted after {self.rate_limiter.max_throttle_retries} retries")
+
+    def _stream_with_limiter(self, prompt, config):
+        # Only a 429 before the first chunk can be retried; once text has been
+        # handed to the caller a failure has to surface
+        tokens = estimate_tokens(prompt, config)
+
+        for _ in range(self.rate_limiter.max_throttle_retries + 1):
+            self.rate_limiter.acquire(tokens)
+            started = False
+            throttled = False
+            try:
+                for chunk in self.backend.generate_stream(prompt, config):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                throttled = not started and is_rate_limit_error(e)
+                if not throttled:
+                    raise
+            finally:
+                self.rate_limiter.release(throttled=throttled)
+
+        raise RateLimitExceeded(f"Gemini rate limit persisted after {self.rate_limiter.max_throttle_retries} retries")
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "backend": self.backend.name,
+            "calls": self.call_policy.stats(),
+            "rate_limiter": self.rate_limiter.stats()
+        }
+
+
+def get_client(model_name, api_key=None, generation_config=None, **kwargs):
+    if api_key is None:
+        api_key = os.getenv("GEMINI_API_KEY")
+
+    backend = kwargs.get("backend")
+    key = (
+        api_key_id(api_key),
+        backend.name if backend is not None else DEFAULT_BACKEND,
+        id(backend) if backend is not None else None,
+        model_name,
+        json.dumps(config_to_dict(generation_config), sort_keys=True, default=str)
+    )
+
+    with _registry_lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    client = GeminiClient(model_name, api_key=api_key, generation_config=generation_config, **kwargs)
+
+    with _registry_lock:
+        return _clients.setdefault(key, client)
+
+
+def client_stats():
+    with _registry_lock:
+        clients = list(_clients.values())
+    return [client.stats() for client in clients]
@@ -1,12 +1,16 @@
-import google.generativeai as genai
+import asyncio
 import os
 import json
 from dotenv import load_dotenv
+from gemini_client import get_client
+from rate_limiter import RateLimitExceeded
+from structured_output import SchemaValidationError, number, obj, parse_structured, string
+from transcript_parser import is_patient
 
 load_dotenv()
 
 class GeminiIntentDetector:    
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, client=None):
         print("Loading Gemini intent detector...")
         
         if api_key is None:
@@ -15,9 +19,8 @@ class GeminiIntentDetector:
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found. Please set it as an environment variable or pass it to the constructor.")
         
-        genai.configure(api_key=api_key)
-        
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+        self.client = client or get_client('gemini-2.5-flash-lite', api_key=api_key)
+        self.model = self.client.model
         
         self.intent_categories = [
             "seeking reassurance",
@@ -30,23 +33,17 @@ class GeminiIntentDetector:
             "describing impact on life"
         ]
         
+        self.generation_config = {
+            "temperature": 0.2,
+            "top_p": 0.95,
+            "max_output_tokens": 1024
+        }
+        
         print(f"Gemini intent detector loaded")
         print(f"Intent categories: {len(self.intent_categories)}\n")
     
-    def detect_intent(self, text, categories=None):
-        if not text or len(text.strip()) == 0:
-            return {
-                "text": text,
-                "primary_intent": "unknown",
-                "confidence": 0.0,
-                "all_scores": {}
-            }
-        
-        if categories is None:
-            categories = self.intent_categories
-        
-        # Create prompt for Gemini
-        prompt = f"""You are an expert in analyzing medical conversation intent.
+    def _intent_prompt(self, text, categories):
+        return f"""You are an expert in analyzing medical conversation intent.
 
 Analyze the intent of this patient statement and classify it into ONE of these categories:
 {', '.join(categories)}
@@ -76,29 +73,18 @@ IMPORTANT:
 - Include scores for all categories in all_scores
 - Return ONLY valid JSON
 """
-        
+    
+    def _intent_schema(self, categories):
+        return obj({
+            "primary_intent": string(enum=categories),
+            "confidence": number(),
+            "reasoning": string(),
+            "all_scores": obj({category: number() for category in categories})
+        }, required=["primary_intent", "confidence"])
+    
+    def _parse_intent(self, text, response_text, categories=None):
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.2,
-                    "top_p": 0.95,
-                    "max_output_tokens": 1024
-                }
-            )
-            
-            response_text = response.text.strip()
-            
-            # Clean response
-            if "```json" in response_text:
-                response_text = response_text.replace("```json", "").replace("```", "").strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
-            
-            result = json.loads(response_text)
+            result = parse_structured(response_text, self._intent_schema(categories or self.intent_categories))
             
             return {
                 "text": text[:100] + "..." if len(text) > 100 else text,
@@ -108,23 +94,70 @@ IMPORTANT:
                 "reasoning": result.get("reasoning", "")
             }
         
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, SchemaValidationError) as e:
             print(f"JSON decode error: {e}")
             print(f"Raw response: {response_text[:200]}")
-            return {
-                "text": text,
-                "primary_intent": "error",
-                "confidence": 0.0,
-                "all_scores": {}
-            }
+            return self._error_result(text)
+    
+    def detect_intent(self, text, categories=None):
+        if not text or len(text.strip()) == 0:
+            return self._empty_result(text)
+        
+        if categories is None:
+            categories = self.intent_categories
+        
+        try:
+            response_text = self.client.generate(
+                self._intent_prompt(text, categories),
+                generation_config=self.generation_config,
+                operation="intent.detect_intent",
+                response_schema=self._intent_schema(categories)
+            )
+            return self._parse_intent(text, response_text, categories)
+        
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error detecting intent: {e}")
-            return {
-                "text": text,
-                "primary_intent": "error",
-                "confidence": 0.0,
-                "all_scores": {}
-            }
+            return self._error_result(text)
+    
+    async def detect_intent_async(self, text, categories=None):
+        if not text or len(text.strip()) == 0:
+            return self._empty_result(text)
+        
+        if categories is None:
+            categories = self.intent_categories
+        
+        try:
+            response_text = await self.client.generate_async(
+                self._intent_prompt(text, categories),
+                generation_config=self.generation_config,
+                operation="intent.detect_intent",
+                response_schema=self._intent_schema(categories)
+            )
+            return self._parse_intent(text, response_text, categories)
+        
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error detecting intent: {e}")
+            return self._error_result(text)
+    
+    def _empty_result(self, text):
+        return {
+            "text": text,
+            "primary_intent": "unknown",
+            "confidence": 0.0,
+            "all_scores": {}
+        }
+    
+    def _error_result(self, text):
+        return {
+            "text": text,
+            "primary_intent": "error",
+            "confidence": 0.0,
+            "all_scores": {}
+        }
     
     def detect_multi_intent(self, text, categories=None, threshold=0.3):
         if categories is None:
@@ -132,6 +165,17 @@ IMPORTANT:
         
         result = self.detect_intent(text, categories)
         
+        return self._filter_intents(result, threshold)
+    
+    async def detect_multi_intent_async(self, text, categories=None, threshold=0.3):
+        if categories is None:
+            categories = self.intent_categories
+        
+        result = await self.detect_intent_async(text, categories)
+        
+        return self._filter_intents(result, threshold)
+    
+    def _filter_intents(self, result, threshold):
         if not result.get('all_scores'):
             return []
         
@@ -154,13 +198,25 @@ IMPORTANT:
         results = []
         
         for turn in conversation:
-            if turn['speaker'] == 'Patient':  # Focus on patient statements
+            if is_patient(turn):  # Focus on patient statements
                 analysis = self.detect_intent(turn['text'])
                 analysis['speaker'] = turn['speaker']
                 results.append(analysis)
         
         return results
     
+    async def analyze_conversation_async(self, conversation):
+        patient_turns = [turn for turn in conversation if is_patient(turn)]
+        
+        results = await asyncio.gather(*[
+            self.detect_intent_async(turn['text']) for turn in patient_turns
+        ])
+        
+        for turn, analysis in zip(patient_turns, results):
+            analysis['speaker'] = turn['speaker']
+        
+        return list(results)
+    
     def get_intent_summary(self, intents):
         if not intents:
             return {
@@ -0,0 +1,322 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from rate_limiter import RateLimitExceeded
+
+load_dotenv()
+
+DEFAULT_DB_PATH = os.getenv("JOB_QUEUE_PATH", "outputs/jobs.sqlite3")
+DEFAULT_VISIBILITY_TIMEOUT = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 5.0
+RATE_LIMIT_BACKOFF = 30.0
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+JOB_TASKS = {
+    "visit": lambda pipeline, payload: pipeline.process(payload["transcript"]),
+    "ner": lambda pipeline, payload: pipeline.summarizer.create_assignment_format(payload["transcript"]),
+    "sentiment_intent": lambda pipeline, payload: pipeline.analyzer.create_assignment_format(
+        payload.get("transcript", ""),
+        sample_statement=payload.get("sample_statement")
+    ),
+    "soap": lambda pipeline, payload: pipeline.soap_generator.generate_soap_note(payload["transcript"])
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    visible_at REAL NOT NULL,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, visible_at, priority DESC, created_at);
+"""
+
+_STATUS_COLUMNS = "id, task, priority, status, attempts, max_attempts, worker, error, created_at, started_at, finished_at"
+
+
+class JobQueue:
+    # A durable queue in one SQLite file, shared by any number of processes.
+    # A claimed job is hidden for the visibility timeout; if its worker does
+    # not finish or extend it in time, the job becomes claimable again.
+    def __init__(self, path=DEFAULT_DB_PATH, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the queue safe to use from threads and
+        # forked processes alike
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, task, payload, priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        if task not in JOB_TASKS:
+            raise ValueError(f"task must be one of {tuple(JOB_TASKS)}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, task, payload, priority, max_attempts, visible_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, task, json.dumps(payload, ensure_ascii=False), priority, max_attempts, now, now)
+            )
+        return job_id
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {_STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def result(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] != "done":
+            return None
+        return json.loads(row["result"])
+
+    def wait(self, job_id, timeout=None, poll_interval=0.5):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None or status["status"] in ("done", "failed"):
+                return status
+            if deadline is not None and time.time() >= deadline:
+                return status
+            time.sleep(poll_interval)
+
+    def claim(self, worker):
+        # Highest priority first, oldest first within a priority
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose lease expired on their last allowed attempt are
+                # given up rather than run again
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'visibility timeout expired'), "
+                    "finished_at = ? WHERE status = 'running' AND visible_at <= ? AND attempts >= max_attempts",
+                    (now, now)
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND visible_at <= ? "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                    "visible_at = ?, started_at = ? WHERE id = ?",
+                    (worker, now + self.visibility_timeout, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["attempts"] += 1
+        return job
+
+    def extend(self, job_id, worker, seconds=None):
+        # Returns False once another worker has taken the job over
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET visible_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + (seconds or self.visibility_timeout), job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, result):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result, ensure_ascii=False, default=str), time.time(), job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error, backoff=RETRY_BACKOFF):
+        # Requeued with a growing delay until its attempts run out
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                "visible_at = ? + ? * attempts, "
+                "finished_at = CASE WHEN attempts >= max_attempts THEN ? END, "
+                "error = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (now, backoff, now, error, job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+class _Heartbeat:
+    # Keeps extending a running job's lease so long jobs are not handed to
+    # another worker
+    def __init__(self, queue, job_id, worker):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(queue, job_id, worker), daemon=True)
+        self._thread.start()
+
+    def _run(self, queue, job_id, worker):
+        interval = queue.visibility_timeout / 3
+        while not self._stop.wait(interval):
+            if not queue.extend(job_id, worker):
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(queue, job, worker, pipeline):
+    heartbeat = _Heartbeat(queue, job["id"], worker)
+    try:
+        result = JOB_TASKS[job["task"]](pipeline, job["payload"])
+    except RateLimitExceeded as e:
+        heartbeat.stop()
+        return queue.fail(job["id"], worker, f"RateLimitExceeded: {e}", backoff=RATE_LIMIT_BACKOFF)
+    except Exception as e:
+        heartbeat.stop()
+        print(f"Job {job['id']} ({job['task']}) failed: {str(e)}")
+        return queue.fail(job["id"], worker, f"{type(e).__name__}: {e}")
+
+    heartbeat.stop()
+    if result is None:
+        return queue.fail(job["id"], worker, "task returned no result")
+    return queue.complete(job["id"], worker, result)
+
+
+def run_worker(path=DEFAULT_DB_PATH, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, poll_interval=1.0,
+               max_jobs=None, exit_when_empty=False, api_key=None):
+    from visit_pipeline import VisitPipeline
+
+    queue = JobQueue(path, visibility_timeout=visibility_timeout)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    # Modules are loaded once per process and reused for every job
+    pipeline = VisitPipeline(api_key=api_key)
+
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = queue.claim(worker)
+        if job is None:
+            if exit_when_empty:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job, worker, pipeline)
+        processed += 1
+    return processed
+
+
+def run_workers(processes, **kwargs):
+    # Each worker is a separate process, so jobs run in parallel without
+    # sharing an interpreter with the UI or each other
+    workers = [multiprocessing.Process(target=run_worker, kwargs=kwargs) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MediScribe background job queue")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker_parser = commands.add_parser("worker", help="Run a pool of worker processes")
+    worker_parser.add_argument("--processes", type=int, default=2)
+    worker_parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT)
+    worker_parser.add_argument("--exit-when-empty", action="store_true")
+
+    enqueue_parser = commands.add_parser("enqueue", help="Queue a transcript file")
+    enqueue_parser.add_argument("transcript")
+    enqueue_parser.add_argument("--task", choices=list(JOB_TASKS), default="visit")
+    enqueue_parser.add_argument("--priority", type=int, default=0)
+    enqueue_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    status_parser = commands.add_parser("status", help="Show a job's status")
+    status_parser.add_argument("job_id")
+
+    result_parser = commands.add_parser("result", help="Print a finished job's result")
+    result_parser.add_argument("job_id")
+
+    commands.add_parser("stats", help="Count jobs by status")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        print(f"Starting {args.processes} workers on {args.db}")
+        run_workers(
+            args.processes,
+            path=args.db,
+            visibility_timeout=args.visibility_timeout,
+            exit_when_empty=args.exit_when_empty
+        )
+        return
+
+    queue = JobQueue(args.db)
+    if args.command == "enqueue":
+        with open(args.transcript) as f:
+            payload = {"transcript": f.read()}
+        print(queue.enqueue(args.task, payload, priority=args.priority, max_attempts=args.max_attempts))
+    elif args.command == "status":
+        print(json.dumps(queue.status(args.job_id), indent=2))
+    elif args.command == "result":
+        print(json.dumps(queue.result(args.job_id), indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(queue.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import json
+import re
+import threading
+from tracing import current_span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+REPAIR_PATHS = ("direct", "code_fence", "extracted", "trailing_comma", "truncated", "failed")
+
+_CLOSERS = {"{": "}", "[": "]"}
+MAX_TRUNCATION_ATTEMPTS = 32
+_MEMBER_KEY = re.compile(r'^\s*"((?:[^"\\]|\\.)*)"\s*:\s*$')
+
+_stats_lock = threading.Lock()
+_stats = {path: 0 for path in REPAIR_PATHS}
+
+
+def _fast_loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _count(path):
+    with _stats_lock:
+        _stats[path] += 1
+
+    span = current_span()
+    if span is not None:
+        span.set(repair=path)
+
+
+def repair_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_repair_stats():
+    with _stats_lock:
+        for path in _stats:
+            _stats[path] = 0
+
+
+def strip_code_fence(text):
+    text = text.strip()
+    if not text.startswith("```"):
+        return text
+
+    text = text[3:]
+    if text.startswith("json"):
+        text = text[4:]
+    end = text.rfind("```")
+    if end != -1:
+        text = text[:end]
+    return text.strip()
+
+
+def scan_json(text):
+    # One pass over the first JSON object/array. end is None when the value is
+    # truncated; safe_points are (position, open containers) where the text can
+    # be cut and closed without leaving a partial member behind.
+    start = -1
+    for i, char in enumerate(text):
+        if char in "{[":
+            start = i
+            break
+    if start == -1:
+        return -1, None, [], []
+
+    stack = []
+    safe_points = []
+    in_string = False
+    escaped = False
+
+    for i in range(start, len(text)):
+        char = text[i]
+
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            safe_points.append((i + 1, list(stack)))
+        elif char in "}]":
+            if not stack or _CLOSERS[stack[-1]] != char:
+                break
+            stack.pop()
+            if not stack:
+                return start, i + 1, [], safe_points
+            safe_points.append((i + 1, list(stack)))
+        elif char == ",":
+            safe_points.append((i, list(stack)))
+
+    return start, None, stack, safe_points
+
+
+def remove_trailing_commas(text):
+    out = []
+    in_string = False
+    escaped = False
+    pending_comma = None
+
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in "}]":
+                out.extend(pending_comma)
+            else:
+                out.extend(pending_comma[1:])
+            pending_comma = None
+
+        if char == ",":
+            pending_comma = [char]
+            continue
+
+        if char == '"':
+            in_string = True
+        out.append(char)
+
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return "".join(out)
+
+
+def close_truncated(text, safe_points):
+    # Cut back to the last complete member and close every open container
+    for position, stack in reversed(safe_points[-MAX_TRUNCATION_ATTEMPTS:]):
+        candidate = text[:position].rstrip().rstrip(",")
+        candidate += "".join(_CLOSERS[opener] for opener in reversed(stack))
+        try:
+            return _fast_loads(remove_trailing_commas(candidate))
+        except ValueError:
+            continue
+    raise json.JSONDecodeError("Truncated JSON could not be closed", text, len(text))
+
+
+def loads(response_text):
+    # Cheapest path first; each fallback is counted so repairs stay visible
+    try:
+        result = _fast_loads(response_text)
+        _count("direct")
+        return result
+    except ValueError:
+        pass
+
+    text = strip_code_fence(response_text)
+    if text != response_text.strip():
+        try:
+            result = _fast_loads(text)
+            _count("code_fence")
+            return result
+        except ValueError:
+            pass
+
+    start, end, stack, safe_points = scan_json(text)
+    if start == -1:
+        _count("failed")
+        raise json.JSONDecodeError("No JSON object or array found", response_text, 0)
+
+    if end is not None:
+        candidate = text[start:end]
+        try:
+            result = _fast_loads(candidate)
+            _count("extracted")
+            return result
+        except ValueError:
+            pass
+
+        try:
+            result = _fast_loads(remove_trailing_commas(candidate))
+            _count("trailing_comma")
+            return result
+        except ValueError:
+            _count("failed")
+            raise json.JSONDecodeError("Malformed JSON in response", response_text, start)
+
+    try:
+        result = close_truncated(text[start:], [(p - start, s) for p, s in safe_points])
+        _count("truncated")
+        return result
+    except ValueError:
+        _count("failed")
+        raise
+
+
+class IncrementalJSONParser:
+    # Fed a streamed response chunk by chunk; feed() returns (path, value) for
+    # every member that completed in that chunk, down to max_depth levels.
+    # A member is emitted once its closing comma or bracket arrives, so values
+    # are always whole and never need repair.
+    def __init__(self, max_depth=2):
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        events = []
+        text = self.buffer
+
+        while self._pos < len(text) and not self.done:
+            i = self._pos
+            char = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if not self._stack:
+                # Skip any code fence or prose before the value starts
+                if char in "{[":
+                    self._stack.append([char, (), i + 1, 0])
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append([char, self._child_path(i), i + 1, 0])
+            elif char == ",":
+                self._emit_member(self._stack[-1], i, events)
+            elif char in "}]":
+                frame = self._stack[-1]
+                if _CLOSERS[frame[0]] != char:
+                    self.done = True
+                    break
+                self._emit_member(frame, i, events)
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+
+        return events
+
+    def _child_path(self, position):
+        opener, path, member_start, index = self._stack[-1]
+        if opener == "[":
+            return path + (index,)
+        match = _MEMBER_KEY.match(self.buffer[member_start:position])
+        return path + (json.loads(f'"{match.group(1)}"') if match else None,)
+
+    def _emit_member(self, frame, position, events):
+        opener, path, member_start, index = frame
+        member = self.buffer[member_start:position]
+        frame[2] = position + 1
+        if opener == "[":
+            frame[3] += 1
+
+        if len(self._stack) > self.max_depth or not member.strip():
+            return
+
+        try:
+            if opener == "{":
+                events.extend((path + (key,), value) for key, value in _fast_loads("{" + member + "}").items())
+            else:
+                events.append((path + (index,), _fast_loads("[" + member + "]")[0]))
+        except ValueError:
+            pass
+
+    def result(self):
+        # The whole response, through the same repair path as a non-streamed one
+        return loads(self.buffer)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", ".llm_cache/responses.sqlite3")
+DEFAULT_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "50000"))
+DEFAULT_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_TTL_SECONDS = float(os.getenv("GEMINI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def config_to_dict(generation_config):
+    if generation_config is None:
+        return None
+    if isinstance(generation_config, dict):
+        return generation_config
+    if hasattr(generation_config, "__dict__"):
+        return {k: v for k, v in vars(generation_config).items() if not k.startswith("_")}
+    return str(generation_config)
+
+
+def make_cache_key(model_name, generation_config, prompt):
+    config = json.dumps(config_to_dict(generation_config), sort_keys=True, default=str)
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model_name}\n{config}\n{prompt_hash}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS, enabled=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, model_name, generation_config, prompt):
+        if not self.enabled:
+            return None
+
+        key = make_cache_key(model_name, generation_config, prompt)
+        now = time.time()
+
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return response
+
+    def set(self, model_name, generation_config, prompt, response):
+        if not self.enabled:
+            return
+
+        key = make_cache_key(model_name, generation_config, prompt)
+        now = time.time()
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, len(response.encode("utf-8")), now, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def delete(self, model_name, generation_config, prompt):
+        if not self.enabled:
+            return
+
+        key = make_cache_key(model_name, generation_config, prompt)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            cursor = conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+        # Drop least recently used entries until both limits hold
+        while count > self.max_entries or total_bytes > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+
+            for key, size in rows:
+                if count <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                count -= 1
+                total_bytes -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries, total_bytes = 0, 0
+
+        if self.enabled:
+            with self._lock:
+                entries, total_bytes = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total_bytes
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            disabled = os.getenv("GEMINI_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+            _default_cache = LLMResponseCache(enabled=not disabled)
+        return _default_cache
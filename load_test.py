@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_CONCURRENCY = [1, 2, 4, 8, 16, 32]
+
+
+async def call_app(app, path, body):
+    # Drives the ASGI app directly, without a server in between
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")]
+    }
+    received = False
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"]
+
+
+async def call_http(url, path, body):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return int(data.split(b" ", 2)[1])
+
+
+def make_bodies(count, duplicate):
+    from main_gemini_ner import TRANSCRIPT
+
+    # Distinct transcripts unless duplicates are requested, so single-flight
+    # and the response cache only help when asked to
+    bodies = []
+    for i in range(count):
+        transcript = TRANSCRIPT if duplicate else TRANSCRIPT.replace("Jones", f"Jones-{i}")
+        bodies.append(json.dumps({"transcript": transcript}).encode("utf-8"))
+    return bodies
+
+
+async def run_level(call, path, bodies, concurrency):
+    pending = iter(bodies)
+    latencies = []
+    statuses = {}
+
+    async def client():
+        for body in pending:
+            started = time.perf_counter()
+            status = await call(path, body)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "p50_seconds": round(latencies[len(latencies) // 2], 4),
+        "p95_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API requests per second against concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests-per-client", type=int, default=8)
+    parser.add_argument("--endpoint", default="/ner")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Simulated model latency in seconds (in-process runs)")
+    parser.add_argument("--duplicate", action="store_true",
+                        help="Send the same transcript every time to exercise request coalescing")
+    parser.add_argument("--url", default=None,
+                        help="Test a running server (e.g. http://127.0.0.1:8000) instead of the in-process app")
+    parser.add_argument("--output", default="outputs/load_test_results.json")
+    args = parser.parse_args()
+
+    if args.url:
+        call = lambda path, body: call_http(args.url, path, body)
+        app = None
+    else:
+        # Must be set before the modules create their clients
+        os.environ["GEMINI_BACKEND"] = "mock"
+        os.environ.setdefault("GEMINI_API_KEY", "mock")
+        os.environ["GEMINI_MOCK_LATENCY"] = str(args.latency)
+        os.environ.setdefault("GEMINI_CACHE_DISABLED", "1")
+        from api_server import MediScribeService
+        app = MediScribeService()
+        app.pipeline
+        call = lambda path, body: call_app(app, path, body)
+
+    print("=" * 70)
+    print(f"MEDISCRIBE API LOAD TEST ({args.endpoint}, {args.url or 'in-process, mock backend'})")
+    print("=" * 70)
+
+    results = []
+    for concurrency in args.concurrency:
+        bodies = make_bodies(concurrency * args.requests_per_client, args.duplicate)
+        level = asyncio.run(run_level(call, args.endpoint, bodies, concurrency))
+        results.append(level)
+        print(
+            f"  concurrency {concurrency:>4}: {level['requests_per_second']:>8.2f} req/s  "
+            f"p50 {level['p50_seconds']:.3f}s  p95 {level['p95_seconds']:.3f}s  {level['statuses']}"
+        )
+
+    report = {"endpoint": args.endpoint, "target": args.url or "in-process", "levels": results}
+    if app is not None:
+        report["coalesced"] = app.single_flight.coalesced
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
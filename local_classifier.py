@@ -0,0 +1,112 @@
+import os
+import re
+from dotenv import load_dotenv
+from emotion_lexicon import EmotionMatcher
+from sentiment_intent_classifier import INTENT_CATEGORIES
+
+load_dotenv()
+
+DEFAULT_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+
+LOCAL_TIER = "local"
+REMOTE_TIER = "gemini"
+
+GRATITUDE = re.compile(r"\b(?:thanks?|thank you|appreciate[ds]?|grateful)\b", re.IGNORECASE)
+AFFIRMATION = re.compile(r"^\W*(?:yes|yeah|yep|no|nope|sure|right|correct|exactly|of course)\b", re.IGNORECASE)
+NEGATION = re.compile(r"\b(?:not|no|never|don't|didn't|doesn't|haven't|hasn't|isn't|wasn't|can't|won't)\b", re.IGNORECASE)
+SYMPTOM = re.compile(r"\b(?:pain|aches?|backaches?|headaches?|hurts?|stiff(?:ness)?|sore|discomfort|numb(?:ness)?|dizzy)\b", re.IGNORECASE)
+
+SENTIMENT_BY_CATEGORY = {
+    "anxious": "Anxious",
+    "negative": "Concerned",
+    "positive": "Reassured"
+}
+
+
+class LocalSentimentIntentClassifier:
+    # First tier of the sentiment/intent cascade: lexicon hits and a few
+    # formulaic patterns score each turn on the CPU. Turns it is not sure about
+    # are left for Gemini.
+    def __init__(self, emotion_matcher=None, intent_categories=None, threshold=DEFAULT_THRESHOLD):
+        self.emotion_matcher = emotion_matcher or EmotionMatcher()
+        self.intent_categories = intent_categories or list(INTENT_CATEGORIES)
+        self.threshold = threshold
+
+    def _sentiment(self, text, words, categories):
+        polar = [c for c in categories if c in SENTIMENT_BY_CATEGORY]
+
+        if not polar:
+            # Missing a lexicon hit is not evidence of neutrality ("it still
+            # hurts a lot"), so only a short turn with a neutral hit is trusted
+            label, confidence = "Neutral", 0.9 if words <= 6 and "neutral" in categories else 0.5
+        elif len(set(polar)) == 1:
+            label, confidence = SENTIMENT_BY_CATEGORY[polar[0]], 0.9 if words <= 12 else 0.65
+        else:
+            label, confidence = SENTIMENT_BY_CATEGORY[max(set(polar), key=polar.count)], 0.45
+
+        # "I don't feel nervous" or a question needs more than keyword spotting
+        if polar and NEGATION.search(text):
+            confidence = min(confidence, 0.5)
+        if "?" in text:
+            confidence = min(confidence, 0.6)
+        return label, confidence
+
+    def _intent(self, text, words, categories):
+        question = "?" in text
+
+        if GRATITUDE.search(text) and words <= 12 and not question:
+            intent, confidence = "expressing gratitude", 0.92
+        elif question:
+            intent = "seeking reassurance" if "anxious" in categories else "asking questions"
+            confidence = 0.6
+        elif SYMPTOM.search(text):
+            # Checked before affirmations: "Yes, really bad headaches." reports a symptom
+            intent, confidence = "reporting symptoms", 0.7
+        elif categories & {"negative", "anxious"}:
+            intent, confidence = "expressing concern", 0.6
+        elif AFFIRMATION.match(text) and words <= 6:
+            intent, confidence = "providing information", 0.88
+        elif words <= 5 and categories and categories <= {"positive", "neutral"}:
+            # Short reactions such as "That's a relief!"
+            intent, confidence = "providing information", 0.85
+        else:
+            intent, confidence = "providing information", 0.4
+
+        if intent not in self.intent_categories:
+            return intent, 0.0
+        return intent, confidence
+
+    def classify(self, text):
+        words = len(text.split())
+        categories = [hit['category'] for hit in self.emotion_matcher.find(text)]
+
+        sentiment, sentiment_confidence = self._sentiment(text, words, categories)
+        intent, intent_confidence = self._intent(text, words, set(categories))
+
+        return {
+            "sentiment": {
+                "text": text,
+                "sentiment": sentiment,
+                "confidence": sentiment_confidence,
+                "raw_label": sentiment,
+                "raw_score": sentiment_confidence,
+                "reasoning": "local lexicon classifier",
+                "tier": LOCAL_TIER
+            },
+            "intent": {
+                "text": text[:100] + "..." if len(text) > 100 else text,
+                "primary_intent": intent,
+                "confidence": intent_confidence,
+                "all_scores": {intent: intent_confidence},
+                "reasoning": "local pattern classifier",
+                "tier": LOCAL_TIER
+            }
+        }
+
+    def is_confident(self, result):
+        return min(result['sentiment']['confidence'], result['intent']['confidence']) >= self.threshold
+
+    def decide(self, text):
+        # The local result when it clears the threshold, otherwise None
+        result = self.classify(text)
+        return result if self.is_confident(result) else None
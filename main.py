@@ -1,6 +1,7 @@
 import streamlit as st
 import json
 import os
+from contextlib import contextmanager
 from datetime import datetime
 import plotly.graph_objects as go
 import plotly.express as px
@@ -12,6 +13,12 @@ try:
     from medical_summarizer_gemini import GeminiMedicalSummarizer
     from sentiment_intent_analyzer import CompleteSentimentIntentAnalyzer
     from soap_note_generator import SOAPNoteGenerator
+    from visit_pipeline import VisitPipeline
+    from job_queue import JobQueue
+    from llm_cache import get_default_cache
+    from gemini_client import response_cache
+    from tracing import trace
+    from usage import new_tracker, use_tracker
     MODULES_LOADED = True
 except ImportError as e:
     MODULES_LOADED = False
@@ -135,6 +142,36 @@ Patient: Thank you, doctor. I appreciate it.
 Physician: You're very welcome, Ms. Jones. Take care, and don't hesitate to reach out if you need anything."""
 
 
+@st.cache_resource(show_spinner=False)
+def get_summarizer(api_key):
+    """Shared summarizer per API key"""
+    return GeminiMedicalSummarizer(api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_sentiment_analyzer(api_key):
+    """Shared sentiment & intent analyzer per API key"""
+    return CompleteSentimentIntentAnalyzer(api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_soap_generator(api_key):
+    """Shared SOAP note generator per API key"""
+    return SOAPNoteGenerator(api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_visit_pipeline(api_key):
+    """Shared visit pipeline per API key"""
+    return VisitPipeline(api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    """Background job queue shared with the worker processes"""
+    return JobQueue()
+
+
 def initialize_session_state():
     """Initialize session state variables"""
     if 'api_key' not in st.session_state:
@@ -147,6 +184,21 @@ def initialize_session_state():
         st.session_state.sentiment_results = None
     if 'soap_results' not in st.session_state:
         st.session_state.soap_results = None
+    if 'traces' not in st.session_state:
+        st.session_state.traces = {}
+    if 'use_cache' not in st.session_state:
+        st.session_state.use_cache = True
+    if 'usage_tracker' not in st.session_state:
+        # Rolls up into the process totals like any other tracker
+        st.session_state.usage_tracker = new_tracker()
+
+
+@contextmanager
+def session_run(name):
+    """Trace a module run, applying this session's cache choice and counting its usage"""
+    with trace(name) as run_trace, response_cache(st.session_state.use_cache), \
+            use_tracker(st.session_state.usage_tracker):
+        yield run_trace
 
 
 def render_header():
@@ -178,6 +230,24 @@ def sidebar_config():
         )
         st.session_state.api_key = api_key
         
+        # Kept per session; the cache itself is shared by every session
+        cache = get_default_cache()
+        st.session_state.use_cache = st.checkbox(
+            "Use response cache",
+            value=st.session_state.use_cache,
+            disabled=not cache.enabled,
+            help="Reuse stored Gemini responses for prompts that were already sent"
+        )
+        if cache.enabled and st.session_state.use_cache:
+            stats = cache.stats()
+            st.caption(
+                f"Cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} stored responses"
+            )
+        
+        # Filled in after the modules run, so it includes this run's calls
+        usage_slot = st.empty()
+        
         st.markdown("---")
         
         st.header("📝 About")
@@ -199,6 +269,107 @@ def sidebar_config():
         st.markdown("---")
         st.markdown("**Developed by:** Navneet")
         st.markdown("**For:** Emitrr AI Engineer Intern Assignment")
+    
+    return usage_slot
+
+
+def render_session_usage(usage_slot):
+    """Tokens spent by this browser session's module runs"""
+    totals = st.session_state.usage_tracker.summary()["totals"]
+    usage_slot.caption(
+        f"Session usage: {totals['total_tokens']:,} tokens "
+        f"(~${totals['cost_usd']:.4f}) over {totals['calls']} calls"
+    )
+
+
+def render_usage(results):
+    """Show token usage and estimated cost for a module result"""
+    usage = (results or {}).get("metadata", {}).get("usage")
+    if not usage:
+        return
+    
+    totals = usage["totals"]
+    with st.expander(f"🪙 Token usage ({totals['total_tokens']:,} tokens, ${totals['cost_usd']:.4f})"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Input tokens", f"{totals['input_tokens']:,}")
+        with col2:
+            st.metric("Output tokens", f"{totals['output_tokens']:,}")
+        with col3:
+            st.metric("Model calls", totals['calls'], f"{totals['cached_calls']} cached", delta_color="off")
+        
+        st.dataframe(
+            [
+                {
+                    "Operation": operation,
+                    "Calls": row["calls"],
+                    "Cached": row["cached_calls"],
+                    "Input tokens": row["input_tokens"],
+                    "Output tokens": row["output_tokens"],
+                    "Cost (USD)": row["cost_usd"]
+                }
+                for operation, row in usage["by_operation"].items()
+            ],
+            use_container_width=True
+        )
+
+
+def render_trace(name):
+    """Show stage timings for the last run of a module"""
+    summary = st.session_state.traces.get(name)
+    if not summary:
+        return
+    
+    with st.expander(f"⏱️ Stage timings ({summary['total_seconds']:.2f}s)"):
+        st.dataframe(
+            [
+                {"Stage": stage, "Count": v["count"], "Seconds": v["total_seconds"]}
+                for stage, v in summary["stages"].items()
+            ],
+            use_container_width=True
+        )
+        
+        model_calls = [s for s in summary["spans"] if s["name"] == "model_call"]
+        if model_calls:
+            st.dataframe(
+                [
+                    {
+                        "Model": s["attributes"].get("model"),
+                        "Cache": s["attributes"].get("cache"),
+                        "Prompt bytes": s["attributes"].get("prompt_bytes"),
+                        "Response bytes": s["attributes"].get("response_bytes"),
+                        "Seconds": s["duration_seconds"]
+                    }
+                    for s in model_calls
+                ],
+                use_container_width=True
+            )
+        
+        st.download_button(
+            label="📥 Download trace",
+            data=json.dumps(summary, indent=2, default=str),
+            file_name=f"trace_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            key=f"trace_download_{name}"
+        )
+
+
+def render_ner_preview(partial):
+    """Show the fields extracted so far while the response streams in"""
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        for label, key in (("👤 Patient", "Patient_Name"), ("🩺 Diagnosis", "Diagnosis"),
+                           ("📊 Current Status", "Current_Status"), ("🎯 Prognosis", "Prognosis")):
+            if partial.get(key):
+                st.info(f"**{label}:** {partial[key]}")
+    
+    with col2:
+        for label, key in (("🤒 Symptoms", "Symptoms"), ("💊 Treatment", "Treatment")):
+            if partial.get(key):
+                st.markdown(f"**{label}**")
+                for item in partial[key]:
+                    st.write(f"• {item}")
 
 
 def module1_ner():
@@ -238,9 +409,16 @@ def module1_ner():
         
         with st.spinner("🔍 Analyzing transcript with Gemini AI..."):
             try:
-                summarizer = GeminiMedicalSummarizer(api_key=st.session_state.api_key)
-                results = summarizer.create_assignment_format(transcript)
+                summarizer = get_summarizer(st.session_state.api_key)
+                live = st.empty()
+                with session_run("ner") as run_trace:
+                    for results in summarizer.create_assignment_format_stream(transcript):
+                        if results:
+                            with live.container():
+                                render_ner_preview(results)
+                live.empty()
                 st.session_state.ner_results = results
+                st.session_state.traces["ner"] = run_trace.summary()
                 st.success("✅ Analysis complete!")
             except Exception as e:
                 st.error(f"❌ Error: {str(e)}")
@@ -334,6 +512,9 @@ def module1_ner():
                 file_name=f"medical_ner_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                 mime="application/json"
             )
+    
+    render_usage(st.session_state.ner_results)
+    render_trace("ner")
 
 
 def module2_sentiment():
@@ -361,12 +542,14 @@ def module2_sentiment():
             
             with st.spinner("Analyzing sentiment and intent..."):
                 try:
-                    analyzer = CompleteSentimentIntentAnalyzer(api_key=st.session_state.api_key)
-                    results = analyzer.create_assignment_format(
-                        st.session_state.transcript,
-                        sample_statement=statement
-                    )
+                    analyzer = get_sentiment_analyzer(st.session_state.api_key)
+                    with session_run("sentiment") as run_trace:
+                        results = analyzer.create_assignment_format(
+                            st.session_state.transcript,
+                            sample_statement=statement
+                        )
                     st.session_state.sentiment_results = results
+                    st.session_state.traces["sentiment"] = run_trace.summary()
                     st.success("✅ Analysis complete!")
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
@@ -426,9 +609,11 @@ def module2_sentiment():
             
             with st.spinner("Analyzing full conversation..."):
                 try:
-                    analyzer = CompleteSentimentIntentAnalyzer(api_key=st.session_state.api_key)
-                    results = analyzer.create_assignment_format(transcript)
+                    analyzer = get_sentiment_analyzer(st.session_state.api_key)
+                    with session_run("sentiment") as run_trace:
+                        results = analyzer.create_assignment_format(transcript)
                     st.session_state.sentiment_results = results
+                    st.session_state.traces["sentiment"] = run_trace.summary()
                     st.success("✅ Analysis complete!")
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
@@ -449,6 +634,13 @@ def module2_sentiment():
             with col3:
                 st.metric("Statements Analyzed", len(results['All_Patient_Analyses']))
             
+            cascade = results.get('Cascade')
+            if cascade:
+                st.caption(
+                    f"Decided locally: {cascade['local']} · sent to Gemini: {cascade['gemini']} "
+                    f"· offload ratio {cascade['offload_ratio']:.0%}"
+                )
+            
             # Visualizations
             col1, col2 = st.columns(2)
             
@@ -492,6 +684,42 @@ def module2_sentiment():
                     
                     if analysis.get('emotional_indicators'):
                         st.write("**Emotional Indicators:**", ", ".join(analysis['emotional_indicators']))
+                    if analysis.get('tier'):
+                        st.caption(f"Decided by: {analysis['tier']}")
+    
+    render_usage(st.session_state.sentiment_results)
+    render_trace("sentiment")
+
+
+SOAP_SECTIONS = ["Subjective", "Objective", "Assessment", "Plan"]
+
+
+def render_soap_sections(soap):
+    """Render the SOAP cards; also used for the partial note while it streams in"""
+    colors = ["#e3f2fd", "#f3e5f5", "#fff3e0", "#e8f5e9"]
+    icons = ["🗣️", "🔬", "🩺", "📋"]
+    
+    for section, color, icon in zip(SOAP_SECTIONS, colors, icons):
+        st.markdown(f"### {icon} {section}")
+        
+        section_data = soap.get(section, {})
+        
+        if isinstance(section_data, dict):
+            for key, value in section_data.items():
+                if value and str(value).strip():
+                    formatted_key = key.replace("_", " ").title()
+                    st.markdown(f"""
+                    <div style="background-color: {color}; padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem;">
+                        <strong>{formatted_key}:</strong><br>
+                        {value}
+                    </div>
+                    """, unsafe_allow_html=True)
+        else:
+            st.markdown(f"""
+            <div style="background-color: {color}; padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem;">
+                {section_data}
+            </div>
+            """, unsafe_allow_html=True)
 
 
 def module3_soap():
@@ -510,6 +738,12 @@ def module3_soap():
         height=250
     )
     
+    from_entities = st.checkbox(
+        "Build from Module 1 entities",
+        value=True,
+        help="Fills entity-backed fields locally and sends the model only an entity digest and relevant excerpts"
+    )
+    
     if st.button("📋 Generate SOAP Note", type="primary", use_container_width=True):
         if not st.session_state.api_key:
             st.error("⚠️ Please enter your Gemini API key")
@@ -517,9 +751,21 @@ def module3_soap():
         
         with st.spinner("🔄 Generating SOAP note..."):
             try:
-                generator = SOAPNoteGenerator(api_key=st.session_state.api_key)
-                soap_note = generator.generate_soap_note(transcript)
+                generator = get_soap_generator(st.session_state.api_key)
+                live = st.empty()
+                with session_run("soap") as run_trace:
+                    if from_entities:
+                        # Served from the response cache when Module 1 already ran on this transcript
+                        entities = get_summarizer(st.session_state.api_key).extractor.extract_entities(transcript)
+                        notes = generator.generate_soap_note_from_entities_stream(entities, transcript)
+                    else:
+                        notes = generator.generate_soap_note_stream(transcript)
+                    for soap_note in notes:
+                        with live.container():
+                            render_soap_sections(soap_note)
+                live.empty()
                 st.session_state.soap_results = soap_note
+                st.session_state.traces["soap"] = run_trace.summary()
                 st.success("✅ SOAP note generated successfully!")
             except Exception as e:
                 st.error(f"❌ Error: {str(e)}")
@@ -530,32 +776,7 @@ def module3_soap():
         st.markdown("---")
         soap = st.session_state.soap_results
         
-        # SOAP sections
-        sections = ["Subjective", "Objective", "Assessment", "Plan"]
-        colors = ["#e3f2fd", "#f3e5f5", "#fff3e0", "#e8f5e9"]
-        icons = ["🗣️", "🔬", "🩺", "📋"]
-        
-        for section, color, icon in zip(sections, colors, icons):
-            st.markdown(f"### {icon} {section}")
-            
-            section_data = soap.get(section, {})
-            
-            if isinstance(section_data, dict):
-                for key, value in section_data.items():
-                    if value and str(value).strip():
-                        formatted_key = key.replace("_", " ").title()
-                        st.markdown(f"""
-                        <div style="background-color: {color}; padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem;">
-                            <strong>{formatted_key}:</strong><br>
-                            {value}
-                        </div>
-                        """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div style="background-color: {color}; padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem;">
-                    {section_data}
-                </div>
-                """, unsafe_allow_html=True)
+        render_soap_sections(soap)
         
         # Download options
         st.markdown("---")
@@ -574,7 +795,7 @@ def module3_soap():
         with col2:
             # Format as text
             text_output = []
-            for section in sections:
+            for section in SOAP_SECTIONS:
                 text_output.append(f"\n{'='*60}\n{section.upper()}\n{'='*60}")
                 section_data = soap.get(section, {})
                 if isinstance(section_data, dict):
@@ -590,19 +811,130 @@ def module3_soap():
                 mime="text/plain",
                 use_container_width=True
             )
+    
+    render_usage(st.session_state.soap_results)
+    render_trace("soap")
+
+
+def load_visit(visit):
+    """Fill every module tab from a visit result"""
+    st.session_state.ner_results = visit["Medical_Summary"]
+    st.session_state.sentiment_results = visit["Sentiment_Intent"]
+    st.session_state.soap_results = visit["SOAP_Note"]
+    st.session_state.visit_results = visit
+
+
+def render_job(job_id):
+    """Show a queued visit's progress and load its results once done"""
+    queue = get_job_queue()
+    status = queue.status(job_id)
+    if status is None:
+        st.warning(f"⚠️ Job {job_id} not found")
+        return
+    
+    if status["status"] == "done":
+        if st.session_state.get("loaded_job") != job_id:
+            load_visit(queue.result(job_id))
+            st.session_state.loaded_job = job_id
+        st.success(f"✅ Background job {job_id[:8]} finished. Open the module tabs for the results.")
+    elif status["status"] == "failed":
+        st.error(f"❌ Background job {job_id[:8]} failed after {status['attempts']} attempts: {status['error']}")
+    else:
+        st.info(f"⏳ Background job {job_id[:8]} is {status['status']} (attempt {status['attempts']} of {status['max_attempts']})")
+        st.button("🔄 Refresh", key="job_refresh")
+
+
+def module_visit():
+    """Run all three modules on one transcript"""
+    st.markdown('<div class="section-header">🩺 Full Visit</div>', unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class="info-box">
+    <strong>One pass:</strong> The transcript is parsed once; NER and sentiment/intent run side by side,
+    and the SOAP note is built from the extracted entities. Results appear in the module tabs.
+    </div>
+    """, unsafe_allow_html=True)
+    
+    transcript = st.text_area(
+        "Enter conversation transcript:",
+        value=st.session_state.transcript,
+        height=250,
+        key="visit_transcript"
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        run_now = st.button("⚡ Process Visit", type="primary", use_container_width=True)
+    with col2:
+        queue_job = st.button(
+            "📥 Queue in Background",
+            use_container_width=True,
+            help="Runs on the job queue workers (python job_queue.py worker) with their GEMINI_API_KEY; survives page reloads"
+        )
+    
+    if queue_job:
+        # The job id lives in the URL, so a reload picks the job back up
+        st.query_params["job"] = get_job_queue().enqueue("visit", {"transcript": transcript})
+    
+    if st.query_params.get("job"):
+        render_job(st.query_params["job"])
+    
+    if run_now:
+        if not st.session_state.api_key:
+            st.error("⚠️ Please enter your Gemini API key")
+            return
+        
+        with st.spinner("🔄 Running all modules..."):
+            try:
+                pipeline = get_visit_pipeline(st.session_state.api_key)
+                with session_run("visit") as run_trace:
+                    visit = pipeline.process(transcript)
+                load_visit(visit)
+                st.session_state.traces["visit"] = run_trace.summary()
+                st.success("✅ Visit processed! Open the module tabs for the results.")
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+                return
+    
+    visit = st.session_state.get("visit_results")
+    if visit:
+        metadata = visit["metadata"]
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Wall time", f"{metadata['wall_seconds']:.2f}s")
+        with col2:
+            st.metric("Stages run one by one", f"{metadata['serial_seconds']:.2f}s")
+        
+        st.dataframe(
+            [
+                {
+                    "Stage": name,
+                    "Starts at (s)": stage["start_offset_seconds"],
+                    "Seconds": stage["duration_seconds"],
+                    "Model calls": stage["calls"],
+                    "Error": stage.get("error", "")
+                }
+                for name, stage in metadata["stages"].items()
+            ],
+            use_container_width=True
+        )
+        
+        render_usage(visit)
+    render_trace("visit")
 
 
 def main():
     """Main application"""
     initialize_session_state()
     render_header()
-    sidebar_config()
+    usage_slot = sidebar_config()
     
     # Main tabs
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab_visit, tab4 = st.tabs([
         "📋 Medical NER",
         "🎭 Sentiment & Intent",
         "📝 SOAP Notes",
+        "🩺 Full Visit",
         "ℹ️ About"
     ])
     
@@ -615,6 +947,9 @@ def main():
     with tab3:
         module3_soap()
     
+    with tab_visit:
+        module_visit()
+    
     with tab4:
         st.markdown("""
         # 🩺 MediScribe AI
@@ -661,6 +996,8 @@ def main():
             Built with ❤️ using Streamlit and Google Gemini AI
         </div>
         """, unsafe_allow_html=True)
+    
+    render_session_usage(usage_slot)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import json
 import os
 from medical_summarizer_gemini import GeminiMedicalSummarizer
+from tracing import dump_trace, trace
 
 TRANSCRIPT = """
 > **Physician:** *Good morning, Ms. Jones. How are you feeling today?*
@@ -86,7 +87,8 @@ def main():
     print("=" * 60)
     print("CREATING COMPREHENSIVE SUMMARY")
     print("=" * 60)
-    comprehensive = summarizer.create_comprehensive_summary(TRANSCRIPT)
+    with trace("ner.create_comprehensive_summary") as comprehensive_trace:
+        comprehensive = summarizer.create_comprehensive_summary(TRANSCRIPT)
 
     # Show comprehensive results
     print("\n" + "=" * 60)
@@ -101,7 +103,8 @@ def main():
     print("=" * 60)
     print("CREATING ASSIGNMENT FORMAT")
     print("=" * 60)
-    assignment_output = summarizer.create_assignment_format(TRANSCRIPT)
+    with trace("ner.create_assignment_format") as assignment_trace:
+        assignment_output = summarizer.create_assignment_format(TRANSCRIPT)
     
     if assignment_output:
         print("\n" + "=" * 60)
@@ -123,11 +126,20 @@ def main():
                 json.dump(assignment_output, f, indent=2, ensure_ascii=False)
             print("Saved: outputs/medical_summary_assignment.json")
             
+            dump_trace([comprehensive_trace, assignment_trace], "outputs/medical_summary_trace.json")
+            print("Saved: outputs/medical_summary_trace.json")
+            
         except Exception as e:
             print(f"Error saving files: {e}")
     else:
         print("Failed to create assignment output")
 
+    print("\n" + "=" * 60)
+    print("STAGE TIMINGS")
+    print("=" * 60)
+    print(comprehensive_trace.format())
+    print(assignment_trace.format())
+
     print("\n" + "=" * 60)
     print("COMPLETED!")
     print("=" * 60)
@@ -1,6 +1,7 @@
 import os
 import json
 from sentiment_intent_analyzer import CompleteSentimentIntentAnalyzer
+from tracing import dump_trace, trace
 
 TRANSCRIPT = """
 > **Physician:** *Good morning, Ms. Jones. How are you feeling today?*
@@ -84,10 +85,11 @@ def main():
     print(f"Statement: \"{SAMPLE_STATEMENT}\"")
     print()
 
-    sample_analysis = analyzer.create_assignment_format(
-        TRANSCRIPT,
-        sample_statement=SAMPLE_STATEMENT
-    )
+    with trace("sentiment_intent.sample_statement") as sample_trace:
+        sample_analysis = analyzer.create_assignment_format(
+            TRANSCRIPT,
+            sample_statement=SAMPLE_STATEMENT
+        )
     
     print("Result")
     print(json.dumps(sample_analysis, indent=2))
@@ -98,7 +100,8 @@ def main():
     print("=" * 70)
     print()
 
-    full_analysis = analyzer.create_assignment_format(TRANSCRIPT)
+    with trace("sentiment_intent.full_conversation") as full_trace:
+        full_analysis = analyzer.create_assignment_format(TRANSCRIPT)
 
     print("=" * 70)
     print("ANALYSIS SUMMARY")
@@ -109,6 +112,9 @@ def main():
         print(f"Dominant Sentiment: {full_analysis['Overall_Analysis']['Dominant_Sentiment']}")
         print(f"Patient Statements Analyzed: {len(full_analysis['All_Patient_Analyses'])}")
     print()
+    print(sample_trace.format())
+    print(full_trace.format())
+    print()
 
     print("=" * 70)
     print("SAVING OUTPUTS")
@@ -122,6 +128,9 @@ def main():
         json.dump(full_analysis, f, indent=2, ensure_ascii=False)
     print("Saved: outputs/sentiment_full_analysis.json")
 
+    dump_trace([sample_trace, full_trace], 'outputs/sentiment_trace.json')
+    print("Saved: outputs/sentiment_trace.json")
+
     print()
     print("=" * 70)
     print("SENTIMENT & INTENT ANALYSIS COMPLETE !")
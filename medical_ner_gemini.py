@@ -1,77 +1,335 @@
 import os
-import google.generativeai as genai
+import re
+import copy
 import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from gemini_client import get_client
+from json_repair import IncrementalJSONParser
+from rate_limiter import RateLimitExceeded
+from structured_output import SchemaValidationError, array, number, obj, parse_structured, string
+from tracing import traced
+from transcript_parser import LINE_PATTERN, is_turn_start
 
 # Load api key
 load_dotenv()
 
-class GeminiMedicalNER:
-    def __init__(self, api_key=None):
-        if api_key == None:
-            api_key = os.getenv("GEMINI_API_KEY")
-        
-        genai.configure(api_key=api_key)
-        
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+# Transcripts longer than this are extracted chunk by chunk
+DEFAULT_CHUNK_THRESHOLD_CHARS = int(os.getenv("NER_CHUNK_THRESHOLD_CHARS", "12000"))
+DEFAULT_CHUNK_CHARS = int(os.getenv("NER_CHUNK_CHARS", "8000"))
+DEFAULT_CHUNK_OVERLAP_TURNS = 2
 
-        # model configuration
-        self.generation_config = {
-            "temperature": 0.2,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 2048
-        }
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
 
+_text = string(nullable=True)
 
-    def extract_entities(self, transcript):
-        prompt = f"""You are a medical NLP expert. Extract structured medical information from the following physician-patient conversation transcript.
+ENTITIES_RESPONSE_SCHEMA = obj({
+    "Patient_Name": _text,
+    "Symptoms": array(obj({
+        "symptom": string(),
+        "severity": _text,
+        "duration": _text,
+        "body_part": _text,
+        "status": _text
+    }, required=["symptom"])),
+    "Diagnosis": _text,
+    "Treatment": array(obj({
+        "treatment_type": _text,
+        "details": _text,
+        "provider": _text
+    })),
+    "Current_Status": _text,
+    "Prognosis": _text,
+    "Accident_Details": obj({
+        "date": _text,
+        "location": _text,
+        "mechanism": _text,
+        "immediate_impact": _text
+    }, nullable=True),
+    "Physical_Examination": obj({
+        "findings": array(string()),
+        "mobility": _text,
+        "tenderness": _text
+    }, nullable=True),
+    "Timeline": array(obj({
+        "event": string(),
+        "timepoint": _text,
+        "significance": _text
+    }, required=["event"]))
+})
 
-TRANSCRIPT:
-{transcript}
+_field_confidence = obj({
+    "value": _text,
+    "confidence": number(),
+    "source": _text,
+    "evidence": _text
+}, nullable=True)
 
-Extract the following information and return ONLY a valid JSON object (no markdown, no code blocks, just pure JSON):
+CONFIDENCE_RESPONSE_SCHEMA = obj({
+    "Patient_Name": _field_confidence,
+    "Symptoms": array(obj({
+        "symptom": string(),
+        "confidence": number(),
+        "evidence": _text
+    }, required=["symptom", "confidence"])),
+    "Diagnosis": _field_confidence,
+    "Treatment": array(obj({
+        "treatment": string(),
+        "confidence": number(),
+        "evidence": _text
+    }, required=["treatment", "confidence"])),
+    "Current_Status": _field_confidence,
+    "Prognosis": _field_confidence
+})
 
-{{
+KEYWORD_CATEGORIES = ["symptom", "diagnosis", "treatment", "body_part", "temporal", "severity_indicator", "outcome"]
+
+_keyword = obj({
+    "term": string(),
+    "category": string(enum=KEYWORD_CATEGORIES),
+    "importance": string(enum=["high", "medium", "low"]),
+    "context": _text
+}, required=["term", "category"])
+
+KEYWORDS_RESPONSE_SCHEMA = obj({"keywords": array(_keyword)}, required=["keywords"])
+
+COMBINED_RESPONSE_SCHEMA = obj({
+    "entities": ENTITIES_RESPONSE_SCHEMA,
+    "confidence": CONFIDENCE_RESPONSE_SCHEMA,
+    "keywords": array(_keyword)
+}, required=["entities"])
+
+ENTITY_TEMPLATE = """{
   "Patient_Name": "Full name of the patient",
   "Symptoms": [
-    {{
+    {
       "symptom": "name of symptom",
       "severity": "mild/moderate/severe",
       "duration": "how long",
       "body_part": "affected area",
       "status": "current/resolved/improving"
-    }}
+    }
   ],
   "Diagnosis": "Primary diagnosis given by physician",
   "Treatment": [
-    {{
+    {
       "treatment_type": "physiotherapy/medication/procedure",
       "details": "specific details like '10 sessions of physiotherapy'",
       "provider": "where treatment was given (if mentioned)"
-    }}
+    }
   ],
   "Current_Status": "Patient's current condition description",
   "Prognosis": "Expected outcome or recovery timeline",
-  "Accident_Details": {{
+  "Accident_Details": {
     "date": "when accident occurred",
     "location": "where it happened",
     "mechanism": "how injury occurred",
     "immediate_impact": "immediate injuries"
-  }},
-  "Physical_Examination": {{
+  },
+  "Physical_Examination": {
     "findings": ["list of examination findings"],
     "mobility": "assessment of range of motion",
     "tenderness": "any tender areas noted"
-  }},
+  },
   "Timeline": [
-    {{
+    {
       "event": "description of event",
       "timepoint": "when it occurred",
       "significance": "why it matters"
-    }}
+    }
   ]
-}}
+}"""
+
+
+def split_turns(transcript):
+    turns = []
+    current = []
+
+    for line in transcript.strip().split("\n"):
+        if is_turn_start(line) and current:
+            turns.append("\n".join(current))
+            current = []
+        current.append(line)
+
+    if current:
+        turns.append("\n".join(current))
+    return turns
+
+
+def split_long_turn(turn, max_chars=DEFAULT_CHUNK_CHARS):
+    # A turn longer than a chunk is split at sentence ends; each later piece
+    # repeats the speaker label so the model still knows who is talking
+    if len(turn) <= max_chars:
+        return [turn]
+
+    speaker = LINE_PATTERN.match(turn.split("\n", 1)[0]).group("speaker")
+    label = f"{speaker.strip()}: " if speaker else ""
+    budget = max(max_chars - len(label), 1)
+
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_BREAK.split(turn.strip()):
+        # A single sentence longer than a chunk is cut at the limit
+        while len(sentence) > budget:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:budget])
+            sentence = sentence[budget:].lstrip()
+        if current and len(current) + 1 + len(sentence) > budget:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+
+    return pieces[:1] + [label + piece for piece in pieces[1:]]
+
+
+def chunk_transcript(transcript, max_chars=DEFAULT_CHUNK_CHARS, overlap_turns=DEFAULT_CHUNK_OVERLAP_TURNS):
+    # Chunks break on turn boundaries (or sentence ends inside an oversized
+    # turn) and repeat the last few turns of the previous chunk
+    turns = [piece for turn in split_turns(transcript) for piece in split_long_turn(turn, max_chars)]
+    chunks = []
+    current = []
+    size = 0
+
+    for turn in turns:
+        if current and size + len(turn) > max_chars:
+            chunks.append("\n".join(current))
+            current = current[-overlap_turns:] if overlap_turns else []
+            size = sum(len(t) + 1 for t in current)
+        current.append(turn)
+        size += len(turn) + 1
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _present(value):
+    return value is not None and str(value).strip().lower() not in ("", "none", "null")
+
+
+def _norm(value):
+    return str(value).strip().lower() if _present(value) else ""
+
+
+def merge_entities(partials):
+    # Chunks whose extraction failed are listed under "metadata", so callers
+    # can tell a partial result from a complete one
+    failed = [i for i, p in enumerate(partials) if not isinstance(p, dict)]
+    chunks = len(partials)
+    partials = [p for p in partials if isinstance(p, dict)]
+    if not partials:
+        return None
+
+    merged = {
+        "Patient_Name": None,
+        "Symptoms": [],
+        "Diagnosis": None,
+        "Treatment": [],
+        "Current_Status": None,
+        "Prognosis": None,
+        "Accident_Details": {},
+        "Physical_Examination": {},
+        "Timeline": []
+    }
+    symptoms = {}
+    treatments = set()
+    events = set()
+    findings = set()
+
+    for partial in partials:
+        # Identity and diagnosis come from the first chunk that states them,
+        # status and prognosis from the latest one
+        for field in ("Patient_Name", "Diagnosis"):
+            if not _present(merged[field]) and _present(partial.get(field)):
+                merged[field] = partial[field]
+        for field in ("Current_Status", "Prognosis"):
+            if _present(partial.get(field)):
+                merged[field] = partial[field]
+
+        for symptom in partial.get("Symptoms") or []:
+            if not isinstance(symptom, dict):
+                symptom = {"symptom": str(symptom)}
+            key = (_norm(symptom.get("symptom")), _norm(symptom.get("body_part")))
+            if key not in symptoms:
+                symptoms[key] = dict(symptom)
+                merged["Symptoms"].append(symptoms[key])
+                continue
+            existing = symptoms[key]
+            for field, value in symptom.items():
+                if _present(value) and (field == "status" or not _present(existing.get(field))):
+                    existing[field] = value
+
+        for treatment in partial.get("Treatment") or []:
+            if not isinstance(treatment, dict):
+                treatment = {"details": str(treatment)}
+            key = (_norm(treatment.get("treatment_type")), _norm(treatment.get("details")))
+            if key not in treatments:
+                treatments.add(key)
+                merged["Treatment"].append(treatment)
+
+        for section in ("Accident_Details", "Physical_Examination"):
+            for field, value in (partial.get(section) or {}).items():
+                if field == "findings":
+                    for finding in value or []:
+                        if _norm(finding) not in findings:
+                            findings.add(_norm(finding))
+                            merged[section].setdefault("findings", []).append(finding)
+                elif _present(value) and not _present(merged[section].get(field)):
+                    merged[section][field] = value
+
+        # Chunks are in transcript order, so first mentions keep the timeline ordered
+        for event in partial.get("Timeline") or []:
+            if not isinstance(event, dict):
+                event = {"event": str(event)}
+            key = (_norm(event.get("event")), _norm(event.get("timepoint")))
+            if key not in events:
+                events.add(key)
+                merged["Timeline"].append(event)
+
+    merged["metadata"] = {"chunks": chunks, "failed_chunks": failed, "partial": bool(failed)}
+    return merged
+
+
+class GeminiMedicalNER:
+    def __init__(self, api_key=None, client=None, chunk_threshold_chars=DEFAULT_CHUNK_THRESHOLD_CHARS,
+                 chunk_chars=DEFAULT_CHUNK_CHARS, chunk_overlap_turns=DEFAULT_CHUNK_OVERLAP_TURNS):
+        if api_key == None:
+            api_key = os.getenv("GEMINI_API_KEY")
+        
+        self.client = client or get_client('gemini-2.5-flash-lite', api_key=api_key)
+        self.model = self.client.model
+
+        # model configuration
+        self.generation_config = {
+            "temperature": 0.2,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 2048
+        }
+
+        # The combined extraction returns all three sections in one response
+        self.combined_generation_config = dict(self.generation_config, max_output_tokens=4096)
+
+        self.chunk_threshold_chars = chunk_threshold_chars
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap_turns = chunk_overlap_turns
+
+
+    def _entities_prompt(self, transcript):
+        return f"""You are a medical NLP expert. Extract structured medical information from the following physician-patient conversation transcript.
+
+TRANSCRIPT:
+{transcript}
+
+Extract the following information and return ONLY a valid JSON object (no markdown, no code blocks, just pure JSON):
+
+{ENTITY_TEMPLATE}
 
 IMPORTANT RULES:
 1. Extract ONLY information explicitly stated in the transcript
@@ -82,37 +340,127 @@ IMPORTANT RULES:
 6. For symptoms, identify severity from context (e.g., "really bad" = severe)
 
 """
+
+    @traced("json_repair")
+    def _parse_entities(self, response_text):
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=self.generation_config
-            )
-            
-            # Parse JSON from response
-            response_text = response.text.strip()
-
-            # Remove markdown code if present
-            if response_text.startswith("```json"):
-                response_text = response_text.replace("```json", "").replace("```", "").strip()
-            elif response_text.startswith("```"):
-                response_text.replace("```", "").strip()
-            
-            # Parse JSON
-            extracted_data = json.loads(response_text)
-
-            return extracted_data
+            return parse_structured(response_text, ENTITIES_RESPONSE_SCHEMA)
         
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, SchemaValidationError) as e:
             print(f"JSON parsing error!: {e}")
             print(f"Raw response: {response_text}")
             return None
+
+    def needs_chunking(self, transcript):
+        return bool(self.chunk_threshold_chars) and len(transcript) > self.chunk_threshold_chars
+
+    def extract_entities(self, transcript):
+        if self.needs_chunking(transcript):
+            return self.extract_entities_chunked(transcript)
+        return self._extract_entities_single(transcript)
+
+    async def extract_entities_async(self, transcript):
+        if self.needs_chunking(transcript):
+            return await self.extract_entities_chunked_async(transcript)
+        return await self._extract_entities_single_async(transcript)
+
+    def _chunks(self, transcript):
+        return chunk_transcript(transcript, max_chars=self.chunk_chars, overlap_turns=self.chunk_overlap_turns)
+
+    @traced("ner.extract_entities_chunked")
+    def extract_entities_chunked(self, transcript):
+        chunks = self._chunks(transcript)
+
+        # Each worker runs in a copy of the caller's context so spans and usage still roll up
+        with ThreadPoolExecutor(max_workers=min(len(chunks), self.client.max_concurrency)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._extract_entities_single, chunk)
+                for chunk in chunks
+            ]
+            partials = [future.result() for future in futures]
+
+        return merge_entities(partials)
+
+    @traced("ner.extract_entities_chunked")
+    async def extract_entities_chunked_async(self, transcript):
+        partials = await asyncio.gather(*[
+            self._extract_entities_single_async(chunk)
+            for chunk in self._chunks(transcript)
+        ])
+        return merge_entities(partials)
+
+    def _extract_entities_single(self, transcript):
+        try:
+            response_text = self.client.generate(
+                self._entities_prompt(transcript),
+                generation_config=self.generation_config,
+                operation="ner.extract_entities",
+                response_schema=ENTITIES_RESPONSE_SCHEMA
+            )
+            return self._parse_entities(response_text)
+        
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error: {e}")
+            return None
+
+    async def _extract_entities_single_async(self, transcript):
+        try:
+            response_text = await self.client.generate_async(
+                self._entities_prompt(transcript),
+                generation_config=self.generation_config,
+                operation="ner.extract_entities",
+                response_schema=ENTITIES_RESPONSE_SCHEMA
+            )
+            return self._parse_entities(response_text)
+        
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error: {e}")
             return None
         
 
-    def extract_with_confidence(self, transcript):
-        prompt = f"""You are a medical NLP expert. Extract medical information from this transcript and rate your confidence for each extraction.
+    def extract_entities_stream(self, transcript):
+        # Yields the entities filled in so far each time a field or list item
+        # completes; the last item is the parsed, validated result
+        if self.needs_chunking(transcript):
+            # Chunks are merged at the end, so there is nothing to show early
+            yield self.extract_entities_chunked(transcript)
+            return
+
+        parser = IncrementalJSONParser(max_depth=2)
+        partial = {}
+        try:
+            for chunk in self.client.generate_stream(
+                self._entities_prompt(transcript),
+                generation_config=self.generation_config,
+                operation="ner.extract_entities",
+                response_schema=ENTITIES_RESPONSE_SCHEMA
+            ):
+                updated = False
+                for path, value in parser.feed(chunk):
+                    if len(path) == 1:
+                        partial[path[0]] = value
+                    elif isinstance(path[1], int):
+                        partial.setdefault(path[0], []).append(value)
+                    else:
+                        continue
+                    updated = True
+                if updated:
+                    yield copy.deepcopy(partial)
+
+            yield self._parse_entities(parser.buffer)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error: {e}")
+            yield None
+
+    def _confidence_prompt(self, transcript):
+        return f"""You are a medical NLP expert. Extract medical information from this transcript and rate your confidence for each extraction.
         TRANSCRIPT:
 {transcript}
 
@@ -144,28 +492,46 @@ Rate confidence based on:
 Return ONLY valid JSON.
 
 """
+
+    @traced("json_repair")
+    def _parse_confidence(self, response_text):
+        return parse_structured(response_text, CONFIDENCE_RESPONSE_SCHEMA)
+
+    def extract_with_confidence(self, transcript):
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=self.generation_config
+            response_text = self.client.generate(
+                self._confidence_prompt(transcript),
+                generation_config=self.generation_config,
+                operation="ner.extract_with_confidence",
+                response_schema=CONFIDENCE_RESPONSE_SCHEMA
             )
+            return self._parse_confidence(response_text)
+        
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error in confidence extraction: {e}")
+            return None
 
-            response_text = response.text.strip()
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
-            
-            return json.loads(response_text)
+    async def extract_with_confidence_async(self, transcript):
+        try:
+            response_text = await self.client.generate_async(
+                self._confidence_prompt(transcript),
+                generation_config=self.generation_config,
+                operation="ner.extract_with_confidence",
+                response_schema=CONFIDENCE_RESPONSE_SCHEMA
+            )
+            return self._parse_confidence(response_text)
         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error in confidence extraction: {e}")
             return None
         
 
-    def generate_keyword_extraction(self, transcript):
-        prompt = f"""Extract the most important medical keywords and phrases from this transcript.
+    def _keywords_prompt(self, transcript):
+        return f"""Extract the most important medical keywords and phrases from this transcript.
         TRANSCRIPT:
 {transcript}
 
@@ -192,20 +558,122 @@ Categories: symptom, diagnosis, treatment, body_part, temporal, severity_indicat
 
 Return ONLY valid JSON.
 """
+
+    @traced("json_repair")
+    def _parse_keywords(self, response_text):
+        return parse_structured(response_text, KEYWORDS_RESPONSE_SCHEMA)
+
+    def generate_keyword_extraction(self, transcript):
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-
-            # Clean response
-            if "```" in response_text:
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
-            
-            return json.loads(response_text)
+            response_text = self.client.generate(
+                self._keywords_prompt(transcript),
+                operation="ner.generate_keyword_extraction",
+                response_schema=KEYWORDS_RESPONSE_SCHEMA
+            )
+            return self._parse_keywords(response_text)
         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error in keyword extraction: {e}")
             return None
 
+    async def generate_keyword_extraction_async(self, transcript):
+        try:
+            response_text = await self.client.generate_async(
+                self._keywords_prompt(transcript),
+                operation="ner.generate_keyword_extraction",
+                response_schema=KEYWORDS_RESPONSE_SCHEMA
+            )
+            return self._parse_keywords(response_text)
+        
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error in keyword extraction: {e}")
+            return None
+
+    def _combined_prompt(self, transcript):
+        return f"""You are a medical NLP expert. From the physician-patient conversation transcript below, produce the entities, confidence and keywords sections in a single JSON object.
+
+TRANSCRIPT:
+{transcript}
+
+Return ONLY a valid JSON object (no markdown, no code blocks) with exactly these three keys:
+
+{{
+  "entities": {ENTITY_TEMPLATE},
+  "confidence": {{
+    "Patient_Name": {{
+      "value": "name",
+      "confidence": 0.95,
+      "evidence": "quote from transcript supporting this"
+    }},
+    "Symptoms": [
+      {{
+        "symptom": "symptom name",
+        "confidence": 0.9,
+        "evidence": "quote from transcript supporting this"
+      }}
+    ],
+    ... (one entry for every field in "entities")
+  }},
+  "keywords": [
+    {{
+      "term": "whiplash injury",
+      "category": "diagnosis",
+      "importance": "high",
+      "context": "brief context where it appears"
+    }}
+  ]
+}}
+
+RULES:
+1. "entities": extract ONLY information explicitly stated in the transcript; use null when missing
+2. "confidence": rate each extracted field from 0.0 to 1.0 (1.0 = explicitly stated, 0.6-0.7 = reasonable inference, <0.4 = highly uncertain) and quote the supporting evidence
+3. "keywords": the most important medical terms; categories are symptom, diagnosis, treatment, body_part, temporal, severity_indicator, outcome
+4. Return ONLY valid JSON, nothing else
+
+"""
+
+    @traced("json_repair")
+    def _parse_combined(self, response_text):
+        combined = parse_structured(response_text, COMBINED_RESPONSE_SCHEMA)
+        keywords = combined.get("keywords")
+        if isinstance(keywords, list):
+            keywords = {"keywords": keywords}
+
+        return combined.get("entities"), combined.get("confidence"), keywords
+
+    def extract_combined(self, transcript):
+        # One request instead of three full-transcript uploads
+        try:
+            response_text = self.client.generate(
+                self._combined_prompt(transcript),
+                generation_config=self.combined_generation_config,
+                operation="ner.extract_combined",
+                response_schema=COMBINED_RESPONSE_SCHEMA
+            )
+            return self._parse_combined(response_text)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error in combined extraction: {e}")
+            return None
+
+    async def extract_combined_async(self, transcript):
+        try:
+            response_text = await self.client.generate_async(
+                self._combined_prompt(transcript),
+                generation_config=self.combined_generation_config,
+                operation="ner.extract_combined",
+                response_schema=COMBINED_RESPONSE_SCHEMA
+            )
+            return self._parse_combined(response_text)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error in combined extraction: {e}")
+            return None
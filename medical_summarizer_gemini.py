@@ -1,8 +1,20 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from medical_ner_gemini import GeminiMedicalNER
+from tracing import span, traced
+from usage import attach_usage, new_tracker, reports_usage, tracked_iter
+
+EXTRACTION_MODES = ("combined", "parallel", "sequential")
+
 
 class GeminiMedicalSummarizer:
-    def __init__(self, api_key=None):
-        self.extractor = GeminiMedicalNER(api_key)
+    def __init__(self, api_key=None, client=None, extraction_mode="combined"):
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"extraction_mode must be one of {EXTRACTION_MODES}")
+
+        self.extractor = GeminiMedicalNER(api_key, client=client)
+        self.extraction_mode = extraction_mode
 
     def format_symptom(self, symptom_dict):
         if isinstance(symptom_dict, str):
@@ -62,16 +74,86 @@ class GeminiMedicalSummarizer:
         
         return ''.join(result_parts)
 
-    def create_comprehensive_summary(self, transcript):
-        print("Extracting medical entities...")
-        entities = self.extractor.extract_entities(transcript)
+    @reports_usage
+    @traced("ner.create_comprehensive_summary")
+    def create_comprehensive_summary(self, transcript, extraction_mode=None):
+        mode = extraction_mode or self.extraction_mode
+
+        if mode == "combined" and self.extractor.needs_chunking(transcript):
+            # A single combined response would truncate on long transcripts
+            mode = "parallel"
+
+        if mode == "combined":
+            with span("extract_combined"):
+                combined = self.extractor.extract_combined(transcript)
+            if combined is not None and combined[0] is not None:
+                return self._combine_summary(*combined, extraction_mode=mode)
+            # Fall back to separate requests if the single response is unusable
+            mode = "parallel"
+
+        if mode == "parallel":
+            with span("extract_parallel"):
+                entities, confidence_data, keywords = self._extract_parallel(transcript)
+        else:
+            with span("extract_entities"):
+                entities = self.extractor.extract_entities(transcript)
+
+            with span("extract_with_confidence"):
+                confidence_data = self.extractor.extract_with_confidence(transcript)
+
+            with span("extract_keywords"):
+                keywords = self.extractor.generate_keyword_extraction(transcript)
+
+        return self._combine_summary(entities, confidence_data, keywords, extraction_mode=mode)
+    
+    def _extract_parallel(self, transcript):
+        extractions = (
+            self.extractor.extract_entities,
+            self.extractor.extract_with_confidence,
+            self.extractor.generate_keyword_extraction
+        )
+
+        # Each worker runs in a copy of the caller's context so spans and usage still roll up
+        with ThreadPoolExecutor(max_workers=len(extractions)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, extract, transcript)
+                for extract in extractions
+            ]
+            return tuple(future.result() for future in futures)
+    
+    @reports_usage
+    @traced("ner.create_comprehensive_summary")
+    async def create_comprehensive_summary_async(self, transcript, extraction_mode=None):
+        mode = extraction_mode or self.extraction_mode
+
+        if mode == "combined" and self.extractor.needs_chunking(transcript):
+            # A single combined response would truncate on long transcripts
+            mode = "parallel"
 
-        print("Extracting with confidence scores...")
-        confidence_data = self.extractor.extract_with_confidence(transcript)
+        if mode == "combined":
+            with span("extract_combined"):
+                combined = await self.extractor.extract_combined_async(transcript)
+            if combined is not None and combined[0] is not None:
+                return self._combine_summary(*combined, extraction_mode=mode)
+            mode = "parallel"
 
-        print("Extracting medical keywords...")
-        keywords = self.extractor.generate_keyword_extraction(transcript)
+        if mode == "parallel":
+            # The three extractions are independent, so send them together
+            with span("extract_parallel"):
+                entities, confidence_data, keywords = await asyncio.gather(
+                    self.extractor.extract_entities_async(transcript),
+                    self.extractor.extract_with_confidence_async(transcript),
+                    self.extractor.generate_keyword_extraction_async(transcript)
+                )
+        else:
+            entities = await self.extractor.extract_entities_async(transcript)
+            confidence_data = await self.extractor.extract_with_confidence_async(transcript)
+            keywords = await self.extractor.generate_keyword_extraction_async(transcript)
 
+        return self._combine_summary(entities, confidence_data, keywords, extraction_mode=mode)
+    
+    @traced("aggregate")
+    def _combine_summary(self, entities, confidence_data, keywords, extraction_mode="sequential"):
         # Combine all extractions
         comprehensive_summary = {
             "basic_extraction": entities,
@@ -79,15 +161,55 @@ class GeminiMedicalSummarizer:
             "keywords": keywords,
             "metadata": {
                 "extraction_method": "Generative Model",
+                "extraction_mode": extraction_mode,
                 "model_version": "Gemini-2.5-flash-lite"
             }
         }
 
         return comprehensive_summary
     
-    def create_assignment_format(self, transcript):
-        entities = self.extractor.extract_entities(transcript)
+    @reports_usage
+    @traced("ner.create_assignment_format")
+    def create_assignment_format(self, transcript, entities=None):
+        # Entities extracted elsewhere (e.g. by the visit pipeline) are only formatted
+        if entities is None:
+            entities = self.extractor.extract_entities(transcript)
 
+        return self._format_assignment(entities)
+    
+    @reports_usage
+    @traced("ner.create_assignment_format")
+    async def create_assignment_format_async(self, transcript, entities=None):
+        if entities is None:
+            entities = await self.extractor.extract_entities_async(transcript)
+
+        return self._format_assignment(entities)
+    
+    def create_assignment_format_stream(self, transcript):
+        # Yields the fields extracted so far as they arrive, then the same
+        # result create_assignment_format would return
+        tracker = new_tracker()
+        entities = None
+        for entities in tracked_iter(self.extractor.extract_entities_stream(transcript), tracker):
+            if entities is not None:
+                yield self._format_partial(entities)
+
+        yield attach_usage(self._format_assignment(entities), tracker)
+
+    def _format_partial(self, entities):
+        partial = {
+            key: entities[key]
+            for key in ("Patient_Name", "Diagnosis", "Current_Status", "Prognosis")
+            if key in entities
+        }
+        if "Symptoms" in entities:
+            partial["Symptoms"] = [self.format_symptom(s) for s in entities["Symptoms"] or []]
+        if "Treatment" in entities:
+            partial["Treatment"] = [self.format_treatment(t) for t in entities["Treatment"] or []]
+        return partial
+
+    @traced("aggregate")
+    def _format_assignment(self, entities):
         if entities is None:
             print("Failed to extract entities")
             return None
@@ -120,4 +242,8 @@ class GeminiMedicalSummarizer:
                 else:
                     assignment_output["Treatment"].append(str(treatment))
         
+        # Chunked extractions report which chunks failed
+        if entities.get("metadata"):
+            assignment_output["metadata"] = dict(entities["metadata"])
+        
         return assignment_output
\ No newline at end of file
@@ -0,0 +1,161 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 0 disables the corresponding limit
+DEFAULT_RPM = float(os.getenv("GEMINI_RPM", "60"))
+DEFAULT_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+DEFAULT_MAX_THROTTLE_RETRIES = int(os.getenv("GEMINI_MAX_THROTTLE_RETRIES", "8"))
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def is_rate_limit_error(error):
+    if getattr(error, "code", None) == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+def estimate_tokens(prompt, generation_config=None):
+    # Roughly four characters per token for English prompts
+    prompt_tokens = math.ceil(len(prompt) / 4)
+
+    max_output = None
+    if isinstance(generation_config, dict):
+        max_output = generation_config.get("max_output_tokens")
+    elif generation_config is not None:
+        max_output = getattr(generation_config, "max_output_tokens", None)
+
+    return prompt_tokens + (max_output or 256)
+
+
+class _TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        if not self.capacity:
+            return 0.0
+
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, min_in_flight=1,
+                 base_backoff=1.0, max_backoff=60.0, max_throttle_retries=DEFAULT_MAX_THROTTLE_RETRIES):
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.concurrency_limit = float(max_in_flight)
+        self.in_flight = 0
+
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_throttle_retries = max_throttle_retries
+        self._backoff = base_backoff
+        self._blocked_until = 0.0
+
+        self.requests = 0
+        self.throttled = 0
+        self.queued_seconds = 0.0
+
+        self._cond = threading.Condition()
+
+    def _reserve(self, tokens):
+        now = time.monotonic()
+
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.in_flight >= max(int(self.concurrency_limit), self.min_in_flight):
+            return None
+
+        delay = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+        if delay > 0:
+            return delay
+
+        self._requests.consume(1)
+        self._tokens.consume(tokens)
+        self.in_flight += 1
+        self.requests += 1
+        return 0.0
+
+    def acquire(self, tokens=0):
+        started = time.monotonic()
+
+        with self._cond:
+            while True:
+                delay = self._reserve(tokens)
+                if delay == 0:
+                    self.queued_seconds += time.monotonic() - started
+                    return
+                self._cond.wait(timeout=delay)
+
+    async def acquire_async(self, tokens=0):
+        started = time.monotonic()
+
+        while True:
+            with self._cond:
+                delay = self._reserve(tokens)
+                if delay == 0:
+                    self.queued_seconds += time.monotonic() - started
+                    return
+            await asyncio.sleep(delay if delay is not None else 0.05)
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+
+            if throttled:
+                # Multiplicative decrease, then hold new requests back for a while
+                self.throttled += 1
+                self.concurrency_limit = max(float(self.min_in_flight), self.concurrency_limit / 2)
+                self._blocked_until = max(self._blocked_until, time.monotonic() + self._backoff)
+                self._backoff = min(self.max_backoff, self._backoff * 2)
+            else:
+                # Additive increase of roughly one slot per window of successes
+                self.concurrency_limit = min(
+                    float(self.max_in_flight),
+                    self.concurrency_limit + 1.0 / self.concurrency_limit
+                )
+                self._backoff = self.base_backoff
+
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "in_flight": self.in_flight,
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "queued_seconds": round(self.queued_seconds, 3)
+            }
@@ -1,12 +1,30 @@
-import google.generativeai as genai
+import asyncio
 import os
-import json
 import warnings
+from emotion_lexicon import EmotionMatcher, default_lexicon, load_lexicon
+from gemini_client import get_client
+from rate_limiter import RateLimitExceeded
+from sentiment_intent_classifier import SENTIMENT_CATEGORIES
+from structured_output import array, integer, number, obj, parse_structured, string
+from transcript_parser import is_patient
 warnings.filterwarnings(action='ignore')
 
+SENTIMENT_RESPONSE_SCHEMA = obj({
+    "sentiment": string(enum=SENTIMENT_CATEGORIES),
+    "confidence": number(),
+    "reasoning": string()
+}, required=["sentiment", "confidence"])
+
+SENTIMENT_BATCH_RESPONSE_SCHEMA = array(obj({
+    "index": integer(),
+    "sentiment": string(enum=SENTIMENT_CATEGORIES),
+    "confidence": number(),
+    "reasoning": string()
+}, required=["index", "sentiment", "confidence"]))
+
 
 class MedicalSentimentAnalyzer:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, client=None, emotion_lexicon=None):
         print(f"Loading sentiment model: gemini-2.5-flash-lite")
         
         if api_key is None:
@@ -15,24 +33,18 @@ class MedicalSentimentAnalyzer:
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found. Please set it as an environment variable or pass it to the constructor.")
         
-        genai.configure(api_key=api_key)
+        self.client = client or get_client('gemini-2.0-flash-lite', api_key=api_key)
+        self.model = self.client.model
         
-        self.model = genai.GenerativeModel('gemini-2.0-flash-lite')
+        # Built once; emotion_lexicon is a dict, "default"/"extended" or a JSON path
+        lexicon = load_lexicon(emotion_lexicon) if emotion_lexicon else default_lexicon()
+        self.emotion_matcher = EmotionMatcher(lexicon)
         
         print(f"Gemini sentiment model loaded successfully\n")
     
     
-    def analyze_sentiment(self, text):
-        if not text or len(text.strip()) == 0:
-            return {
-                "text": text,
-                "sentiment": "Neutral",
-                "confidence": 0.0,
-                "raw_label": None
-            }
-        
-        # Create prompt for Gemini
-        prompt = f"""Analyze the sentiment of the following medical patient statement and classify it into one of these categories:
+    def _sentiment_prompt(self, text):
+        return f"""Analyze the sentiment of the following medical patient statement and classify it into one of these categories:
 - Reassured: Patient feels confident, positive, or relieved (high positivity)
 - Neutral: Patient is calm, matter-of-fact, or shows mild emotions
 - Concerned: Patient shows moderate worry or uncertainty
@@ -46,52 +58,245 @@ Respond ONLY with a JSON object in this exact format (no markdown, no code block
     "confidence": 0.0 to 1.0,
     "reasoning": "brief explanation"
 }}"""
+    
+    
+    def analyze_sentiment(self, text):
+        if not text or len(text.strip()) == 0:
+            return self._empty_result(text)
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            response_text = self.client.generate(
+                self._sentiment_prompt(text),
+                operation="sentiment.analyze_sentiment",
+                response_schema=SENTIMENT_RESPONSE_SCHEMA
+            )
+            result = parse_structured(response_text, SENTIMENT_RESPONSE_SCHEMA)
             
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
+            return self._format_result(text, result)
             
-            result = json.loads(response_text)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error analyzing sentiment: {e}")
+            return self._error_result(text, e)
+    
+    
+    async def analyze_sentiment_async(self, text):
+        if not text or len(text.strip()) == 0:
+            return self._empty_result(text)
+        
+        try:
+            response_text = await self.client.generate_async(
+                self._sentiment_prompt(text),
+                operation="sentiment.analyze_sentiment",
+                response_schema=SENTIMENT_RESPONSE_SCHEMA
+            )
+            result = parse_structured(response_text, SENTIMENT_RESPONSE_SCHEMA)
             
-            return {
-                "text": text,
-                "sentiment": result.get("sentiment", "Neutral"),
-                "confidence": round(float(result.get("confidence", 0.5)), 3),
-                "raw_label": result.get("sentiment"),
-                "raw_score": round(float(result.get("confidence", 0.5)), 3),
-                "reasoning": result.get("reasoning", "")
-            }
+            return self._format_result(text, result)
             
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error analyzing sentiment: {e}")
-            return {
-                "text": text,
-                "sentiment": "Neutral",
-                "confidence": 0.5,
-                "raw_label": "NEUTRAL",
-                "raw_score": 0.5,
-                "reasoning": f"Error: {str(e)}"
-            }
+            return self._error_result(text, e)
     
     
-    def analyze_conversation(self, conversation):
+    def analyze_sentiment_batch(self, texts, batch_size=10):
         results = []
         
-        for turn in conversation:
-            if turn['speaker'] == 'Patient':
-                analysis = self.analyze_sentiment(turn['text'])
-                analysis['speaker'] = turn['speaker']
-                results.append(analysis)
+        for start in range(0, len(texts), batch_size):
+            results.extend(self._analyze_sentiment_chunk(texts[start:start + batch_size]))
+        
+        return results
+    
+    
+    async def analyze_sentiment_batch_async(self, texts, batch_size=10):
+        chunks = await asyncio.gather(*[
+            self._analyze_sentiment_chunk_async(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+        
+        return [result for chunk in chunks for result in chunk]
+    
+    
+    def _analyze_sentiment_chunk(self, texts):
+        results, pending = self._split_chunk(texts)
+        
+        if not pending:
+            return results
+        
+        parsed = {}
+        try:
+            response_text = self.client.generate(
+                self._batch_prompt(texts, pending),
+                operation="sentiment.analyze_sentiment_batch",
+                response_schema=SENTIMENT_BATCH_RESPONSE_SCHEMA
+            )
+            parsed = self._parse_batch(texts, pending, response_text)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error analyzing sentiment batch: {e}")
+        
+        # Fall back to one request per statement for entries that did not parse
+        for n, i in enumerate(pending, 1):
+            results[i] = parsed.get(n) or self.analyze_sentiment(texts[i])
+        
+        return results
+    
+    
+    async def _analyze_sentiment_chunk_async(self, texts):
+        results, pending = self._split_chunk(texts)
+        
+        if not pending:
+            return results
+        
+        parsed = {}
+        try:
+            response_text = await self.client.generate_async(
+                self._batch_prompt(texts, pending),
+                operation="sentiment.analyze_sentiment_batch",
+                response_schema=SENTIMENT_BATCH_RESPONSE_SCHEMA
+            )
+            parsed = self._parse_batch(texts, pending, response_text)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error analyzing sentiment batch: {e}")
+        
+        missing = [(n, i) for n, i in enumerate(pending, 1) if n not in parsed]
+        fallbacks = await asyncio.gather(*[
+            self.analyze_sentiment_async(texts[i]) for _, i in missing
+        ])
+        parsed.update({n: result for (n, _), result in zip(missing, fallbacks)})
+        
+        for n, i in enumerate(pending, 1):
+            results[i] = parsed[n]
         
         return results
     
     
+    def _split_chunk(self, texts):
+        results = [None] * len(texts)
+        pending = []
+        
+        for i, text in enumerate(texts):
+            if not text or len(text.strip()) == 0:
+                results[i] = self._empty_result(text)
+            else:
+                pending.append(i)
+        
+        return results, pending
+    
+    
+    def _batch_prompt(self, texts, pending):
+        statements = "\n".join(
+            f'{n}. "{texts[i]}"' for n, i in enumerate(pending, 1)
+        )
+        
+        return f"""Analyze the sentiment of each of the following medical patient statements and classify each one into one of these categories:
+- Reassured: Patient feels confident, positive, or relieved (high positivity)
+- Neutral: Patient is calm, matter-of-fact, or shows mild emotions
+- Concerned: Patient shows moderate worry or uncertainty
+- Anxious: Patient expresses significant worry, fear, or distress
+
+Patient statements:
+{statements}
+
+Respond ONLY with a JSON array containing exactly {len(pending)} objects, one per statement, in the same order (no markdown, no code blocks):
+[
+    {{
+        "index": 1,
+        "sentiment": "one of: Reassured, Neutral, Concerned, Anxious",
+        "confidence": 0.0 to 1.0,
+        "reasoning": "brief explanation"
+    }}
+]"""
+    
+    
+    def _parse_batch(self, texts, pending, response_text):
+        entries = parse_structured(response_text, SENTIMENT_BATCH_RESPONSE_SCHEMA)
+        
+        parsed = {}
+        for position, entry in enumerate(entries, 1):
+            try:
+                index = int(entry.get("index", position))
+                if 1 <= index <= len(pending) and index not in parsed:
+                    parsed[index] = self._format_result(texts[pending[index - 1]], entry)
+            except Exception:
+                continue
+        
+        return parsed
+    
+    
+    def _format_result(self, text, result):
+        return {
+            "text": text,
+            "sentiment": result.get("sentiment", "Neutral"),
+            "confidence": round(float(result.get("confidence", 0.5)), 3),
+            "raw_label": result.get("sentiment"),
+            "raw_score": round(float(result.get("confidence", 0.5)), 3),
+            "reasoning": result.get("reasoning", "")
+        }
+    
+    
+    def _empty_result(self, text):
+        return {
+            "text": text,
+            "sentiment": "Neutral",
+            "confidence": 0.0,
+            "raw_label": None
+        }
+    
+    
+    def _error_result(self, text, error):
+        return {
+            "text": text,
+            "sentiment": "Neutral",
+            "confidence": 0.5,
+            "raw_label": "NEUTRAL",
+            "raw_score": 0.5,
+            "reasoning": f"Error: {str(error)}"
+        }
+    
+    
+    def analyze_conversation(self, conversation, batch_size=10):
+        patient_turns = [turn for turn in conversation if is_patient(turn)]
+        
+        if batch_size and batch_size > 1:
+            results = self.analyze_sentiment_batch(
+                [turn['text'] for turn in patient_turns],
+                batch_size=batch_size
+            )
+        else:
+            results = [self.analyze_sentiment(turn['text']) for turn in patient_turns]
+        
+        for turn, analysis in zip(patient_turns, results):
+            analysis['speaker'] = turn['speaker']
+        
+        return results
+    
+    
+    async def analyze_conversation_async(self, conversation, batch_size=10):
+        patient_turns = [turn for turn in conversation if is_patient(turn)]
+        
+        if batch_size and batch_size > 1:
+            results = await self.analyze_sentiment_batch_async(
+                [turn['text'] for turn in patient_turns],
+                batch_size=batch_size
+            )
+        else:
+            results = await asyncio.gather(*[
+                self.analyze_sentiment_async(turn['text']) for turn in patient_turns
+            ])
+        
+        for turn, analysis in zip(patient_turns, results):
+            analysis['speaker'] = turn['speaker']
+        
+        return list(results)
+    
+    
     def get_overall_sentiment(self, sentiments):
         if not sentiments:
             return {
@@ -133,22 +338,5 @@ Respond ONLY with a JSON object in this exact format (no markdown, no code block
     
     
     def extract_emotional_indicators(self, text):
-        emotional_keywords = {
-            'anxious': ['worried', 'anxious', 'nervous', 'scared', 'afraid', 'concerned', 'stressed'],
-            'positive': ['better', 'good', 'great', 'relief', 'happy', 'glad', 'thankful', 'appreciate'],
-            'negative': ['bad', 'worse', 'terrible', 'awful', 'pain', 'hurt', 'difficult', 'struggle'],
-            'neutral': ['okay', 'fine', 'normal', 'alright', 'usual']
-        }
-        
-        text_lower = text.lower()
-        found_indicators = []
-        
-        for category, keywords in emotional_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    found_indicators.append({
-                        'keyword': keyword,
-                        'category': category
-                    })
-        
-        return found_indicators
\ No newline at end of file
+        # Every lexicon hit with its category and character span, in text order
+        return self.emotion_matcher.find(text)
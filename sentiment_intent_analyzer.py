@@ -1,23 +1,64 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from sentiment_analyzer import MedicalSentimentAnalyzer
 from intent_detector import GeminiIntentDetector  
+from rate_limiter import RateLimitExceeded
+from local_classifier import DEFAULT_THRESHOLD, LOCAL_TIER, REMOTE_TIER, LocalSentimentIntentClassifier
+from sentiment_intent_classifier import GeminiSentimentIntentClassifier
+from tracing import current_span, span, traced
+from transcript_parser import is_patient, parse_turns
+from usage import reports_usage
 import json
 import os
 
+EXECUTION_MODES = ("batch", "concurrent")
+
+
 class CompleteSentimentIntentAnalyzer:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, fused=True, batch_size=10, client=None, cascade=True, cascade_threshold=DEFAULT_THRESHOLD,
+                 execution_mode="batch"):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"execution_mode must be one of {EXECUTION_MODES}")
+        
         print("=" * 60)
         print("INITIALIZING HYBRID ANALYZERS")
         print("=" * 60)
         print("Architecture:")
         print("  • Sentiment: Gemini 2.0 Flash Lite")
         print("  • Intent: Gemini 2.0 Flash Lite")
+        if fused:
+            print(f"  • Fused single-pass classification (batch size {batch_size})")
+        if cascade:
+            print(f"  • Local first tier (confidence threshold {cascade_threshold})")
+        if execution_mode == "concurrent":
+            print("  • Concurrent per-turn requests")
         print()
         
         if api_key is None:
             api_key = os.getenv('GEMINI_API_KEY')
         
-        self.sentiment_analyzer = MedicalSentimentAnalyzer(api_key=api_key)
-        self.intent_detector = GeminiIntentDetector(api_key=api_key)
+        self.sentiment_analyzer = MedicalSentimentAnalyzer(api_key=api_key, client=client)
+        self.intent_detector = GeminiIntentDetector(api_key=api_key, client=client)
+        
+        self.fused = fused
+        self.batch_size = batch_size
+        self.execution_mode = execution_mode
+        if fused:
+            self.classifier = GeminiSentimentIntentClassifier(
+                api_key=api_key,
+                intent_categories=self.intent_detector.intent_categories,
+                client=client
+            )
+        
+        # Turns the local tier is confident about never reach Gemini
+        self.local_classifier = None
+        if cascade:
+            self.local_classifier = LocalSentimentIntentClassifier(
+                emotion_matcher=self.sentiment_analyzer.emotion_matcher,
+                intent_categories=self.intent_detector.intent_categories,
+                threshold=cascade_threshold
+            )
         
         print("=" * 60)
         print("ALL MODELS LOADED SUCCESSFULLY")
@@ -25,83 +66,248 @@ class CompleteSentimentIntentAnalyzer:
         print()
     
     def parse_conversation(self, transcript):
-        lines = transcript.strip().split('\n')
-        conversation = []
-        current_speaker = None
-        current_text = []
+        # transcript may also be an open file; it is read line by line
+        return parse_turns(transcript)
+    
+    def _parse_and_report(self, transcript, conversation=None):
+        if conversation is not None:
+            # Already parsed by the caller (e.g. the visit pipeline)
+            return conversation
+        
+        # A file object is parsed line by line; its size is not known up front
+        attributes = {"transcript_bytes": len(transcript.encode("utf-8"))} if isinstance(transcript, str) else {}
+        with span("parse", **attributes) as parse_span:
+            conversation = self.parse_conversation(transcript)
+            patient_count = sum(1 for t in conversation if is_patient(t))
+            parse_span.set(turns=len(conversation), patient_statements=patient_count)
+        
+        return conversation
+    
+    @traced("analyze_complete")
+    def analyze_complete(self, transcript, conversation=None):
+        conversation = self._parse_and_report(transcript, conversation)
+        decided, forwarded = self._local_tier(conversation)
+        
+        if self.execution_mode == "concurrent":
+            with span("analyze_turns_concurrent", turns=len(forwarded)):
+                remote = self._analyze_turns_concurrent(forwarded)
+        else:
+            remote = self._analyze_turns_batched(forwarded)
+        
+        sentiment_results, intent_results = self._merge_tiers(decided, remote, len(decided) + len(forwarded))
+        return self._combine_results(conversation, sentiment_results, intent_results)
+    
+    @traced("analyze_complete")
+    async def analyze_complete_async(self, transcript, conversation=None):
+        conversation = self._parse_and_report(transcript, conversation)
+        decided, forwarded = self._local_tier(conversation)
+        
+        if self.execution_mode == "concurrent":
+            with span("analyze_turns_concurrent", turns=len(forwarded)):
+                remote = await self._analyze_turns_concurrent_async(forwarded)
+        else:
+            remote = await self._analyze_turns_batched_async(forwarded)
+        
+        sentiment_results, intent_results = self._merge_tiers(decided, remote, len(decided) + len(forwarded))
+        return self._combine_results(conversation, sentiment_results, intent_results)
+    
+    def _local_tier(self, conversation):
+        # Returns {patient turn index: local result} and the (index, turn)
+        # pairs left for Gemini
+        patient_turns = list(enumerate(t for t in conversation if is_patient(t)))
+        if self.local_classifier is None:
+            return {}, patient_turns
+        
+        decided = {}
+        forwarded = []
+        with span("local_classify") as local_span:
+            for i, turn in patient_turns:
+                result = self.local_classifier.decide(turn['text'])
+                if result is None:
+                    forwarded.append((i, turn))
+                    continue
+                result['sentiment']['speaker'] = turn['speaker']
+                result['intent']['speaker'] = turn['speaker']
+                decided[i] = result
+            local_span.set(local=len(decided), forwarded=len(forwarded))
+        
+        return decided, forwarded
+    
+    def _analyze_turns_batched(self, forwarded):
+        turns = [turn for _, turn in forwarded]
         
-        for line in lines:
-            line = line.strip()
+        if self.fused:
+            # Classify sentiment and intent in one pass
+            with span("classify_sentiment_intent"):
+                sentiment_results, intent_results = self.classifier.analyze_conversation(
+                    turns,
+                    batch_size=self.batch_size
+                )
+        else:
+            with span("analyze_sentiment"):
+                sentiment_results = self.sentiment_analyzer.analyze_conversation(
+                    turns,
+                    batch_size=self.batch_size
+                )
             
-            # Skip empty lines
-            if not line:
-                continue
+            with span("detect_intent"):
+                intent_results = self.intent_detector.analyze_conversation(turns)
+        
+        return self._index_results(forwarded, sentiment_results, intent_results)
+    
+    async def _analyze_turns_batched_async(self, forwarded):
+        turns = [turn for _, turn in forwarded]
+        
+        if self.fused:
+            with span("classify_sentiment_intent"):
+                sentiment_results, intent_results = await self.classifier.analyze_conversation_async(
+                    turns,
+                    batch_size=self.batch_size
+                )
+        else:
+            # Sentiment and intent requests are independent, so run them together
+            with span("analyze_sentiment_and_intent"):
+                sentiment_results, intent_results = await asyncio.gather(
+                    self.sentiment_analyzer.analyze_conversation_async(
+                        turns,
+                        batch_size=self.batch_size
+                    ),
+                    self.intent_detector.analyze_conversation_async(turns)
+                )
+        
+        return self._index_results(forwarded, sentiment_results, intent_results)
+    
+    def _index_results(self, forwarded, sentiment_results, intent_results):
+        # The batch analyzers return one result per input turn, in input order
+        return {
+            i: (sentiment, intent)
+            for (i, _), sentiment, intent in zip(forwarded, sentiment_results, intent_results)
+        }
+    
+    def _turn_calls(self, run_async=False):
+        # The requests each turn needs; all of them are scheduled together
+        if self.fused:
+            return {"classification": self.classifier.classify_async if run_async else self.classifier.classify}
+        return {
+            "sentiment": self.sentiment_analyzer.analyze_sentiment_async if run_async else self.sentiment_analyzer.analyze_sentiment,
+            "intent": self.intent_detector.detect_intent_async if run_async else self.intent_detector.detect_intent
+        }
+    
+    def _call_clients(self):
+        # The client that makes each kind of request; in fused mode that is the classifier's
+        if self.fused:
+            return {"classification": self.classifier.client}
+        return {"sentiment": self.sentiment_analyzer.client, "intent": self.intent_detector.client}
+    
+    def _analyze_turns_concurrent(self, forwarded):
+        calls = self._turn_calls()
+        jobs = [(i, turn, kind) for i, turn in forwarded for kind in calls]
+        if not jobs:
+            return {}
+        
+        # The calling clients' concurrency limits and rate limiters still bound
+        # how many of these reach the API at once
+        clients = {id(client): client for client in self._call_clients().values()}.values()
+        workers = min(len(jobs), sum(client.max_concurrency for client in clients))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, calls[kind], turn['text'])
+                for _, turn, kind in jobs
+            ]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except RateLimitExceeded:
+                    raise
+                except Exception as e:
+                    outcomes.append(e)
+        
+        return self._collect_turns(jobs, outcomes)
+    
+    async def _analyze_turns_concurrent_async(self, forwarded):
+        calls = self._turn_calls(run_async=True)
+        jobs = [(i, turn, kind) for i, turn in forwarded for kind in calls]
+        
+        # One semaphore per calling client, sized to its concurrency limit
+        clients = self._call_clients()
+        limits = {id(client): asyncio.Semaphore(client.max_concurrency) for client in clients.values()}
+        
+        async def run(kind, text):
+            async with limits[id(clients[kind])]:
+                return await calls[kind](text)
+        
+        outcomes = await asyncio.gather(
+            *[run(kind, turn['text']) for _, turn, kind in jobs],
+            return_exceptions=True
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, RateLimitExceeded):
+                raise outcome
+        
+        return self._collect_turns(jobs, outcomes)
+    
+    def _collect_turns(self, jobs, outcomes):
+        # Results are keyed by turn index; a failed request only degrades its own turn
+        by_turn = {}
+        for (i, turn, kind), outcome in zip(jobs, outcomes):
+            by_turn.setdefault(i, (turn, {}))[1][kind] = outcome
+        
+        results = {}
+        for i, (turn, outcome) in by_turn.items():
+            text = turn['text']
+            for kind, value in outcome.items():
+                if isinstance(value, Exception):
+                    print(f"Error analyzing turn {i}: {value}")
             
-            if line.startswith('>'):
-                line = line[1:].strip()
+            if self.fused:
+                classification = outcome["classification"]
+                if isinstance(classification, Exception):
+                    classification = self.classifier._error_result(text, classification)
+                sentiment, intent = classification['sentiment'], classification['intent']
+            else:
+                sentiment, intent = outcome["sentiment"], outcome["intent"]
+                if isinstance(sentiment, Exception):
+                    sentiment = self.sentiment_analyzer._error_result(text, sentiment)
+                if isinstance(intent, Exception):
+                    intent = self.intent_detector._error_result(text)
             
-            if not line or line.startswith('['):
+            sentiment['speaker'] = turn['speaker']
+            intent['speaker'] = turn['speaker']
+            results[i] = (sentiment, intent)
+        
+        return results
+    
+    def _merge_tiers(self, decided, remote, patient_count):
+        merged_sentiments = []
+        merged_intents = []
+        for i in range(patient_count):
+            if i in decided:
+                merged_sentiments.append(decided[i]['sentiment'])
+                merged_intents.append(decided[i]['intent'])
                 continue
-            
-            if "**Physician:**" in line or "**Patient:**" in line:
-                # Save previous turn
-                if current_speaker and current_text:
-                    text = " ".join(current_text).strip()
-                    if text:  # Only add non-empty text
-                        conversation.append({
-                            "speaker": current_speaker,
-                            "text": text
-                        })
-                
-                if "**Physician:**" in line:
-                    current_speaker = "Physician"
-                    text = line.split("**Physician:**")[1].strip().strip('*').strip()
-                else:
-                    current_speaker = "Patient"
-                    text = line.split("**Patient:**")[1].strip().strip('*').strip()
-                
-                current_text = [text] if text else []
-            else:
-                if current_speaker:
-                    cleaned = line.strip('*').strip()
-                    if cleaned:
-                        current_text.append(cleaned)
-        
-        if current_speaker and current_text:
-            text = " ".join(current_text).strip()
-            if text:
-                conversation.append({
-                    "speaker": current_speaker,
-                    "text": text
-                })
+            sentiment, intent = remote.get(i, ({}, {}))
+            sentiment.setdefault('tier', REMOTE_TIER)
+            intent.setdefault('tier', REMOTE_TIER)
+            merged_sentiments.append(sentiment)
+            merged_intents.append(intent)
         
-        return conversation
+        return merged_sentiments, merged_intents
     
-    def analyze_complete(self, transcript):
-        # Parse conversation
-        conversation = self.parse_conversation(transcript)
-        print(f"📝 Parsed {len(conversation)} conversation turns")
-        patient_count = sum(1 for t in conversation if t['speaker'] == 'Patient')
-        print(f"   Patient statements: {patient_count}")
-        print()
+    @traced("aggregate")
+    def _combine_results(self, conversation, sentiment_results, intent_results):
+        patient_count = sum(1 for t in conversation if is_patient(t))
         
-        # Analyze sentiment
-        print("🎭 Analyzing sentiment...")
-        sentiment_results = self.sentiment_analyzer.analyze_conversation(conversation)
         overall_sentiment = self.sentiment_analyzer.get_overall_sentiment(sentiment_results)
-        print(f"   Overall sentiment: {overall_sentiment['overall_sentiment']}")
-        print()
-        
-        # Analyze intent
-        print("🎯 Detecting intent...")
-        intent_results = self.intent_detector.analyze_conversation(conversation)
         intent_summary = self.intent_detector.get_intent_summary(intent_results)
-        print(f"   Dominant intent: {intent_summary['dominant_intent']}")
-        print()
+        current_span().set(
+            overall_sentiment=overall_sentiment['overall_sentiment'],
+            dominant_intent=intent_summary['dominant_intent']
+        )
         
         # Combine results
         combined_results = []
-        for i, turn in enumerate([t for t in conversation if t['speaker'] == 'Patient']):
+        for i, turn in enumerate([t for t in conversation if is_patient(t)]):
             sentiment = sentiment_results[i] if i < len(sentiment_results) else {}
             intent = intent_results[i] if i < len(intent_results) else {}
             
@@ -114,10 +320,14 @@ class CompleteSentimentIntentAnalyzer:
                 "sentiment_confidence": sentiment.get('confidence', 0.0),
                 "intent": intent.get('primary_intent', 'Unknown'),
                 "intent_confidence": intent.get('confidence', 0.0),
-                "emotional_indicators": [ei['keyword'] for ei in emotional_indicators],
-                "intent_reasoning": intent.get('reasoning', '')
+                "emotional_indicators": list(dict.fromkeys(ei['keyword'] for ei in emotional_indicators)),
+                "intent_reasoning": intent.get('reasoning', ''),
+                "tier": sentiment.get('tier', REMOTE_TIER)
             })
         
+        cascade = self._cascade_stats(combined_results)
+        current_span().set(offload_ratio=cascade['offload_ratio'])
+        
         return {
             "individual_analyses": combined_results,
             "overall_sentiment": overall_sentiment,
@@ -126,58 +336,106 @@ class CompleteSentimentIntentAnalyzer:
                 "total_turns": len(conversation),
                 "patient_statements": patient_count,
                 "physician_statements": len(conversation) - patient_count
-            }
+            },
+            "cascade": cascade
         }
     
-    def create_assignment_format(self, transcript, sample_statement=None):
+    def _cascade_stats(self, analyses):
+        local_count = sum(1 for r in analyses if r['tier'] == LOCAL_TIER)
+        return {
+            "local": local_count,
+            "gemini": len(analyses) - local_count,
+            "offload_ratio": round(local_count / len(analyses), 3) if analyses else 0.0
+        }
+    
+    @reports_usage
+    @traced("sentiment_intent.create_assignment_format")
+    def create_assignment_format(self, transcript, sample_statement=None, conversation=None):
         if sample_statement:
             # Analyze single statement
-            sentiment = self.sentiment_analyzer.analyze_sentiment(sample_statement)
-            intent = self.intent_detector.detect_intent(sample_statement)
+            local = self.local_classifier.decide(sample_statement) if self.local_classifier else None
+            if local is not None:
+                sentiment = local['sentiment']
+                intent = local['intent']
+            elif self.fused:
+                classification = self.classifier.classify(sample_statement)
+                sentiment = classification['sentiment']
+                intent = classification['intent']
+            else:
+                sentiment = self.sentiment_analyzer.analyze_sentiment(sample_statement)
+                intent = self.intent_detector.detect_intent(sample_statement)
             
-            return {
-                "Statement": sample_statement,
-                "Sentiment": sentiment['sentiment'],
-                "Sentiment_Confidence": sentiment['confidence'],
-                "Intent": intent['primary_intent'],
-                "Intent_Confidence": intent['confidence']
-            }
+            return self._statement_format(sample_statement, sentiment, intent)
         else:
             # Analyze full conversation
-            complete_analysis = self.analyze_complete(transcript)
-            
-            # Find a good example statement
-            patient_statements = complete_analysis['individual_analyses']
-            
-            # Find statement with concern/worry
-            example_statement = None
-            for stmt in patient_statements:
-                if stmt['sentiment'] in ['Anxious', 'Concerned'] or \
-                   any(word in stmt['emotional_indicators'] for word in ['worried', 'concern']):
-                    example_statement = stmt
-                    break
-            
-            if not example_statement and patient_statements:
-                example_statement = patient_statements[0]
+            return self._conversation_format(self.analyze_complete(transcript, conversation))
+    
+    @reports_usage
+    @traced("sentiment_intent.create_assignment_format")
+    async def create_assignment_format_async(self, transcript, sample_statement=None, conversation=None):
+        if sample_statement:
+            local = self.local_classifier.decide(sample_statement) if self.local_classifier else None
+            if local is not None:
+                sentiment = local['sentiment']
+                intent = local['intent']
+            elif self.fused:
+                classification = await self.classifier.classify_async(sample_statement)
+                sentiment = classification['sentiment']
+                intent = classification['intent']
+            else:
+                sentiment, intent = await asyncio.gather(
+                    self.sentiment_analyzer.analyze_sentiment_async(sample_statement),
+                    self.intent_detector.detect_intent_async(sample_statement)
+                )
             
-            result = {
-                "Overall_Analysis": {
-                    "Dominant_Sentiment": complete_analysis['overall_sentiment']['overall_sentiment'],
-                    "Sentiment_Confidence": complete_analysis['overall_sentiment']['confidence'],
-                    "Dominant_Intent": complete_analysis['intent_summary']['dominant_intent'],
-                    "Sentiment_Distribution": complete_analysis['overall_sentiment'].get('distribution', {}),
-                    "Intent_Distribution": complete_analysis['intent_summary']['distribution']
-                },
-                "All_Patient_Analyses": patient_statements
+            return self._statement_format(sample_statement, sentiment, intent)
+        else:
+            return self._conversation_format(await self.analyze_complete_async(transcript, conversation))
+    
+    def _statement_format(self, statement, sentiment, intent):
+        return {
+            "Statement": statement,
+            "Sentiment": sentiment['sentiment'],
+            "Sentiment_Confidence": sentiment['confidence'],
+            "Intent": intent['primary_intent'],
+            "Intent_Confidence": intent['confidence'],
+            "Tier": sentiment.get('tier', REMOTE_TIER)
+        }
+    
+    def _conversation_format(self, complete_analysis):
+        # Find a good example statement
+        patient_statements = complete_analysis['individual_analyses']
+        
+        # Find statement with concern/worry
+        example_statement = None
+        for stmt in patient_statements:
+            if stmt['sentiment'] in ['Anxious', 'Concerned'] or \
+               any(word in stmt['emotional_indicators'] for word in ['worried', 'concern']):
+                example_statement = stmt
+                break
+        
+        if not example_statement and patient_statements:
+            example_statement = patient_statements[0]
+        
+        result = {
+            "Overall_Analysis": {
+                "Dominant_Sentiment": complete_analysis['overall_sentiment']['overall_sentiment'],
+                "Sentiment_Confidence": complete_analysis['overall_sentiment']['confidence'],
+                "Dominant_Intent": complete_analysis['intent_summary']['dominant_intent'],
+                "Sentiment_Distribution": complete_analysis['overall_sentiment'].get('distribution', {}),
+                "Intent_Distribution": complete_analysis['intent_summary']['distribution']
+            },
+            "All_Patient_Analyses": patient_statements,
+            "Cascade": complete_analysis['cascade']
+        }
+        
+        if example_statement:
+            result["Example_Analysis"] = {
+                "Statement": example_statement['statement'],
+                "Sentiment": example_statement['sentiment'],
+                "Sentiment_Confidence": example_statement['sentiment_confidence'],
+                "Intent": example_statement['intent'],
+                "Intent_Confidence": example_statement['intent_confidence']
             }
-            
-            if example_statement:
-                result["Example_Analysis"] = {
-                    "Statement": example_statement['statement'],
-                    "Sentiment": example_statement['sentiment'],
-                    "Sentiment_Confidence": example_statement['sentiment_confidence'],
-                    "Intent": example_statement['intent'],
-                    "Intent_Confidence": example_statement['intent_confidence']
-                }
-            
-            return result
\ No newline at end of file
+        
+        return result
@@ -0,0 +1,334 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from gemini_client import get_client
+from rate_limiter import RateLimitExceeded
+from structured_output import array, integer, number, obj, parse_structured, string
+from transcript_parser import is_patient
+
+load_dotenv()
+
+SENTIMENT_CATEGORIES = ["Reassured", "Neutral", "Concerned", "Anxious"]
+
+INTENT_CATEGORIES = [
+    "seeking reassurance",
+    "reporting symptoms",
+    "expressing concern",
+    "asking questions",
+    "providing information",
+    "describing timeline",
+    "expressing gratitude",
+    "describing impact on life"
+]
+
+
+class GeminiSentimentIntentClassifier:
+    def __init__(self, api_key=None, intent_categories=None, client=None):
+        if api_key is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found. Please set it as an environment variable or pass it to the constructor.")
+
+        self.client = client or get_client(
+            'gemini-2.5-flash-lite',
+            api_key=api_key,
+            generation_config={
+                "temperature": 0.2,
+                "top_p": 0.95,
+                "max_output_tokens": 4096
+            }
+        )
+        self.model = self.client.model
+
+        self.intent_categories = intent_categories or list(INTENT_CATEGORIES)
+
+        self.result_schema = obj({
+            "sentiment": string(enum=SENTIMENT_CATEGORIES),
+            "sentiment_confidence": number(),
+            "sentiment_reasoning": string(),
+            "primary_intent": string(enum=self.intent_categories),
+            "intent_confidence": number(),
+            "intent_reasoning": string(),
+            "all_scores": obj({category: number() for category in self.intent_categories})
+        }, required=["sentiment", "sentiment_confidence", "primary_intent", "intent_confidence"])
+
+        batch_entry = dict(self.result_schema)
+        batch_entry["properties"] = dict(self.result_schema["properties"], index=integer())
+        batch_entry["required"] = ["index"] + self.result_schema["required"]
+        self.batch_schema = array(batch_entry)
+
+    def _instructions(self):
+        return f"""You are an expert in analyzing medical conversations.
+
+For each patient statement, classify BOTH:
+
+1. Sentiment, as one of:
+- Reassured: Patient feels confident, positive, or relieved (high positivity)
+- Neutral: Patient is calm, matter-of-fact, or shows mild emotions
+- Concerned: Patient shows moderate worry or uncertainty
+- Anxious: Patient expresses significant worry, fear, or distress
+
+2. Intent, as ONE of these categories:
+{', '.join(self.intent_categories)}
+
+Result object format:
+{{
+  "sentiment": "one of: {', '.join(SENTIMENT_CATEGORIES)}",
+  "sentiment_confidence": 0.0 to 1.0,
+  "sentiment_reasoning": "brief explanation",
+  "primary_intent": "the most appropriate category from the list",
+  "intent_confidence": 0.0 to 1.0,
+  "intent_reasoning": "brief 1-sentence explanation",
+  "all_scores": {{{', '.join(f'"{c}": 0.0' for c in self.intent_categories)}}}
+}}
+
+IMPORTANT:
+- Choose only from the provided categories
+- Confidences and scores should be 0.0 to 1.0
+- Include scores for all intent categories in all_scores
+- Return ONLY valid JSON (no markdown, no code blocks)
+"""
+
+    def _single_prompt(self, text):
+        return f"""{self._instructions()}
+Patient statement: "{text}"
+
+Return a single result object."""
+
+    def _batch_prompt(self, texts, pending):
+        statements = "\n".join(
+            f'{n}. "{texts[i]}"' for n, i in enumerate(pending, 1)
+        )
+
+        return f"""{self._instructions()}
+Patient statements:
+{statements}
+
+Return a JSON array containing exactly {len(pending)} result objects, one per statement, in the same order. Add an "index" field with the statement number to each object."""
+
+    def classify(self, text):
+        if not text or len(text.strip()) == 0:
+            return self._empty_result(text)
+
+        try:
+            response_text = self.client.generate(
+                self._single_prompt(text),
+                operation="sentiment_intent.classify",
+                response_schema=self.result_schema
+            )
+            result = parse_structured(response_text, self.result_schema)
+
+            return self._format_result(text, result)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error classifying statement: {e}")
+            return self._error_result(text, e)
+
+    async def classify_async(self, text):
+        if not text or len(text.strip()) == 0:
+            return self._empty_result(text)
+
+        try:
+            response_text = await self.client.generate_async(
+                self._single_prompt(text),
+                operation="sentiment_intent.classify",
+                response_schema=self.result_schema
+            )
+            result = parse_structured(response_text, self.result_schema)
+
+            return self._format_result(text, result)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error classifying statement: {e}")
+            return self._error_result(text, e)
+
+    def classify_batch(self, texts, batch_size=10):
+        results = []
+
+        for start in range(0, len(texts), batch_size):
+            results.extend(self._classify_chunk(texts[start:start + batch_size]))
+
+        return results
+
+    async def classify_batch_async(self, texts, batch_size=10):
+        chunks = await asyncio.gather(*[
+            self._classify_chunk_async(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+
+        return [result for chunk in chunks for result in chunk]
+
+    def _classify_chunk(self, texts):
+        results, pending = self._split_chunk(texts)
+
+        if not pending:
+            return results
+
+        parsed = {}
+        try:
+            response_text = self.client.generate(
+                self._batch_prompt(texts, pending),
+                operation="sentiment_intent.classify_batch",
+                response_schema=self.batch_schema
+            )
+            parsed = self._parse_batch(texts, pending, response_text)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error classifying statement batch: {e}")
+
+        # Fall back to one request per statement for entries that did not parse
+        for n, i in enumerate(pending, 1):
+            results[i] = parsed.get(n) or self.classify(texts[i])
+
+        return results
+
+    async def _classify_chunk_async(self, texts):
+        results, pending = self._split_chunk(texts)
+
+        if not pending:
+            return results
+
+        parsed = {}
+        try:
+            response_text = await self.client.generate_async(
+                self._batch_prompt(texts, pending),
+                operation="sentiment_intent.classify_batch",
+                response_schema=self.batch_schema
+            )
+            parsed = self._parse_batch(texts, pending, response_text)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error classifying statement batch: {e}")
+
+        missing = [(n, i) for n, i in enumerate(pending, 1) if n not in parsed]
+        fallbacks = await asyncio.gather(*[
+            self.classify_async(texts[i]) for _, i in missing
+        ])
+        parsed.update({n: result for (n, _), result in zip(missing, fallbacks)})
+
+        for n, i in enumerate(pending, 1):
+            results[i] = parsed[n]
+
+        return results
+
+    def _split_chunk(self, texts):
+        results = [None] * len(texts)
+        pending = []
+
+        for i, text in enumerate(texts):
+            if not text or len(text.strip()) == 0:
+                results[i] = self._empty_result(text)
+            else:
+                pending.append(i)
+
+        return results, pending
+
+    def _parse_batch(self, texts, pending, response_text):
+        entries = parse_structured(response_text, self.batch_schema)
+
+        parsed = {}
+        for position, entry in enumerate(entries, 1):
+            try:
+                index = int(entry.get("index", position))
+                if 1 <= index <= len(pending) and index not in parsed:
+                    parsed[index] = self._format_result(texts[pending[index - 1]], entry)
+            except Exception:
+                continue
+
+        return parsed
+
+    def analyze_conversation(self, conversation, batch_size=10):
+        patient_turns = [turn for turn in conversation if is_patient(turn)]
+        texts = [turn['text'] for turn in patient_turns]
+
+        if batch_size and batch_size > 1:
+            results = self.classify_batch(texts, batch_size=batch_size)
+        else:
+            results = [self.classify(text) for text in texts]
+
+        return self._split_results(patient_turns, results)
+
+    async def analyze_conversation_async(self, conversation, batch_size=10):
+        patient_turns = [turn for turn in conversation if is_patient(turn)]
+        texts = [turn['text'] for turn in patient_turns]
+
+        if batch_size and batch_size > 1:
+            results = await self.classify_batch_async(texts, batch_size=batch_size)
+        else:
+            results = await asyncio.gather(*[self.classify_async(text) for text in texts])
+
+        return self._split_results(patient_turns, results)
+
+    def _split_results(self, patient_turns, results):
+        sentiment_results = []
+        intent_results = []
+
+        for turn, result in zip(patient_turns, results):
+            result['sentiment']['speaker'] = turn['speaker']
+            result['intent']['speaker'] = turn['speaker']
+            sentiment_results.append(result['sentiment'])
+            intent_results.append(result['intent'])
+
+        return sentiment_results, intent_results
+
+    def _format_result(self, text, result):
+        sentiment_confidence = round(float(result.get("sentiment_confidence", 0.5)), 3)
+
+        return {
+            "sentiment": {
+                "text": text,
+                "sentiment": result.get("sentiment", "Neutral"),
+                "confidence": sentiment_confidence,
+                "raw_label": result.get("sentiment"),
+                "raw_score": sentiment_confidence,
+                "reasoning": result.get("sentiment_reasoning", "")
+            },
+            "intent": {
+                "text": text[:100] + "..." if len(text) > 100 else text,
+                "primary_intent": result.get("primary_intent", "unknown"),
+                "confidence": round(float(result.get("intent_confidence", 0.0)), 3),
+                "all_scores": result.get("all_scores", {}),
+                "reasoning": result.get("intent_reasoning", "")
+            }
+        }
+
+    def _empty_result(self, text):
+        return {
+            "sentiment": {
+                "text": text,
+                "sentiment": "Neutral",
+                "confidence": 0.0,
+                "raw_label": None
+            },
+            "intent": {
+                "text": text,
+                "primary_intent": "unknown",
+                "confidence": 0.0,
+                "all_scores": {}
+            }
+        }
+
+    def _error_result(self, text, error):
+        return {
+            "sentiment": {
+                "text": text,
+                "sentiment": "Neutral",
+                "confidence": 0.5,
+                "raw_label": "NEUTRAL",
+                "raw_score": 0.5,
+                "reasoning": f"Error: {str(error)}"
+            },
+            "intent": {
+                "text": text,
+                "primary_intent": "error",
+                "confidence": 0.0,
+                "all_scores": {}
+            }
+        }
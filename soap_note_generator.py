@@ -1,13 +1,115 @@
 import json
 import re
-from typing import Dict, Any, Optional
-import google.generativeai as genai
+from typing import Dict, Any, Iterator, List, Optional
+from gemini_client import GeminiClient, get_client
+from json_repair import IncrementalJSONParser
+from rate_limiter import RateLimitExceeded
+from structured_output import SchemaValidationError, obj, parse_structured, string
+from tracing import current_span, dump_trace, trace, traced
+from transcript_parser import iter_turns
+from usage import attach_usage, new_tracker, reports_usage, tracked_iter
+
+
+_text = string(nullable=True)
+
+SOAP_RESPONSE_SCHEMA = obj({
+    "Subjective": obj({
+        "Chief_Complaint": _text,
+        "History_of_Present_Illness": _text,
+        "Past_Medical_History": _text,
+        "Patient_Concerns": _text
+    }),
+    "Objective": obj({
+        "Physical_Exam": _text,
+        "Observations": _text,
+        "Vital_Signs": _text
+    }),
+    "Assessment": obj({
+        "Diagnosis": _text,
+        "Severity": _text,
+        "Prognosis": _text
+    }),
+    "Plan": obj({
+        "Treatment": _text,
+        "Medications": _text,
+        "Follow-Up": _text,
+        "Patient_Education": _text
+    })
+}, required=["Subjective", "Objective", "Assessment", "Plan"])
+
+# Fields the model still writes when the note is built from extracted entities;
+# everything else comes straight from the entity dict
+SOAP_NARRATIVE_FIELDS = {
+    "Subjective": ["History_of_Present_Illness", "Past_Medical_History", "Patient_Concerns"],
+    "Objective": ["Observations", "Vital_Signs"],
+    "Assessment": ["Severity"],
+    "Plan": ["Follow-Up", "Patient_Education"]
+}
+
+SOAP_NARRATIVE_SCHEMA = obj({
+    section: obj({field: _text for field in fields})
+    for section, fields in SOAP_NARRATIVE_FIELDS.items()
+}, required=list(SOAP_NARRATIVE_FIELDS))
+
+# Turns worth quoting for the narrative fields the entities do not cover
+EXCERPT_PATTERN = re.compile(
+    r"\b(?:worr\w*|concern\w*|afraid|scared|nervous|anxious|history|previous\w*|years ago|surgery"
+    r"|blood pressure|bp|pulse|heart rate|temperature|oxygen|\d{2,3}/\d{2,3}"
+    r"|follow[- ]?up|come back|recommend\w*|advi[cs]e\w*|avoid|make sure|exercise\w*)\b",
+    re.IGNORECASE
+)
+CLINICIAN_SPEAKER = re.compile(r"\b(?:physician|doctor|dr|clinician|nurse|gp)\b", re.IGNORECASE)
+MAX_EXCERPT_CHARS = 1500
+MAX_EXCERPT_TURN_CHARS = 300
+MEDICATION_TYPES = ("medication", "medicine", "drug", "analgesic", "painkiller")
+
+
+def _compact(value):
+    # Drop empty values so the digest only spends tokens on findings
+    if isinstance(value, dict):
+        value = {k: _compact(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [v for v in (_compact(v) for v in value) if v not in (None, "", [], {})]
+    return value
+
+
+def entity_digest(entities):
+    findings = {k: v for k, v in entities.items() if k != "metadata"}
+    return json.dumps(_compact(findings), ensure_ascii=False, separators=(",", ":"))
+
+
+def select_excerpts(transcript=None, max_chars=MAX_EXCERPT_CHARS, turns=None):
+    # turns, when the caller already parsed the transcript, saves a second pass
+    excerpts = []
+    used = 0
+    for turn in turns if turns is not None else iter_turns(transcript or ""):
+        # The patient's own questions usually carry their concerns
+        patient_question = "?" in turn['text'] and not CLINICIAN_SPEAKER.search(turn['speaker'])
+        if not (patient_question or EXCERPT_PATTERN.search(turn['text'])):
+            continue
+        text = turn['text'][:MAX_EXCERPT_TURN_CHARS]
+        line = f"{turn.get('label') or turn['speaker']}: {text}"
+        if line in excerpts:
+            continue
+        if used + len(line) > max_chars:
+            break
+        excerpts.append(line)
+        used += len(line) + 1
+    return excerpts
 
 
 class SOAPNoteGenerator:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+    def __init__(self, api_key: str, client: Optional[GeminiClient] = None):
+        self.client = client or get_client(
+            'gemini-2.5-flash-lite',
+            api_key=api_key,
+            generation_config={
+                "temperature": 0.2,
+                "max_output_tokens": 2048,
+            }
+        )
+        self.model = self.client.model
         
     def create_soap_prompt(self, transcript: str) -> str:
         prompt = f"""You are a medical documentation expert. Convert the following medical conversation transcript into a structured SOAP note format.
@@ -51,44 +153,254 @@ Return ONLY valid JSON without any markdown formatting or explanations."""
         
         return prompt
     
+    @reports_usage
+    @traced("soap.generate_soap_note")
     def generate_soap_note(self, transcript: str) -> Dict[str, Any]:
         try:
             prompt = self.create_soap_prompt(transcript)
             
-            response = self.model.generate_content(
+            response_text = self.client.generate(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.2,  
-                    max_output_tokens=2048,
-                )
+                operation="soap.generate_soap_note",
+                response_schema=SOAP_RESPONSE_SCHEMA
             )
             
             # Extract JSON from response
-            soap_note = self._parse_response(response.text)
+            soap_note = self._parse_response(response_text)
             
             return soap_note
             
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error generating SOAP note: {str(e)}")
             return self._get_empty_soap_structure()
     
-    def _parse_response(self, response_text: str) -> Dict[str, Any]:
-        clean_text = re.sub(r'```json\n?', '', response_text)
-        clean_text = re.sub(r'```\n?', '', clean_text)
-        clean_text = clean_text.strip()
-        
+    @reports_usage
+    @traced("soap.generate_soap_note")
+    async def generate_soap_note_async(self, transcript: str) -> Dict[str, Any]:
         try:
-            soap_note = json.loads(clean_text)
-            return soap_note
-        except json.JSONDecodeError:
-            json_match = re.search(r'\{.*\}', clean_text, re.DOTALL)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except:
-                    pass
+            prompt = self.create_soap_prompt(transcript)
             
-            print("Failed to parse JSON response")
+            response_text = await self.client.generate_async(
+                prompt,
+                operation="soap.generate_soap_note",
+                response_schema=SOAP_RESPONSE_SCHEMA
+            )
+            
+            return self._parse_response(response_text)
+            
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error generating SOAP note: {str(e)}")
+            return self._get_empty_soap_structure()
+    
+    def generate_soap_note_stream(self, transcript: str) -> Iterator[Dict[str, Any]]:
+        # Yields a partial note each time a field completes, then the full note
+        tracker = new_tracker()
+        partial = {section: {} for section in SOAP_RESPONSE_SCHEMA["required"]}
+        parser = IncrementalJSONParser(max_depth=2)
+
+        try:
+            stream = self.client.generate_stream(
+                self.create_soap_prompt(transcript),
+                operation="soap.generate_soap_note",
+                response_schema=SOAP_RESPONSE_SCHEMA
+            )
+            for chunk in tracked_iter(stream, tracker):
+                updated = False
+                for path, value in parser.feed(chunk):
+                    if len(path) == 2 and path[0] in partial:
+                        partial[path[0]][path[1]] = value
+                        updated = True
+                if updated:
+                    yield {section: dict(fields) for section, fields in partial.items()}
+
+            soap_note = self._parse_response(parser.buffer)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error generating SOAP note: {str(e)}")
+            soap_note = self._get_empty_soap_structure()
+
+        yield attach_usage(soap_note, tracker)
+
+    def create_narrative_prompt(self, entities: Dict[str, Any], transcript: Optional[str] = None,
+                                turns: Optional[List[Dict[str, Any]]] = None) -> str:
+        excerpts = select_excerpts(transcript, turns=turns) if transcript or turns else []
+        template = json.dumps(
+            {section: {field: "..." for field in fields} for section, fields in SOAP_NARRATIVE_FIELDS.items()},
+            indent=2
+        )
+        
+        prompt = f"""You are a medical documentation expert. Write the narrative fields of a SOAP note from the structured findings below. The remaining SOAP note fields are filled in from the findings directly.
+
+Extracted findings (JSON):
+{entity_digest(entities)}
+
+Relevant transcript excerpts:
+{chr(10).join(excerpts) if excerpts else "(none)"}
+
+Return the narrative fields in the following JSON format, using null where the findings and excerpts say nothing:
+{template}
+
+Return ONLY valid JSON without any markdown formatting or explanations."""
+        
+        return prompt
+    
+    def _deterministic_fields(self, entities: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+        symptoms = [s for s in entities.get("Symptoms") or [] if isinstance(s, dict)]
+        treatments = [t for t in entities.get("Treatment") or [] if isinstance(t, dict)]
+        exam = entities.get("Physical_Examination") or {}
+        
+        medications = [t for t in treatments if (t.get("treatment_type") or "").lower() in MEDICATION_TYPES]
+        other_treatments = [t for t in treatments if t not in medications]
+        
+        exam_parts = list(exam.get("findings") or [])
+        if exam.get("mobility"):
+            exam_parts.append(f"Mobility: {exam['mobility']}")
+        if exam.get("tenderness"):
+            exam_parts.append(f"Tenderness: {exam['tenderness']}")
+        
+        return {
+            "Subjective": {
+                "Chief_Complaint": ", ".join(dict.fromkeys(s["symptom"] for s in symptoms if s.get("symptom")))
+            },
+            "Objective": {
+                "Physical_Exam": "; ".join(exam_parts)
+            },
+            "Assessment": {
+                "Diagnosis": entities.get("Diagnosis") or "",
+                "Prognosis": entities.get("Prognosis") or ""
+            },
+            "Plan": {
+                "Treatment": "; ".join(
+                    f"{(t.get('treatment_type') or 'Treatment').capitalize()}: {t['details']}" if t.get("details")
+                    else (t.get("treatment_type") or "").capitalize()
+                    for t in other_treatments
+                ),
+                "Medications": "; ".join(t.get("details") or t.get("treatment_type") for t in medications)
+            }
+        }
+    
+    def _assemble_note(self, entities: Dict[str, Any], response_text: Optional[str]) -> Dict[str, Any]:
+        soap_note = self._get_empty_soap_structure()
+        
+        if response_text is not None:
+            narrative = self._parse_narrative(response_text)
+            for section, fields in SOAP_NARRATIVE_FIELDS.items():
+                for field in fields:
+                    soap_note[section][field] = (narrative.get(section) or {}).get(field) or ""
+        
+        for section, fields in self._deterministic_fields(entities).items():
+            soap_note[section].update(fields)
+        
+        soap_note["metadata"] = {"source": "entities"}
+        return soap_note
+    
+    @reports_usage
+    @traced("soap.generate_soap_note_from_entities")
+    def generate_soap_note_from_entities(self, entities: Optional[Dict[str, Any]], transcript: Optional[str] = None,
+                                         turns: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        # Prompt size follows the entity count plus a bounded set of excerpts,
+        # not the transcript length
+        if entities is None:
+            return self.generate_soap_note(transcript) if transcript else self._get_empty_soap_structure()
+        
+        try:
+            response_text = self.client.generate(
+                self.create_narrative_prompt(entities, transcript, turns),
+                operation="soap.generate_soap_note_from_entities",
+                response_schema=SOAP_NARRATIVE_SCHEMA
+            )
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error generating SOAP narrative: {str(e)}")
+            response_text = None
+        
+        return self._assemble_note(entities, response_text)
+    
+    @reports_usage
+    @traced("soap.generate_soap_note_from_entities")
+    async def generate_soap_note_from_entities_async(self, entities: Optional[Dict[str, Any]], transcript: Optional[str] = None,
+                                                     turns: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        if entities is None:
+            return await self.generate_soap_note_async(transcript) if transcript else self._get_empty_soap_structure()
+        
+        try:
+            response_text = await self.client.generate_async(
+                self.create_narrative_prompt(entities, transcript, turns),
+                operation="soap.generate_soap_note_from_entities",
+                response_schema=SOAP_NARRATIVE_SCHEMA
+            )
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error generating SOAP narrative: {str(e)}")
+            response_text = None
+        
+        return self._assemble_note(entities, response_text)
+
+    def generate_soap_note_from_entities_stream(self, entities: Optional[Dict[str, Any]], transcript: Optional[str] = None,
+                                                turns: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+        # Yields the entity-backed fields at once, a partial note each time a
+        # narrative field completes, then the full note
+        if entities is None:
+            if transcript:
+                yield from self.generate_soap_note_stream(transcript)
+            else:
+                yield self._get_empty_soap_structure()
+            return
+
+        tracker = new_tracker()
+        partial = {section: dict(fields) for section, fields in self._deterministic_fields(entities).items()}
+        parser = IncrementalJSONParser(max_depth=2)
+        yield {section: dict(fields) for section, fields in partial.items()}
+
+        try:
+            stream = self.client.generate_stream(
+                self.create_narrative_prompt(entities, transcript, turns),
+                operation="soap.generate_soap_note_from_entities",
+                response_schema=SOAP_NARRATIVE_SCHEMA
+            )
+            for chunk in tracked_iter(stream, tracker):
+                updated = False
+                for path, value in parser.feed(chunk):
+                    if len(path) == 2 and path[0] in partial:
+                        partial[path[0]][path[1]] = value
+                        updated = True
+                if updated:
+                    yield {section: dict(fields) for section, fields in partial.items()}
+
+            response_text = parser.buffer
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error generating SOAP narrative: {str(e)}")
+            response_text = None
+
+        yield attach_usage(self._assemble_note(entities, response_text), tracker)
+
+    @traced("json_repair")
+    def _parse_narrative(self, response_text: str) -> Dict[str, Any]:
+        try:
+            return parse_structured(response_text, SOAP_NARRATIVE_SCHEMA)
+        except (json.JSONDecodeError, SchemaValidationError) as e:
+            print(f"Failed to parse JSON response: {e}")
+            current_span().set(repair="failed")
+            return {}
+    
+    @traced("json_repair")
+    def _parse_response(self, response_text: str) -> Dict[str, Any]:
+        try:
+            return parse_structured(response_text, SOAP_RESPONSE_SCHEMA)
+        except (json.JSONDecodeError, SchemaValidationError) as e:
+            print(f"Failed to parse JSON response: {e}")
+            current_span().set(repair="failed")
             return self._get_empty_soap_structure()
     
     def _get_empty_soap_structure(self) -> Dict[str, Any]:
@@ -124,6 +436,8 @@ Return ONLY valid JSON without any markdown formatting or explanations."""
         output.append("=" * 60)
         
         for section, content in soap_note.items():
+            if section == "metadata":
+                continue
             output.append(f"\n{section.upper()}:")
             output.append("-" * 60)
             
@@ -182,15 +496,20 @@ def main():
     
     # Generate SOAP note
     print("\nGenerating SOAP note from transcript...")
-    soap_note = generator.generate_soap_note(sample_transcript)
+    with trace("soap_note_cli") as run_trace:
+        soap_note = generator.generate_soap_note(sample_transcript)
     
     # Display formatted output
     print("\n" + generator.format_soap_note(soap_note))
+    print("\n" + run_trace.format())
     
     # Save as JSON
     with open('soap_note_output.json', 'w') as f:
         json.dump(soap_note, f, indent=2)
     print("\nSOAP note saved to 'soap_note_output.json'")
+    
+    dump_trace(run_trace, 'outputs/soap_note_trace.json')
+    print("Trace saved to 'outputs/soap_note_trace.json'")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import json
+from json_repair import loads, strip_code_fence
+
+JSON_MIME_TYPE = "application/json"
+
+
+class SchemaValidationError(ValueError):
+    pass
+
+
+# Schemas use the Gemini (OpenAPI subset) format so they can be sent as response_schema
+def string(nullable=False, enum=None):
+    schema = {"type": "STRING"}
+    if enum:
+        schema["enum"] = list(enum)
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def number(nullable=False):
+    schema = {"type": "NUMBER"}
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def integer():
+    return {"type": "INTEGER"}
+
+
+def array(items, nullable=False):
+    schema = {"type": "ARRAY", "items": items}
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def obj(properties, required=None, nullable=False):
+    schema = {"type": "OBJECT", "properties": properties}
+    if required:
+        schema["required"] = list(required)
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def with_response_schema(generation_config, schema):
+    if isinstance(generation_config, dict) or generation_config is None:
+        config = dict(generation_config or {})
+    else:
+        config = {k: v for k, v in vars(generation_config).items() if not k.startswith("_") and v is not None}
+
+    config["response_mime_type"] = JSON_MIME_TYPE
+    config["response_schema"] = schema
+    return config
+
+
+def validate(data, schema, path="$"):
+    if data is None:
+        if schema.get("nullable"):
+            return None
+        raise SchemaValidationError(f"{path}: value is required")
+
+    kind = schema["type"]
+
+    if kind == "OBJECT":
+        if not isinstance(data, dict):
+            raise SchemaValidationError(f"{path}: expected an object")
+
+        for field in schema.get("required", []):
+            if data.get(field) is None:
+                raise SchemaValidationError(f"{path}.{field}: value is required")
+
+        # Optional properties may be null; unknown properties pass through
+        properties = schema.get("properties", {})
+        return {
+            key: validate(value, properties[key], f"{path}.{key}")
+            if key in properties and value is not None else value
+            for key, value in data.items()
+        }
+
+    if kind == "ARRAY":
+        if not isinstance(data, list):
+            raise SchemaValidationError(f"{path}: expected an array")
+
+        # One malformed item should not discard the rest of the list
+        items = []
+        for i, item in enumerate(data):
+            try:
+                items.append(validate(item, schema["items"], f"{path}[{i}]"))
+            except SchemaValidationError:
+                continue
+        return items
+
+    if kind in ("NUMBER", "INTEGER"):
+        if isinstance(data, bool) or isinstance(data, (dict, list)):
+            raise SchemaValidationError(f"{path}: expected a number")
+        try:
+            return int(data) if kind == "INTEGER" else float(data)
+        except (TypeError, ValueError):
+            raise SchemaValidationError(f"{path}: expected a number")
+
+    if kind == "STRING":
+        if isinstance(data, (dict, list)):
+            raise SchemaValidationError(f"{path}: expected a string")
+        data = str(data)
+
+        enum = schema.get("enum")
+        if enum and data not in enum:
+            matches = [value for value in enum if value.lower() == data.strip().lower()]
+            if not matches:
+                raise SchemaValidationError(f"{path}: {data!r} is not one of {enum}")
+            data = matches[0]
+        return data
+
+    if kind == "BOOLEAN":
+        if not isinstance(data, bool):
+            raise SchemaValidationError(f"{path}: expected a boolean")
+        return data
+
+    return data
+
+
+def parse_structured(response_text, schema):
+    return validate(loads(response_text), schema)
+
+
+def validate_complete(response_text, schema):
+    # Stricter than parse_structured: no truncation or other repair is
+    # allowed. Used to decide whether a response is fit to be cached.
+    try:
+        data = json.loads(strip_code_fence(response_text))
+    except ValueError:
+        raise SchemaValidationError("$: response is not complete JSON")
+    return validate(data, schema)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests never reach the network or the shared on-disk response cache
+os.environ.setdefault("GEMINI_BACKEND", "mock")
+os.environ.setdefault("GEMINI_CACHE_DISABLED", "1")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,50 @@
+import json
+from types import SimpleNamespace
+
+from batch_visits import Checkpoint, iter_transcripts, run_batch
+
+
+def test_jsonl_ids_of_zero_or_empty_are_kept(tmp_path):
+    source = tmp_path / "visits.jsonl"
+    source.write_text("\n".join(json.dumps(record) for record in [
+        {"id": 0, "transcript": "a"},
+        {"id": "", "transcript": "b"},
+        {"transcript": "c"},
+        {"id": None, "transcript": "d"}
+    ]) + "\n")
+
+    assert list(iter_transcripts(str(source))) == [("0", "a"), ("", "b"), ("line-3", "c"), ("line-4", "d")]
+
+
+def test_checkpoint_reloads_empty_ids(tmp_path):
+    path = str(tmp_path / "batch.checkpoint")
+    checkpoint = Checkpoint(path)
+    checkpoint.mark("", "ok")
+    checkpoint.mark("0", "error")
+    checkpoint.close()
+
+    reloaded = Checkpoint(path)
+    reloaded.close()
+    assert reloaded.statuses == {"": "ok", "0": "error"}
+    assert reloaded.is_done("")
+
+
+def test_ids_repeated_in_one_input_run_once(tmp_path):
+    source = tmp_path / "visits.jsonl"
+    source.write_text("\n".join(json.dumps({"id": record_id, "transcript": f"Patient: visit {n}"})
+                                for n, record_id in enumerate(["a", "b", "a", "c", "b"])) + "\n")
+    calls = []
+
+    async def summarize(transcript):
+        calls.append(transcript)
+        return {"Diagnosis": "ok"}
+
+    pipeline = SimpleNamespace(summarizer=SimpleNamespace(create_assignment_format_async=summarize))
+    output = tmp_path / "results.jsonl"
+    summary = run_batch(str(source), str(output), task="ner", workers=2, report_every=0, pipeline=pipeline)
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(record["id"] for record in records) == ["a", "b", "c"]
+    assert sorted(calls) == ["Patient: visit 0", "Patient: visit 1", "Patient: visit 3"]
+    assert summary["ok"] == 3
+    assert summary["skipped"] == 2
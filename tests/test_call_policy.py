@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from call_policy import CallDeadlineExceeded, CallPolicy, is_transient_error
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+def test_unhedged_attempts_run_on_the_callers_thread():
+    threads = []
+    policy = CallPolicy(deadline_seconds=30, max_retries=0)
+
+    assert policy.run(lambda: threads.append(threading.current_thread()) or "ok") == "ok"
+    assert threads == [threading.current_thread()]
+
+
+def test_the_policy_deadline_is_not_retried():
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise CallDeadlineExceeded("too slow")
+
+    assert not is_transient_error(CallDeadlineExceeded("too slow"))
+    assert is_transient_error(TimeoutError())
+    with pytest.raises(CallDeadlineExceeded):
+        CallPolicy(deadline_seconds=30, max_retries=3, base_delay=0).run(attempt)
+    assert len(calls) == 1
+
+
+def test_abandoned_hedge_losers_are_counted_and_capped():
+    policy = CallPolicy(deadline_seconds=5, max_retries=0, hedge=True, hedge_min_samples=1,
+                        hedge_min_delay=0.05, max_abandoned=1)
+    policy.run(lambda: "warm-up")
+    release = threading.Event()
+    calls = []
+
+    def attempt():
+        calls.append(threading.current_thread())
+        if len(calls) == 1:
+            release.wait(timeout=5)
+        return "ok"
+
+    assert policy.run(attempt) == "ok"
+    assert policy.stats()["hedge_wins"] == 1
+    assert policy.stats()["abandoned_running"] == 1
+
+    # At the cap the next call does not hedge and runs inline
+    calls.clear()
+    calls.append(None)
+    assert policy.run(attempt) == "ok"
+    assert calls[-1] is threading.current_thread()
+
+    release.set()
+    for _ in range(100):
+        if policy.stats()["abandoned_running"] == 0:
+            break
+        time.sleep(0.01)
+    assert policy.stats()["abandoned_running"] == 0
+
+
+def test_streams_retry_before_the_first_chunk_only():
+    opened = []
+
+    def open_stream():
+        opened.append(1)
+        if len(opened) == 1:
+            raise Unavailable("try again")
+        yield "a"
+        yield "b"
+
+    policy = CallPolicy(deadline_seconds=30, max_retries=2, base_delay=0)
+    assert list(policy.run_stream(open_stream)) == ["a", "b"]
+    assert policy.stats()["retries"] == 1
+
+    def fails_midway():
+        yield "a"
+        raise Unavailable("lost")
+
+    stream = CallPolicy(deadline_seconds=30, max_retries=2, base_delay=0).run_stream(fails_midway)
+    assert next(stream) == "a"
+    with pytest.raises(Unavailable):
+        next(stream)
+
+
+def test_streams_stop_at_the_deadline():
+    closed = []
+
+    def slow_stream():
+        try:
+            for piece in "abc":
+                time.sleep(0.05)
+                yield piece
+        finally:
+            closed.append(True)
+
+    policy = CallPolicy(deadline_seconds=0.08, max_retries=2)
+    with pytest.raises(CallDeadlineExceeded):
+        list(policy.run_stream(slow_stream))
+    assert closed == [True]
+    assert policy.stats()["timeouts"] == 1
+
+
+def test_client_streams_go_through_the_policy():
+    from gemini_backends import MockBackend
+    from gemini_client import GeminiClient
+    from llm_cache import LLMResponseCache
+
+    backend = MockBackend(responder=lambda prompt: '{"a": 1}', stream_chunk_chars=2)
+    client = GeminiClient("mock-model", api_key="test-key", backend=backend, cache=LLMResponseCache(enabled=False))
+
+    assert "".join(client.generate_stream("prompt")) == '{"a": 1}'
+    assert client.call_policy.stats()["calls"] == 1
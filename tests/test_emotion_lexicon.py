@@ -0,0 +1,26 @@
+import pytest
+
+from emotion_lexicon import EmotionMatcher
+
+
+def test_whole_words_and_longest_match():
+    matcher = EmotionMatcher({"positive": ["better", "much better"], "negative": ["pain"]})
+    hits = matcher.find("Much  better, no painkillers needed.")
+
+    assert [(h["keyword"], h["category"], h["start"], h["end"]) for h in hits] == [
+        ("much better", "positive", 0, 12)
+    ]
+
+
+@pytest.mark.parametrize("lexicon", [
+    {"anxiety": []},
+    {"anxiety": [""]},
+    {"anxiety": ["  "], "positive": []}
+])
+def test_lexicons_without_terms_match_nothing(lexicon):
+    assert EmotionMatcher(lexicon).find("I am fine. ") == []
+
+
+def test_blank_terms_are_skipped():
+    matcher = EmotionMatcher({"anxiety": ["", "worried"]})
+    assert [h["keyword"] for h in matcher.find("I am fine, just worried.")] == ["worried"]
@@ -0,0 +1,46 @@
+import pytest
+
+import gemini_backends
+from gemini_backends import GeminiBackend
+
+genai = pytest.importorskip("google.generativeai")
+
+
+@pytest.fixture
+def without_transports(monkeypatch):
+    from google.generativeai import client as genai_client
+
+    def unavailable():
+        raise AttributeError("_ClientManager")
+
+    configured = []
+    monkeypatch.setattr(genai_client, "_ClientManager", unavailable)
+    monkeypatch.setattr(genai, "configure", lambda api_key=None: configured.append(api_key))
+    monkeypatch.setattr(gemini_backends, "_transports", {})
+    monkeypatch.setattr(gemini_backends, "_global_key_id", None)
+    return configured
+
+
+def test_transport_fallback_warns_and_configures_globally(without_transports, capsys):
+    GeminiBackend("gemini-2.5-flash-lite", api_key="key-a")
+    GeminiBackend("gemini-2.5-flash-lite", api_key="key-a")
+
+    assert without_transports == ["key-a", "key-a"]
+    assert capsys.readouterr().out.count("Warning: per-key Gemini transport unavailable") == 1
+
+
+def test_transport_fallback_refuses_a_second_key(without_transports):
+    GeminiBackend("gemini-2.5-flash-lite", api_key="key-a")
+    with pytest.raises(RuntimeError, match="Multiple Gemini API keys"):
+        GeminiBackend("gemini-2.5-flash-lite", api_key="key-b")
+    assert without_transports == ["key-a"]
+
+
+def test_per_key_transports_are_shared_by_key(monkeypatch):
+    monkeypatch.setattr(gemini_backends, "_transports", {})
+    a = GeminiBackend("gemini-2.5-flash-lite", api_key="key-a")
+    b = GeminiBackend("gemini-2.5-flash-lite", api_key="key-a")
+    c = GeminiBackend("gemini-2.5-flash-lite", api_key="key-b")
+
+    assert a.model._client is b.model._client
+    assert a.model._client is not c.model._client
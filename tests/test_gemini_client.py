@@ -0,0 +1,188 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from call_policy import CallDeadlineExceeded, CallPolicy
+from gemini_backends import BackendResponse, MockBackend
+from gemini_client import GeminiClient, response_cache
+from llm_cache import LLMResponseCache
+from rate_limiter import RateLimiter
+
+
+def make_client(backend, policy, tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), enabled=False)
+    return GeminiClient("mock-model", api_key="test-key", backend=backend, call_policy=policy, cache=cache)
+
+
+def test_timed_out_async_attempts_release_their_limiter_slot(tmp_path):
+    client = make_client(
+        MockBackend(latency=0.5),
+        CallPolicy(deadline_seconds=0.05, max_retries=0),
+        tmp_path
+    )
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(CallDeadlineExceeded):
+                await client.generate_async("prompt", use_cache=False)
+
+    asyncio.run(run())
+    assert client.rate_limiter.stats()["in_flight"] == 0
+
+
+def test_cancelled_hedge_releases_its_limiter_slot(tmp_path):
+    policy = CallPolicy(deadline_seconds=5, max_retries=0, hedge=True, hedge_min_samples=1, hedge_min_delay=0.05)
+    policy._record_latency(0.05)
+    backend = MockBackend(latency=0.2)
+    client = make_client(backend, policy, tmp_path)
+
+    result = asyncio.run(client.generate_async("prompt", use_cache=False))
+
+    assert result
+    assert backend.calls == 2
+    assert policy.stats()["hedges"] == 1
+    assert client.rate_limiter.stats()["in_flight"] == 0
+
+
+def test_sync_failures_release_their_limiter_slot(tmp_path):
+    client = make_client(
+        MockBackend(error_rate=1.0),
+        CallPolicy(deadline_seconds=None, max_retries=0),
+        tmp_path
+    )
+
+    with pytest.raises(Exception):
+        client.generate("prompt", use_cache=False)
+    assert client.rate_limiter.stats()["in_flight"] == 0
+
+
+SCHEMA = {"type": "OBJECT", "properties": {"answer": {"type": "STRING"}}, "required": ["answer"]}
+
+
+def cached_client(responder, tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    backend = MockBackend(responder=lambda prompt: responder)
+    client = GeminiClient("mock-model", api_key="test-key", backend=backend, cache=cache)
+    return client, backend
+
+
+@pytest.mark.parametrize("response", [
+    "Sorry, I cannot help with that.",
+    '{"answer": "partial',
+    '{"other": "missing the required field"}'
+])
+def test_unusable_responses_are_not_cached(response, tmp_path):
+    client, backend = cached_client(response, tmp_path)
+
+    assert client.generate("prompt", response_schema=SCHEMA) == response
+    assert client.generate("prompt", response_schema=SCHEMA) == response
+    assert backend.calls == 2
+
+
+def test_valid_responses_are_cached(tmp_path):
+    client, backend = cached_client('```json\n{"answer": "yes"}\n```', tmp_path)
+
+    client.generate("prompt", response_schema=SCHEMA)
+    asyncio.run(client.generate_async("prompt", response_schema=SCHEMA))
+    assert "".join(client.generate_stream("prompt", response_schema=SCHEMA)) == '```json\n{"answer": "yes"}\n```'
+    assert backend.calls == 1
+
+
+def test_poisoned_cache_entries_are_evicted(tmp_path):
+    client, backend = cached_client('{"answer": "yes"}', tmp_path)
+    config = client._resolve_config(None, SCHEMA)
+    client.cache.set(client.cache_namespace, config, "prompt", "Sorry, I cannot help")
+
+    assert client.generate("prompt", response_schema=SCHEMA) == '{"answer": "yes"}'
+    assert client.generate("prompt", response_schema=SCHEMA) == '{"answer": "yes"}'
+    assert backend.calls == 1
+
+
+def test_streamed_truncated_response_is_not_cached(tmp_path):
+    client, backend = cached_client('{"answer": "cut off', tmp_path)
+
+    "".join(client.generate_stream("prompt", response_schema=SCHEMA))
+    "".join(client.generate_stream("prompt", response_schema=SCHEMA))
+    assert backend.calls == 2
+
+
+def test_response_cache_switch_is_scoped_to_the_caller(tmp_path):
+    client, backend = cached_client('{"answer": "yes"}', tmp_path)
+    client.generate("prompt", response_schema=SCHEMA)
+
+    with response_cache(False):
+        client.generate("prompt", response_schema=SCHEMA)
+    assert backend.calls == 2
+    assert client.cache.enabled
+
+    client.generate("prompt", response_schema=SCHEMA)
+    assert backend.calls == 2
+
+
+class PeakBackend:
+    # Records how many calls run at once
+    name = "mock"
+    rate_limited = False
+    model = None
+
+    def __init__(self, latency=0.1):
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, generation_config=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.latency)
+        with self._lock:
+            self.active -= 1
+        return BackendResponse("{}")
+
+    async def generate_async(self, prompt, generation_config=None):
+        return await asyncio.to_thread(self.generate, prompt, generation_config)
+
+    def generate_stream(self, prompt, generation_config=None):
+        for piece in ("{", "}"):
+            yield BackendResponse(piece)
+
+
+def unlimited_client(backend, max_concurrency):
+    # The rate limiter would also cap in-flight calls; only the client limit is under test here
+    return GeminiClient(
+        "mock-model", api_key="test-key", backend=backend, max_concurrency=max_concurrency,
+        rate_limiter=RateLimiter(requests_per_minute=0, tokens_per_minute=0, max_in_flight=100),
+        cache=LLMResponseCache(enabled=False)
+    )
+
+
+def test_threads_and_coroutines_share_one_concurrency_limit():
+    backend = PeakBackend()
+    client = unlimited_client(backend, max_concurrency=2)
+
+    async def coroutines():
+        await asyncio.gather(*(client.generate_async(f"async {i}") for i in range(4)))
+
+    threads = [threading.Thread(target=client.generate, args=(f"thread {i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(coroutines())
+    for thread in threads:
+        thread.join()
+
+    assert backend.peak == 2
+
+
+def test_stream_does_not_hold_a_slot_between_chunks():
+    client = unlimited_client(PeakBackend(), max_concurrency=1)
+    stream = client.generate_stream("prompt")
+    assert next(stream) == "{"
+
+    # With the only slot held across the yield this call would wait forever
+    done = threading.Event()
+    threading.Thread(target=lambda: (client.generate("other"), done.set()), daemon=True).start()
+    assert done.wait(timeout=5)
+    assert "".join(stream) == "}"
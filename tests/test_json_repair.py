@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from json_repair import IncrementalJSONParser, loads, repair_stats, reset_repair_stats
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    reset_repair_stats()
+
+
+def only_path():
+    return [path for path, count in repair_stats().items() if count]
+
+
+@pytest.mark.parametrize("text, expected, path", [
+    ('{"a": 1}', {"a": 1}, "direct"),
+    ('```json\n{"a": 1}\n```', {"a": 1}, "code_fence"),
+    ('```\n[1, 2]\n```', [1, 2], "code_fence"),
+    ('Here is the result: {"a": 1} Hope this helps.', {"a": 1}, "extracted"),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}, "trailing_comma"),
+    ('```json\n{"a": 1,\n}\n```', {"a": 1}, "trailing_comma")
+])
+def test_loads_repairs(text, expected, path):
+    assert loads(text) == expected
+    assert only_path() == [path]
+
+
+def test_braces_and_commas_inside_strings_are_text():
+    text = 'Result: {"note": "use {braces}, [brackets] and \\"quotes\\",}", "n": 1,}'
+    assert loads(text) == {"note": 'use {braces}, [brackets] and "quotes",}', "n": 1}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": "cut mid-str', {"a": 1}),
+    # The last scalar may itself be cut short ("2" of "25"), so it is dropped
+    ('{"a": 1, "b": [1, 2', {"a": 1, "b": [1]}),
+    ('{"a": {"b": 1, "c": ', {"a": {"b": 1}}),
+    ('{"note": "a } inside", "b": tr', {"note": "a } inside"}),
+    ('[{"a": 1}, {"a": 2', [{"a": 1}, {}])
+])
+def test_truncated_responses_keep_their_complete_members(text, expected):
+    assert loads(text) == expected
+    assert only_path() == ["truncated"]
+
+
+@pytest.mark.parametrize("text", ["", "no json here", '{"a": }'])
+def test_unrepairable_responses_raise(text):
+    with pytest.raises(json.JSONDecodeError):
+        loads(text)
+    assert only_path() == ["failed"]
+
+
+DOCUMENT = {
+    "Patient_Name": "Janet {Jones}",
+    "Symptoms": [{"symptom": "Neck, pain", "severity": None}, {"symptom": "Back pain"}],
+    "Diagnosis": "Whiplash",
+    "Nested": {"a": {"b": 1}}
+}
+
+
+def feed_all(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 7, 1000])
+def test_incremental_parser_emits_each_member_once(size):
+    text = "```json\n" + json.dumps(DOCUMENT, indent=2) + "\n```"
+    parser = IncrementalJSONParser(max_depth=2)
+    events = feed_all(parser, text, size)
+
+    assert events == [
+        (("Patient_Name",), "Janet {Jones}"),
+        (("Symptoms", 0), {"symptom": "Neck, pain", "severity": None}),
+        (("Symptoms", 1), {"symptom": "Back pain"}),
+        (("Symptoms",), DOCUMENT["Symptoms"]),
+        (("Diagnosis",), "Whiplash"),
+        (("Nested", "a"), {"b": 1}),
+        (("Nested",), {"a": {"b": 1}})
+    ]
+    assert parser.done
+    assert parser.result() == DOCUMENT
+
+
+def test_incremental_parser_depth_limit():
+    parser = IncrementalJSONParser(max_depth=1)
+    events = parser.feed(json.dumps(DOCUMENT))
+    assert [path for path, _ in events] == [("Patient_Name",), ("Symptoms",), ("Diagnosis",), ("Nested",)]
+
+
+def test_incremental_parser_waits_for_the_closing_delimiter():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": "x", "b": "partial') == [(("a",), "x")]
+    assert parser.feed(' value"') == []
+    assert parser.feed("}") == [(("b",), "partial value")]
+
+
+def test_incremental_parser_result_repairs_a_truncated_stream():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": 1, "b": [1, 2, 3')
+    assert not parser.done
+    assert parser.result() == {"a": 1, "b": [1, 2]}
@@ -0,0 +1,38 @@
+import pytest
+
+from local_classifier import LocalSentimentIntentClassifier
+
+
+@pytest.fixture
+def classifier():
+    return LocalSentimentIntentClassifier(threshold=0.85)
+
+
+@pytest.mark.parametrize("text", [
+    "Yes, the pain is terrible.",
+    "Yes, really bad headaches.",
+    "No, it still hurts a lot."
+])
+def test_symptoms_after_an_affirmation_are_not_decided_locally(classifier, text):
+    assert classifier.classify(text)["intent"]["primary_intent"] == "reporting symptoms"
+    assert classifier.decide(text) is None
+
+
+def test_turn_without_lexicon_hits_is_not_confidently_neutral(classifier):
+    result = classifier.classify("Yes, I always do.")
+    assert result["sentiment"]["sentiment"] == "Neutral"
+    assert result["sentiment"]["confidence"] < classifier.threshold
+    assert classifier.decide("Yes, I always do.") is None
+
+
+@pytest.mark.parametrize("text, sentiment, intent", [
+    ("Thank you, doctor. I appreciate it.", "Reassured", "expressing gratitude"),
+    ("That's a relief!", "Reassured", "providing information"),
+    ("Okay.", "Neutral", "providing information")
+])
+def test_formulaic_turns_stay_local(classifier, text, sentiment, intent):
+    result = classifier.decide(text)
+    assert result is not None
+    assert result["sentiment"]["sentiment"] == sentiment
+    assert result["intent"]["primary_intent"] == intent
+    assert result["intent"]["tier"] == "local"
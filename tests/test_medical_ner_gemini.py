@@ -0,0 +1,62 @@
+import json
+
+from gemini_backends import MockBackend
+from gemini_client import GeminiClient
+from medical_ner_gemini import GeminiMedicalNER, chunk_transcript, merge_entities, split_long_turn
+
+LONG_TURN = "Patient: " + " ".join(f"Sentence number {i} about my neck." for i in range(40))
+
+
+def test_oversized_turns_split_at_sentence_ends():
+    pieces = split_long_turn(LONG_TURN, max_chars=200)
+
+    assert len(pieces) > 1
+    assert all(len(piece) <= 200 for piece in pieces)
+    assert pieces[0].startswith("Patient: Sentence number 0")
+    assert all(piece.startswith("Patient: Sentence number") for piece in pieces[1:])
+    assert all(piece.endswith("neck.") for piece in pieces)
+
+
+def test_a_sentence_longer_than_a_chunk_is_cut():
+    pieces = split_long_turn("Patient: " + "x" * 500, max_chars=200)
+    assert all(len(piece) <= 200 for piece in pieces)
+    assert "".join(piece.replace("Patient: ", "") for piece in pieces) == "x" * 500
+
+
+def test_chunks_stay_within_the_limit():
+    transcript = "Physician: How are you?\n" + LONG_TURN + "\nPhysician: Thanks."
+    chunks = chunk_transcript(transcript, max_chars=300, overlap_turns=0)
+
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    assert chunks[0].startswith("Physician: How are you?")
+    assert chunks[-1].endswith("Physician: Thanks.")
+
+
+def test_merge_reports_failed_chunks():
+    merged = merge_entities([{"Diagnosis": "Whiplash"}, None, {"Prognosis": "Good"}])
+
+    assert merged["Diagnosis"] == "Whiplash"
+    assert merged["metadata"] == {"chunks": 3, "failed_chunks": [1], "partial": True}
+    assert merge_entities([{"Diagnosis": "Whiplash"}])["metadata"]["partial"] is False
+    assert merge_entities([None, None]) is None
+
+
+def test_chunked_extraction_marks_the_result_partial():
+    def responder(prompt):
+        if "FAIL" in prompt:
+            return "not json"
+        return json.dumps({"Diagnosis": "Whiplash", "Symptoms": [{"symptom": "Neck pain"}]})
+
+    client = GeminiClient("mock-model", api_key="test-key", backend=MockBackend(responder=responder))
+    ner = GeminiMedicalNER(client=client, chunk_threshold_chars=100, chunk_chars=120, chunk_overlap_turns=0)
+    transcript = "\n".join([
+        "Physician: How is your neck today, any better than last week?",
+        "Patient: FAIL this turn cannot be parsed by the mock model at all.",
+        "Physician: Good, keep up the physiotherapy exercises at home."
+    ])
+
+    entities = ner.extract_entities(transcript)
+
+    assert entities["Diagnosis"] == "Whiplash"
+    assert entities["metadata"] == {"chunks": 3, "failed_chunks": [1], "partial": True}
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+from gemini_backends import MockBackend
+from gemini_client import GeminiClient
+from sentiment_intent_analyzer import CompleteSentimentIntentAnalyzer
+
+TRANSCRIPT = "\n".join(f"Patient: My knee hurt on day {n}." for n in range(8))
+
+
+def fused_analyzer(classifier_concurrency):
+    # The sentiment and intent clients allow one call; only the classifier's limit should apply
+    narrow = GeminiClient("mock-narrow", api_key="test-key", max_concurrency=1, backend=MockBackend())
+    analyzer = CompleteSentimentIntentAnalyzer(api_key="test-key", client=narrow, cascade=False,
+                                               execution_mode="concurrent")
+    analyzer.classifier.client = GeminiClient("mock-wide", api_key="test-key", max_concurrency=classifier_concurrency,
+                                              backend=MockBackend())
+    return analyzer
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def test_fused_concurrent_workers_follow_the_classifier_client():
+    analyzer = fused_analyzer(4)
+    in_flight = InFlight()
+
+    def classify(text):
+        with in_flight:
+            time.sleep(0.05)
+        return analyzer.classifier._empty_result(text)
+
+    analyzer.classifier.classify = classify
+    analyzer.analyze_complete(TRANSCRIPT)
+
+    assert in_flight.peak == 4
+
+
+def test_fused_concurrent_async_is_bounded_by_the_classifier_client():
+    analyzer = fused_analyzer(3)
+    in_flight = InFlight()
+
+    async def classify_async(text):
+        with in_flight:
+            await asyncio.sleep(0.05)
+        return analyzer.classifier._empty_result(text)
+
+    analyzer.classifier.classify_async = classify_async
+    asyncio.run(analyzer.analyze_complete_async(TRANSCRIPT))
+
+    assert in_flight.peak == 3
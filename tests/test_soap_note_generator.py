@@ -0,0 +1,44 @@
+import json
+
+from gemini_backends import MockBackend
+from gemini_client import GeminiClient
+from soap_note_generator import SOAPNoteGenerator
+
+ENTITIES = {
+    "Patient_Name": "Janet Jones",
+    "Symptoms": [{"symptom": "Neck pain"}, {"symptom": "Back pain"}],
+    "Diagnosis": "Whiplash injury",
+    "Treatment": [{"treatment_type": "physiotherapy", "details": "10 sessions"}],
+    "Physical_Examination": {"findings": ["Full range of motion"]},
+    "Prognosis": "Full recovery expected"
+}
+
+NARRATIVE = {
+    "Subjective": {"History_of_Present_Illness": "Car accident in September.", "Past_Medical_History": None,
+                   "Patient_Concerns": "Worried about the future."},
+    "Objective": {"Observations": "Comfortable.", "Vital_Signs": None},
+    "Assessment": {"Severity": "Mild, improving"},
+    "Plan": {"Follow-Up": "Return if symptoms worsen.", "Patient_Education": "Reassured."}
+}
+
+
+def test_entity_stream_yields_entity_fields_first_and_matches_the_blocking_note():
+    backend = MockBackend(responder=lambda prompt: json.dumps(NARRATIVE), stream_chunk_chars=16)
+    client = GeminiClient("mock-model", api_key="test-key", backend=backend)
+    generator = SOAPNoteGenerator("test-key", client=client)
+
+    snapshots = list(generator.generate_soap_note_from_entities_stream(ENTITIES, "Patient: My neck hurts."))
+
+    first = snapshots[0]
+    assert first["Assessment"]["Diagnosis"] == "Whiplash injury"
+    assert "Severity" not in first["Assessment"]
+    assert len(snapshots) > 2
+
+    final = snapshots[-1]
+    assert final["Subjective"]["History_of_Present_Illness"] == "Car accident in September."
+    assert final["Plan"]["Treatment"] == "Physiotherapy: 10 sessions"
+    assert final["metadata"]["usage"]["totals"]["calls"] == 1
+
+    blocking = generator.generate_soap_note_from_entities(ENTITIES, "Patient: My neck hurts.")
+    for section in ("Subjective", "Objective", "Assessment", "Plan"):
+        assert final[section] == blocking[section]
@@ -0,0 +1,124 @@
+import io
+
+import pytest
+
+from transcript_parser import is_patient, is_turn_start, parse_turns, speaker_role
+
+TRANSCRIPT = """Recorded at the clinic.
+**Physician:** Good morning, Ms. Jones.
+> **Patient**: Morning. Note: I wrote a few things down.
+Plan: ask about the pain. Update: it got better
+at 12:30 yesterday.
+[Physical Examination Conducted]
+Dr. Smith: Everything looks good.
+"""
+
+
+def test_labels_split_turns_and_other_prefixes_stay_in_the_turn():
+    turns = parse_turns(TRANSCRIPT)
+
+    assert [t["speaker"] for t in turns] == ["Physician", "Patient", "Dr. Smith"]
+    assert turns[1]["text"] == (
+        "Morning. Note: I wrote a few things down. Plan: ask about the pain. "
+        "Update: it got better at 12:30 yesterday."
+    )
+
+
+def test_offsets_point_at_the_text_in_the_source():
+    for turn in parse_turns(TRANSCRIPT):
+        first = turn["text"].split(" ")[0]
+        assert TRANSCRIPT[turn["start"]:].startswith(first)
+        assert TRANSCRIPT[:turn["end"]].endswith(turn["text"][-5:])
+
+
+def test_file_objects_parse_like_strings():
+    assert parse_turns(io.StringIO(TRANSCRIPT)) == parse_turns(TRANSCRIPT)
+
+
+def test_stage_directions_are_optional_turns():
+    turns = parse_turns(TRANSCRIPT, include_directions=True)
+    assert {"speaker": None, "text": "Physical Examination Conducted"}.items() <= turns[2].items()
+
+
+@pytest.mark.parametrize("line", [
+    "Patient: Hi",
+    "**Patient:** Hi",
+    "__Doctor__: Hi",
+    "> > Nurse 2: Hi",
+    "PHYSICIAN: Hi",
+    "Patient (Janet): Hi",
+    "Dr. Smith: Hi",
+    "Mrs Jane Doe: Hi",
+    "Speaker 2: Hi"
+])
+def test_speaker_labels(line):
+    assert is_turn_start(line)
+
+
+@pytest.mark.parametrize("line", [
+    "Note: take with food",
+    "Plan: physiotherapy",
+    "**Update:** better",
+    "At 12:30 it started",
+    "Patient statement: fine",
+    "Janet Jones: Hi"
+])
+def test_not_speaker_labels(line):
+    assert not is_turn_start(line)
+
+
+def test_declared_speakers():
+    turns = parse_turns("Janet Jones: My neck hurts.\nDr. Smith: Since when?\n", speakers=["Janet Jones"])
+    assert [t["speaker"] for t in turns] == ["Janet Jones", "Dr. Smith"]
+    assert is_turn_start("Janet Jones: Hi", speakers=["Janet Jones"])
+
+
+PATIENT_LABELS = """Physician: How are you feeling today?
+patient: My neck still hurts in the mornings.
+PATIENT: I worry it will not go away.
+Patient 2: My back is much better now.
+Patient (Jane Doe): Thank you, doctor.
+Dr. Smith: Let's take a look.
+"""
+
+
+def test_role_labels_are_canonical():
+    turns = parse_turns(PATIENT_LABELS)
+
+    assert [t["speaker"] for t in turns] == ["Physician", "Patient", "Patient", "Patient", "Patient", "Dr. Smith"]
+    assert [t["label"] for t in turns] == [
+        "Physician", "patient", "PATIENT", "Patient 2", "Patient (Jane Doe)", "Dr. Smith"
+    ]
+    assert sum(is_patient(t) for t in turns) == 4
+
+
+@pytest.mark.parametrize("label, role", [
+    ("patient", "Patient"),
+    ("FAMILY  MEMBER", "Family Member"),
+    ("Nurse 2 (Ana)", "Nurse"),
+    ("Dr. Smith", None),
+    ("Speaker 2", None),
+    ("Patient statement", None)
+])
+def test_speaker_role(label, role):
+    assert speaker_role(label) == role
+
+
+def test_every_patient_label_reaches_the_statement_analysis():
+    from gemini_backends import MockBackend
+    from gemini_client import GeminiClient
+    from sentiment_intent_analyzer import CompleteSentimentIntentAnalyzer
+
+    client = GeminiClient("mock-model", api_key="test-key", backend=MockBackend())
+    analyzer = CompleteSentimentIntentAnalyzer(api_key="test-key", client=client, cascade=False)
+    result = analyzer.analyze_complete(PATIENT_LABELS)
+
+    assert result["conversation_stats"]["patient_statements"] == 4
+    assert result["conversation_stats"]["physician_statements"] == 2
+    assert [a["statement"] for a in result["individual_analyses"]] == [
+        "My neck still hurts in the mornings.",
+        "I worry it will not go away.",
+        "My back is much better now.",
+        "Thank you, doctor."
+    ]
+    assert all(a["sentiment"] != "Unknown" for a in result["individual_analyses"])
@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+_otel_tracer = None
+if otel_trace is not None and os.getenv("MEDISCRIBE_OTEL", "").lower() in ("1", "true", "yes"):
+    _otel_tracer = otel_trace.get_tracer("mediscribe")
+
+_current_trace = contextvars.ContextVar("mediscribe_trace", default=None)
+_current_span = contextvars.ContextVar("mediscribe_span", default=None)
+
+_recent_traces = deque(maxlen=50)
+_recent_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+
+        end = self.end if self.end is not None else time.perf_counter()
+        stages = {}
+        for s in spans:
+            stage = stages.setdefault(s.name, {"count": 0, "total_seconds": 0.0})
+            stage["count"] += 1
+            stage["total_seconds"] += s.duration
+
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "total_seconds": round(end - self.start, 4),
+            "stages": {
+                name: {"count": v["count"], "total_seconds": round(v["total_seconds"], 4)}
+                for name, v in stages.items()
+            },
+            "spans": [
+                {
+                    "name": s.name,
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "start_offset_seconds": round(s.start - self.start, 4),
+                    "duration_seconds": round(s.duration, 4),
+                    "attributes": s.attributes
+                }
+                for s in spans
+            ]
+        }
+
+    def format(self):
+        summary = self.summary()
+        lines = [f"Trace {summary['name']} ({summary['total_seconds']:.3f}s)"]
+        for name, stage in sorted(summary["stages"].items(), key=lambda x: -x[1]["total_seconds"]):
+            lines.append(f"  {name:<44} x{stage['count']:<4} {stage['total_seconds']:.3f}s")
+        return "\n".join(lines)
+
+
+def _otel_attributes(attributes):
+    return {
+        k: v for k, v in attributes.items()
+        if isinstance(v, (str, bool, int, float))
+    }
+
+
+@contextmanager
+def trace(name):
+    root = Trace(name)
+    trace_token = _current_trace.set(root)
+    span_token = _current_span.set(None)
+
+    try:
+        with span(name):
+            yield root
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        with _recent_lock:
+            _recent_traces.append(root)
+
+
+@contextmanager
+def span(name, **attributes):
+    # Spans outside a trace start a trace of their own
+    if _current_trace.get() is None:
+        with trace(name) as root:
+            root.spans[0].set(**attributes)
+            yield root.spans[0]
+        return
+
+    current = Span(name, parent=_current_span.get(), attributes=attributes)
+    span_token = _current_span.set(current)
+
+    otel_span = None
+    if _otel_tracer is not None:
+        otel_span = _otel_tracer.start_as_current_span(name, attributes=_otel_attributes(attributes))
+        otel_span.__enter__()
+
+    _current_trace.get().add(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(span_token)
+
+        if otel_span is not None:
+            active = otel_trace.get_current_span()
+            for key, value in _otel_attributes(current.attributes).items():
+                active.set_attribute(key, value)
+            otel_span.__exit__(None, None, None)
+
+
+def start_span(name, **attributes):
+    # A span that is recorded but never made current, for work that is resumed
+    # piecemeal (generators) where the caller's code runs in between.
+    # Call finish() on it when the work ends.
+    current = Span(name, parent=_current_span.get(), attributes=attributes)
+    root = _current_trace.get()
+    if root is not None:
+        root.add(current)
+    return current
+
+
+def traced(name):
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def recent_traces():
+    with _recent_lock:
+        return list(_recent_traces)
+
+
+def dump_trace(traces, path):
+    if isinstance(traces, Trace):
+        data = traces.summary()
+    else:
+        data = [t.summary() for t in traces]
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
@@ -0,0 +1,134 @@
+import io
+import re
+from functools import lru_cache
+
+# Only real speaker labels start a turn, so "Note:" or "Plan:" inside a turn
+# stays part of it: a role ("Patient", "Nurse 2", "Doctor (Smith)"), a title
+# and name ("Dr. Smith"), "Speaker 2", or a label the caller declares.
+SPEAKER_ROLES = (
+    "Physician", "Doctor", "Patient", "Nurse", "Clinician", "Provider", "Therapist",
+    "Physiotherapist", "Pharmacist", "Interpreter", "Caregiver", "Parent", "Guardian",
+    "Family Member", "Relative", "Assistant", "Medical Assistant", "Resident", "Attending"
+)
+SPEAKER_TITLES = ("Dr", "Doctor", "Mr", "Mrs", "Ms", "Miss", "Prof")
+
+PATIENT_ROLE = "Patient"
+
+_ROLE_NAMES = "|".join(
+    re.escape(role).replace(r"\ ", r"[ \t]+") for role in sorted(SPEAKER_ROLES, key=len, reverse=True)
+)
+_ROLE = r"(?i:%s)(?:[ \t]+\d+)?(?:[ \t]*\([^()\n]*\))?" % _ROLE_NAMES
+_ROLE_LABEL = re.compile(r"(%s)(?:[ \t]+\d+)?(?:[ \t]*\([^()\n]*\))?" % _ROLE_NAMES, re.IGNORECASE)
+_CANONICAL_ROLES = {role.lower(): role for role in SPEAKER_ROLES}
+_TITLED = r"(?:%s)\.?[ \t]+[A-Z][\w'-]*(?:[ \t]+[A-Z][\w'-]*)?" % "|".join(SPEAKER_TITLES)
+_NUMBERED = r"Speaker[ \t]*(?:\d+|[A-Z]\b)"
+
+
+@lru_cache(maxsize=32)
+def line_pattern(speakers=()):
+    # One pattern classifies every line: a bracketed stage direction, the start
+    # of a speaker turn (plain "Patient:", bold "**Patient:**" / "**Patient**:",
+    # with or without "> " blockquote markers), or a continuation of the
+    # current turn. A colon followed by a digit is a clock time ("At 12:30"),
+    # not a label.
+    labels = [_ROLE, _TITLED, _NUMBERED] + [re.escape(label) for label in sorted(speakers, key=len, reverse=True)]
+    return re.compile(r"""
+        ^[ \t]*(?:>[ \t]*)*
+        (?:
+            (?P<direction>\[[^\]]*\])[ \t]*$
+          | (?P<bold>\*\*|__)?
+            (?P<speaker>%s)[ \t]*
+            (?(bold)(?::[ \t]*(?P=bold)|(?P=bold)[ \t]*:)|:(?!\d))
+            [ \t]*(?P<text>.*)
+          | (?P<continuation>.*)
+        )
+    """ % "|".join(f"(?:{label})" for label in labels), re.VERBOSE)
+
+
+LINE_PATTERN = line_pattern()
+
+_EMPHASIS = "*_ \t"
+
+
+def speaker_role(label):
+    # "patient", "PATIENT 2" and "Patient (Jane Doe)" are all the "Patient"
+    # role; labels that are not a role (names, "Speaker 2") have none
+    match = _ROLE_LABEL.fullmatch((label or "").strip())
+    if match is None:
+        return None
+    return _CANONICAL_ROLES[" ".join(match.group(1).lower().split())]
+
+
+def is_patient(turn):
+    return speaker_role(turn.get("speaker")) == PATIENT_ROLE
+
+
+def is_turn_start(line, speakers=()):
+    return line_pattern(tuple(speakers)).match(line.rstrip("\r\n")).group("speaker") is not None
+
+
+def _content_span(match, group, line_start):
+    # Offsets of the text once emphasis markers and padding are trimmed
+    value = match.group(group)
+    stripped = value.strip(_EMPHASIS)
+    if not stripped:
+        return None, 0, 0
+    start = line_start + match.start(group) + value.index(stripped)
+    return stripped, start, start + len(stripped)
+
+
+def iter_turns(source, include_directions=False, speakers=()):
+    # Yields {"speaker", "label", "text", "start", "end"} per turn. speaker is
+    # the canonical role ("Patient" for "patient 2:" or "Patient (Jane Doe):")
+    # or, for other labels, the label itself; label is the label as written.
+    # start/end are the character offsets of the turn's text in the source.
+    # Accepts a string or any iterable of lines (e.g. an open file), read one
+    # line at a time. speakers declares extra labels, such as names, that
+    # start a turn.
+    pattern = line_pattern(tuple(speakers))
+    lines = io.StringIO(source) if isinstance(source, str) else source
+    speaker = label = None
+    parts = []
+    start = end = 0
+    offset = 0
+
+    for line in lines:
+        line_start = offset
+        offset += len(line)
+        match = pattern.match(line.rstrip("\r\n"))
+
+        if match.group("speaker") is not None:
+            if parts:
+                yield {"speaker": speaker, "label": label, "text": " ".join(parts), "start": start, "end": end}
+            label = match.group("speaker").strip()
+            speaker = speaker_role(label) or label
+            parts = []
+            group = "text"
+        elif match.group("direction") is not None:
+            if include_directions:
+                if parts:
+                    yield {"speaker": speaker, "label": label, "text": " ".join(parts), "start": start, "end": end}
+                    parts = []
+                text, d_start, d_end = _content_span(match, "direction", line_start)
+                yield {"speaker": None, "label": None, "text": text[1:-1].strip(_EMPHASIS), "start": d_start, "end": d_end}
+            continue
+        elif speaker is not None:
+            group = "continuation"
+        else:
+            # Text before the first speaker label
+            continue
+
+        text, text_start, text_end = _content_span(match, group, line_start)
+        if text is None:
+            continue
+        if not parts:
+            start = text_start
+        parts.append(text)
+        end = text_end
+
+    if parts:
+        yield {"speaker": speaker, "label": label, "text": " ".join(parts), "start": start, "end": end}
+
+
+def parse_turns(source, include_directions=False, speakers=()):
+    return list(iter_turns(source, include_directions=include_directions, speakers=speakers))
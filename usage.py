@@ -0,0 +1,147 @@
+import contextvars
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+
+# USD per million tokens (input, output)
+MODEL_PRICING = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+
+_current_tracker = contextvars.ContextVar("mediscribe_usage", default=None)
+
+
+def estimate_cost(model_name, input_tokens, output_tokens):
+    pricing = MODEL_PRICING.get(model_name)
+    if pricing is None:
+        return 0.0
+    return (input_tokens * pricing[0] + output_tokens * pricing[1]) / 1_000_000
+
+
+class UsageTracker:
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, model_name, operation, input_tokens, output_tokens, cached=False):
+        with self._lock:
+            entry = self._operations.setdefault((model_name, operation), {
+                "calls": 0,
+                "cached_calls": 0,
+                "input_tokens": 0,
+                "output_tokens": 0
+            })
+            entry["calls"] += 1
+            if cached:
+                entry["cached_calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+
+        if self.parent is not None:
+            self.parent.record(model_name, operation, input_tokens, output_tokens, cached=cached)
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+
+    def summary(self):
+        with self._lock:
+            operations = {key: dict(value) for key, value in self._operations.items()}
+
+        by_operation = {}
+        totals = {"calls": 0, "cached_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+        for (model_name, operation), entry in sorted(operations.items(), key=lambda x: x[0][1]):
+            cost = estimate_cost(model_name, entry["input_tokens"], entry["output_tokens"])
+            row = by_operation.setdefault(operation, {
+                "calls": 0, "cached_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0
+            })
+            for key in ("calls", "cached_calls", "input_tokens", "output_tokens"):
+                row[key] += entry[key]
+                totals[key] += entry[key]
+            row["cost_usd"] += cost
+            totals["cost_usd"] += cost
+
+        for row in by_operation.values():
+            row["cost_usd"] = round(row["cost_usd"], 6)
+        totals["cost_usd"] = round(totals["cost_usd"], 6)
+        totals["total_tokens"] = totals["input_tokens"] + totals["output_tokens"]
+
+        return {"totals": totals, "by_operation": by_operation}
+
+
+_process_tracker = UsageTracker()
+
+
+def new_tracker():
+    # Nested trackers roll their calls up into the enclosing one
+    return UsageTracker(parent=_current_tracker.get() or _process_tracker)
+
+
+@contextmanager
+def use_tracker(tracker):
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+@contextmanager
+def track_usage():
+    with use_tracker(new_tracker()) as tracker:
+        yield tracker
+
+
+def tracked_iter(iterable, tracker):
+    # A generator cannot hold the tracker across yields (the caller's code runs
+    # in between), so it is only made current while the next item is produced
+    iterator = iter(iterable)
+    while True:
+        with use_tracker(tracker):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def attach_usage(result, tracker):
+    if isinstance(result, dict):
+        result.setdefault("metadata", {})["usage"] = tracker.summary()
+    return result
+
+
+def reports_usage(fn):
+    # Adds the tokens spent by the call to the returned dict under "metadata"
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with track_usage() as tracker:
+                result = await fn(*args, **kwargs)
+            return attach_usage(result, tracker)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with track_usage() as tracker:
+            result = fn(*args, **kwargs)
+        return attach_usage(result, tracker)
+    return wrapper
+
+
+def record_usage(model_name, operation, usage_metadata=None, cached=False):
+    input_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage_metadata, "candidates_token_count", 0) or 0
+
+    tracker = _current_tracker.get() or _process_tracker
+    tracker.record(model_name, operation or "unlabelled", input_tokens, output_tokens, cached=cached)
+    return input_tokens, output_tokens
+
+
+def process_usage():
+    return _process_tracker.summary()
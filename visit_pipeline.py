@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from medical_summarizer_gemini import GeminiMedicalSummarizer
+from rate_limiter import RateLimitExceeded
+from sentiment_intent_analyzer import CompleteSentimentIntentAnalyzer
+from soap_note_generator import SOAPNoteGenerator
+from tracing import dump_trace, span, trace, traced
+from transcript_parser import parse_turns
+from usage import attach_usage, track_usage
+
+# Each stage lists the stages it needs; a stage starts as soon as those are
+# done, so NER and sentiment/intent run side by side and the visit takes as
+# long as its slowest chain (parse -> NER -> SOAP), not the sum of all stages
+VISIT_STAGES = {
+    "parse": (),
+    "ner": ("parse",),
+    "sentiment_intent": ("parse",),
+    "soap": ("parse", "ner")
+}
+
+
+class VisitPipeline:
+    def __init__(self, api_key=None, client=None, stages=None, **analyzer_options):
+        stages = stages or VISIT_STAGES
+        # Listing dependencies first rules out cycles
+        seen = set()
+        for name, dependencies in stages.items():
+            if not set(dependencies) <= seen:
+                raise ValueError(f"Stage '{name}' must come after {sorted(set(dependencies) - seen)}")
+            seen.add(name)
+
+        if api_key is None:
+            api_key = os.getenv('GEMINI_API_KEY')
+
+        # Every module draws on the same registry of clients, so a prompt one
+        # stage (or an earlier visit) already sent is served from the cache
+        self.summarizer = GeminiMedicalSummarizer(api_key, client=client)
+        self.analyzer = CompleteSentimentIntentAnalyzer(api_key=api_key, client=client, **analyzer_options)
+        self.soap_generator = SOAPNoteGenerator(api_key=api_key, client=client)
+        self.stages = stages
+
+    async def _parse(self, transcript, results):
+        turns = parse_turns(transcript)
+        return {"turns": turns}
+
+    async def _ner(self, transcript, results):
+        entities = await self.summarizer.extractor.extract_entities_async(transcript)
+        return {
+            "entities": entities,
+            "summary": self.summarizer.create_assignment_format(transcript, entities=entities)
+        }
+
+    async def _sentiment_intent(self, transcript, results):
+        turns = (results.get("parse") or {}).get("turns")
+        return await self.analyzer.create_assignment_format_async(transcript, conversation=turns)
+
+    async def _soap(self, transcript, results):
+        # Without entities the generator falls back to the full transcript prompt
+        entities = (results.get("ner") or {}).get("entities")
+        turns = (results.get("parse") or {}).get("turns")
+        return await self.soap_generator.generate_soap_note_from_entities_async(entities, transcript, turns)
+
+    async def _run_stage(self, name, transcript, tasks, results, timings, started):
+        # A failed dependency leaves its result as None; every stage can work
+        # from the raw transcript instead
+        for dependency in self.stages[name]:
+            await tasks[dependency]
+
+        offset = time.perf_counter() - started
+        with span(f"visit.{name}") as stage_span, track_usage() as tracker:
+            try:
+                output = await getattr(self, f"_{name}")(transcript, results)
+            except RateLimitExceeded as e:
+                output = e
+            except Exception as e:
+                print(f"Error in visit stage '{name}': {str(e)}")
+                stage_span.set(error=f"{type(e).__name__}: {e}")
+                output = e
+
+        timings[name] = {
+            "start_offset_seconds": round(offset, 4),
+            "duration_seconds": round(stage_span.duration, 4),
+            "calls": tracker.summary()["totals"]["calls"]
+        }
+        if isinstance(output, Exception):
+            timings[name]["error"] = f"{type(output).__name__}: {output}"
+        results[name] = output if not isinstance(output, Exception) else None
+        return output
+
+    @traced("visit.process")
+    async def process_async(self, transcript):
+        started = time.perf_counter()
+        results = {}
+        timings = {}
+
+        with track_usage() as tracker:
+            tasks = {}
+            for name in self.stages:
+                tasks[name] = asyncio.ensure_future(
+                    self._run_stage(name, transcript, tasks, results, timings, started)
+                )
+            outcomes = await asyncio.gather(*tasks.values())
+
+        # The pipeline degrades around ordinary failures, but a rate limit is
+        # the caller's to handle, as it is for each module on its own
+        for outcome in outcomes:
+            if isinstance(outcome, RateLimitExceeded):
+                raise outcome
+
+        wall = time.perf_counter() - started
+        turns = (results.get("parse") or {}).get("turns") or []
+        visit = {
+            "Medical_Summary": (results.get("ner") or {}).get("summary"),
+            "Sentiment_Intent": results.get("sentiment_intent"),
+            "SOAP_Note": results.get("soap"),
+            "metadata": {
+                "turns": len(turns),
+                "stages": {name: timings[name] for name in self.stages},
+                "wall_seconds": round(wall, 4),
+                "serial_seconds": round(sum(t["duration_seconds"] for t in timings.values()), 4),
+                "errors": {name: t["error"] for name, t in timings.items() if "error" in t}
+            }
+        }
+        return attach_usage(visit, tracker)
+
+    def process(self, transcript):
+        return asyncio.run(self.process_async(transcript))
+
+
+_default_pipelines = {}
+
+
+def get_pipeline(api_key=None):
+    # One pipeline per key, so repeated visits reuse the loaded modules
+    if api_key not in _default_pipelines:
+        _default_pipelines[api_key] = VisitPipeline(api_key=api_key)
+    return _default_pipelines[api_key]
+
+
+def process_visit(transcript, api_key=None):
+    return get_pipeline(api_key).process(transcript)
+
+
+async def process_visit_async(transcript, api_key=None):
+    return await get_pipeline(api_key).process_async(transcript)
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            transcript = f.read()
+    else:
+        from main_gemini_ner import TRANSCRIPT
+        transcript = TRANSCRIPT
+
+    if not os.path.exists("outputs"):
+        os.makedirs("outputs")
+
+    with trace("visit_cli") as run_trace:
+        visit = process_visit(transcript)
+
+    metadata = visit["metadata"]
+    print("=" * 60)
+    print("VISIT PIPELINE")
+    print("=" * 60)
+    for name, stage in metadata["stages"].items():
+        status = stage.get("error", "ok")
+        print(f"  {name:<18} +{stage['start_offset_seconds']:.3f}s  {stage['duration_seconds']:.3f}s  {status}")
+    print(f"\nWall time: {metadata['wall_seconds']:.3f}s (stages sum to {metadata['serial_seconds']:.3f}s)")
+    print(f"Tokens: {metadata['usage']['totals']['total_tokens']:,}")
+
+    with open("outputs/visit_result.json", "w") as f:
+        json.dump(visit, f, indent=2, ensure_ascii=False)
+    print("Saved: outputs/visit_result.json")
+
+    dump_trace(run_trace, "outputs/visit_trace.json")
+    print("Saved: outputs/visit_trace.json")
+
+
+if __name__ == "__main__":
+    main()